@@ -39,9 +39,7 @@ print(f"\nUsing catalog + schema: {catalog_name}.{schema_name}")
 
 # DBTITLE 1,Import Libraries
 from langchain_community.chat_models import ChatDatabricks
-from langchain_community.vectorstores import DatabricksVectorSearch
 from langchain_community.embeddings import DatabricksEmbeddings
-from databricks.vector_search.client import VectorSearchClient
 from langchain_core.prompts import PromptTemplate
 from langchain_core.output_parsers import StrOutputParser
 from langchain_core.runnables import RunnablePassthrough
@@ -89,27 +87,33 @@ vector_search_schema = {
 }
 
 #Note for the lab this has already been set up
-token = dbutils.secrets.get(scope = "vs_endpoint", key = "databricks_token")
+#The token only goes through the environment: get_retriever is pickled into the logged model (loader_fn), so it must not reference the secret
+os.environ["DATABRICKS_TOKEN"] = dbutils.secrets.get(scope = "vs_endpoint", key = "databricks_token")
+
+#The retriever module is shared with the other demos, in shared/ at the root of the repo
+import sys
+sys.path.append(os.path.abspath("../shared"))
+from pooled_retriever import get_vector_search
+
+workspace_url = "https://" + spark.conf.get("spark.databricks.workspaceUrl")
 
 def get_retriever(persist_dir: str = None):
-    #Get the vector search index
-    vsc = VectorSearchClient(personal_access_token=token, disable_notice=True)
-    vs_index = vsc.get_index(
-        endpoint_name="vs_genai_lab",
-        index_name="main.default.gold_pdf_landing_chunked_index"
+    #The index handle and its HTTP connections are set up once, then reused by every question (see shared/pooled_retriever.py)
+    vectorstore = get_vector_search(
+        "vs_genai_lab",
+        "main.default.gold_pdf_landing_chunked_index",
+        host=workspace_url,
+        token=os.environ["DATABRICKS_TOKEN"],
+        text_column="chunked_text",
+        columns=(
+            vector_search_schema.get("primary_key"),
+            vector_search_schema.get("chunk_text"),
+            vector_search_schema.get("document_source")
+        )
     )
+    return vectorstore.as_retriever(k=3) #This defines how many of the most relevant chunks to retrieve
 
-    # Create the retriever
-    vectorstore = DatabricksVectorSearch(
-        vs_index, 
-        text_column="chunked_text", 
-        columns=[
-        vector_search_schema.get("primary_key"),
-        vector_search_schema.get("chunk_text"),
-        vector_search_schema.get("document_source")
-    ]
-    )
-    return vectorstore.as_retriever(search_kwargs={'k':3}) #This defines how many of the most relevant chunks to retrieve
+retriever = get_retriever()
 
 
 # COMMAND ----------
@@ -117,10 +121,14 @@ def get_retriever(persist_dir: str = None):
 # DBTITLE 1,Test Vector Search Retrieval
 #Lets test the retrieval from our vector search endpoint by asking it about specific data within our research papers
 
-vectorstore = get_retriever()
-similar_documents = vectorstore.get_relevant_documents("What is ARES?")
+similar_documents = retriever.invoke("What is ARES?")
 print(f"Relevant documents: {similar_documents}")
 
+#Several questions at once share the pooled connections (retriever.abatch / ainvoke for async code)
+for docs in retriever.batch(["What is ARES?", "How does ARES evaluate RAG systems?"]):
+    print([d.metadata.get("doc_uri") for d in docs])
+print(retriever.store.stats())
+
 # COMMAND ----------
 
 # DBTITLE 1,Test our model for knowledge
@@ -179,7 +187,7 @@ rag_chain = (
             "context": query_rewrite_prompt     #assemble rewriter prompt to add user's question
             | model                             #define the model to be used
             | StrOutputParser()                 #parses the string output generated by the model
-            | get_retriever        #performs similarity search and returns context
+            | retriever            #performs similarity search and returns context (one long-lived retriever, not one per question)
             | RunnableLambda(format_context),   #formats the returned results
             "question": itemgetter("messages"), #adds the original user's question
         }
@@ -227,7 +235,8 @@ with mlflow.start_run(experiment_id=experiment_id):
     mlflow.langchain.log_model(
         rag_chain,
         model_name,
-        loader_fn = get_retriever(),
+        loader_fn = get_retriever,
+        code_paths = ["../shared/pooled_retriever.py"],
         input_example=input_sample,
         pip_requirements=[
             "mlflow==" + mlflow.__version__,
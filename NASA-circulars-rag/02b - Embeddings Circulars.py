@@ -0,0 +1,88 @@
+# Databricks notebook source
+# MAGIC %pip install --quiet --upgrade databricks-vectorsearch mlflow
+# MAGIC dbutils.library.restartPython()
+
+# COMMAND ----------
+
+# MAGIC %md
+# MAGIC # Self-managed embeddings for the circular chunks
+# MAGIC With a managed-embedding index, every chunk that shows up in the change data feed is embedded again. Here, chunks are embedded once per model and stored by `chunk_id` (the md5 of the chunk text), see [chunk_embeddings.py]($./chunk_embeddings.py):
+# MAGIC - only chunk_ids that are not in the embedding store are sent to the endpoint, in batches of 150 texts with a few concurrent requests per partition;
+# MAGIC - the index source table (chunks + vectors) is MERGEd, so the index only syncs changed rows and never calls the embedding model itself.
+# MAGIC
+# MAGIC Re-chunking with other parameters only pays for the chunk texts that were never embedded. Run it after [02- Data Preparation Circulars]($./02- Data Preparation Circulars).
+
+# COMMAND ----------
+
+catalog_name = "demo_frank"
+schema_name = "circulars"
+
+chunks_table = f"{catalog_name}.{schema_name}.circulars_chunked"
+embedding_store_table = f"{catalog_name}.{schema_name}.chunk_embeddings"
+index_source_table = f"{catalog_name}.{schema_name}.circulars_chunked_embeddings"
+
+vector_db_endpoint_name = "nasa_circulars"
+index_name = f"{catalog_name}.{schema_name}.circular_embeddings_index"
+
+embedding_endpoint = "databricks-bge-large-en"
+embedding_dimension = 1024
+# Run BAAI/bge-large-en-v1.5 on the cluster instead of calling the endpoint (needs sentence-transformers)
+use_local_model = False
+
+# COMMAND ----------
+
+import time
+from chunk_embeddings import endpoint_embedder, local_embedder, update_embedding_store, update_index_table
+
+if use_local_model:
+    embed = local_embedder("BAAI/bge-large-en-v1.5")
+    model = "BAAI/bge-large-en-v1.5"
+else:
+    # The workers call the endpoint with their own credentials: the notebook token is not shipped to them
+    embed = endpoint_embedder(embedding_endpoint, batch_size=150, concurrency=4)
+    model = embedding_endpoint
+
+start = time.perf_counter()
+embedded = update_embedding_store(spark, spark.table(chunks_table), embedding_store_table, embed, model=model)
+elapsed = time.perf_counter() - start
+
+total = spark.table(chunks_table).select("chunk_id").distinct().count()
+print(f"{embedded} chunks embedded in {elapsed:.1f} s, {total - embedded} of {total} already in the store")
+
+# COMMAND ----------
+
+# Rewritten (not MERGEd) when the chunks gained columns, e.g. the metadata filter columns
+rewritten = update_index_table(spark, chunks_table, embedding_store_table, index_source_table, model=model)
+display(spark.sql(f"DESCRIBE HISTORY {index_source_table} LIMIT 1").select("version", "operation", "operationMetrics"))
+
+# COMMAND ----------
+
+# MAGIC %md
+# MAGIC ## Index with self-managed embeddings
+# MAGIC Created once; afterwards a sync only reads the changed rows of the source table. Queries must be embedded with the same model: the RAG chain notebook does it with `CachedEmbeddings`.
+# MAGIC
+# MAGIC `circular_day`, `events` and `instruments` are synced as filter columns (see [circular_metadata.py]($./circular_metadata.py)). When the source table was rewritten with new columns, the index is recreated to pick them up; the vectors come from the source table, nothing is re-embedded.
+
+# COMMAND ----------
+
+from databricks.vector_search.client import VectorSearchClient
+
+vsc = VectorSearchClient(disable_notice=True)
+
+existing = [i["name"] for i in vsc.list_indexes(vector_db_endpoint_name).get("vector_indexes", [])]
+if index_name in existing and rewritten:
+    vsc.delete_index(endpoint_name=vector_db_endpoint_name, index_name=index_name)
+    existing.remove(index_name)
+
+if index_name not in existing:
+    vsc.create_delta_sync_index(
+        endpoint_name=vector_db_endpoint_name,
+        index_name=index_name,
+        source_table_name=index_source_table,
+        pipeline_type="TRIGGERED",
+        primary_key="chunk_id",
+        embedding_dimension=embedding_dimension,
+        embedding_vector_column="embedding",
+    )
+else:
+    vsc.get_index(vector_db_endpoint_name, index_name).sync()
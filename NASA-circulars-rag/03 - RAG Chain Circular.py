@@ -10,8 +10,6 @@ schema_name = "circulars"
 # COMMAND ----------
 
 from langchain_community.chat_models import ChatDatabricks
-from langchain_community.vectorstores import DatabricksVectorSearch
-from databricks.vector_search.client import VectorSearchClient
 from langchain_core.prompts import PromptTemplate
 from langchain_core.output_parsers import StrOutputParser
 #from langchain_core.runnables import RunnablePassthrough
@@ -36,9 +34,12 @@ example_question = "explain the most interesting GRBs related to supernova or bl
 
 # COMMAND ----------
 
-from databricks.vector_search.client import VectorSearchClient
-from langchain_community.vectorstores import DatabricksVectorSearch
 from langchain_community.embeddings import DatabricksEmbeddings
+import sys
+
+# Modules shared by the demos live in shared/ at the root of the repo
+sys.path.append(os.path.abspath("../shared"))
+from embedding_cache import CachedEmbeddings
 
 # Test embedding Langchain model
 # NOTE: your question embedding model must match the one used in the chunk in the previous notebook 
@@ -49,41 +50,87 @@ from langchain_community.embeddings import DatabricksEmbeddings
 # to a 1024-dimension embedding vector and an embedding window of 512 tokens. 
 
 
-index_name= "circular_index"
+# Index with self-managed embeddings built by 02b - Embeddings Circulars: the questions are embedded
+# here with the same model, the chunks are never re-embedded by the index
+use_self_managed_index = True
+index_name = "circular_embeddings_index" if use_self_managed_index else "circular_index"
 vector_index = f"{catalog_name}.{schema_name}.{index_name}"
 
 vector_db_endpoint_name = "nasa_circulars"
 k = 8
+# Date ranges and event designations in the question become index filters (see circular_metadata.py)
+use_metadata_filters = True
 
-embedding_model = DatabricksEmbeddings(endpoint="databricks-bge-large-en")
+# Identical questions are only embedded once, see shared/embedding_cache.py
+embedding_model = CachedEmbeddings(DatabricksEmbeddings(endpoint="databricks-bge-large-en"))
 host = "https://" + spark.conf.get("spark.databricks.workspaceUrl")
 
 print(f"Test embeddings: {embedding_model.embed_query(example_question)[:20]}...")
 
 
-def get_retriever(persist_dir: str = None):
-    os.environ["DATABRICKS_HOST"] = host
-    #Get the vector search index
-    vsc = VectorSearchClient(workspace_url=host, disable_notice=True)
+from pooled_retriever import get_vector_search
+from circular_metadata import question_filters
+
+# The retriever reads the token from the environment only: get_retriever is pickled into the logged model
+# (loader_fn), so it must not reference a token variable of the notebook. Serving sets DATABRICKS_TOKEN from a secret
+os.environ["DATABRICKS_TOKEN"] = dbutils.notebook.entry_point.getDbutils().notebook().getContext().apiToken().get()
 
-    #get vs index
-    vs_index = vsc.get_index(
-        endpoint_name= vector_db_endpoint_name,
-        index_name=vector_index
-    )
 
-    # Create the retriever
-    vectorstore = DatabricksVectorSearch(
-        vs_index, text_column="chunked_text"
+def get_retriever(persist_dir: str = None):
+    # One index handle and one pool of HTTP connections per process (see shared/pooled_retriever.py):
+    # every call returns a retriever on the same store, so a question only costs the query itself
+    os.environ["DATABRICKS_HOST"] = host
+    vectorstore = get_vector_search(
+        vector_db_endpoint_name, vector_index,
+        host=host, token=os.environ["DATABRICKS_TOKEN"],
+        text_column="chunked_text", columns=("id", "circular_day", "events"),
+        embedding=embedding_model if use_self_managed_index else None
     )
-    return vectorstore.as_retriever(search_kwargs={'k': k})
+    return vectorstore.as_retriever(k=k, filter_fn=question_filters if use_metadata_filters else None)
 
 
 # test our retriever
-vectorstore = get_retriever()
-similar_documents = vectorstore.get_relevant_documents(example_question)
+retriever = get_retriever()
+similar_documents = retriever.invoke(example_question)
 print(f"\n relevant documents: {similar_documents}")
 
+# several questions: embedded and searched concurrently (ainvoke / abatch for async code)
+questions = [example_question, "tell me about the afterglow of 221009A", "which GRBs had a redshift above 6?"]
+for question_docs in retriever.batch(questions):
+    print([d.metadata.get("id") for d in question_docs])
+print(f"\n retriever: {retriever.store.stats()}")
+
+# asking the same question again is a cache hit
+embedding_model.embed_query(example_question)
+print(f"\n embedding cache: {embedding_model.stats()}")
+
+# COMMAND ----------
+
+# DBTITLE 1,Metadata pre-filtering vs. similarity only
+import time
+import pandas as pd
+
+# Same questions, with and without the filters read from the question: the filtered search only ranks
+# the chunks of the right period / event, the other one has to find them among all the circulars
+unfiltered = get_vector_search(vector_db_endpoint_name, vector_index, host=host, token=os.environ["DATABRICKS_TOKEN"],
+                               text_column="chunked_text", columns=("id", "circular_day", "events"),
+                               embedding=embedding_model if use_self_managed_index else None).as_retriever(k=k)
+filtered = unfiltered.store.as_retriever(k=k, filter_fn=question_filters)
+
+rows = []
+for question in [example_question, "tell me about the afterglow of 221009A", "what did Swift observe in March 2024?",
+                 "GRB 230307A kilonova", "which GRBs had a redshift above 6 since 2020?"]:
+    for name, r in [("similarity only", unfiltered), ("metadata filters", filtered)]:
+        start = time.perf_counter()
+        docs = r.invoke(question)
+        elapsed = time.perf_counter() - start
+        rows.append({
+            "question": question, "retriever": name, "filters": str(r.filters_for(question)), "query_ms": 1000 * elapsed,
+            "circular_days": [d.metadata.get("circular_day") for d in docs],
+            "events": [d.metadata.get("events") for d in docs],
+        })
+display(pd.DataFrame(rows))
+
 # COMMAND ----------
 
 # DBTITLE 1,question without context and without template
@@ -101,7 +148,7 @@ from langchain.chains import RetrievalQA
 
 # Define the function to return a retriever
 def loader_fn():
-    return vector_search_as_retriever()
+    return get_retriever()
 
 TEMPLATE = """\
 You are an enthusiastic, friendly and fun science journalist with expertise in gamma-ray bursts, supernovas, and astronomical observations. Your goal is to share your knowledge in a captivating and accessible way.
@@ -233,6 +280,7 @@ with mlflow.start_run(run_name= my_model) as run:
     model_info = mlflow.langchain.log_model(
         chain,
         loader_fn=get_retriever,  # Load the retriever with DATABRICKS_TOKEN env as secret (for authentication).
+        code_paths=["../shared/pooled_retriever.py", "../shared/embedding_cache.py", "circular_metadata.py"],
         artifact_path="chain",
         registered_model_name=model_name,
         pip_requirements=[
@@ -0,0 +1,143 @@
+"""
+Embedding store for the circular chunks, keyed by `chunk_id` (md5 of the chunk text).
+
+Chunks are embedded once per model: `update_embedding_store` only sends the chunk_ids that are not in
+the store yet, in large batched requests, and MERGEs the vectors in. Re-chunking with other parameters,
+or rebuilding the gold table, only pays for the chunk texts that were never embedded.
+`update_index_table` joins the chunks with their vectors into the source table of a Delta Sync index
+with self-managed embeddings (`embedding_vector_column`), so the index does not re-embed anything.
+
+    embed = endpoint_embedder("databricks-bge-large-en")      # or local_embedder("BAAI/bge-large-en-v1.5")
+    update_embedding_store(spark, spark.table(chunks_table), store_table, embed, model="databricks-bge-large-en")
+    update_index_table(spark, chunks_table, store_table, index_table, model="databricks-bge-large-en")
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from typing import Callable, Iterator, List, Sequence
+
+import pandas as pd
+
+Embedder = Callable[[List[str]], List[List[float]]]
+
+
+def endpoint_embedder(endpoint: str, batch_size: int = 150, concurrency: int = 4) -> Embedder:
+    """
+    Embeds with a model serving endpoint: `batch_size` texts per request, `concurrency` requests in flight.
+    Authenticates with the credentials the Databricks runtime gives the workers, so no token travels in the
+    UDF closure.
+    """
+
+    def embed(texts: List[str]) -> List[List[float]]:
+        from mlflow.deployments import get_deploy_client
+
+        client = get_deploy_client("databricks")
+
+        def request(batch: List[str]) -> List[List[float]]:
+            response = client.predict(endpoint=endpoint, inputs={"input": batch})
+            return [item["embedding"] for item in sorted(response["data"], key=lambda d: d["index"])]
+
+        batches = [texts[i:i + batch_size] for i in range(0, len(texts), batch_size)]
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            return [vector for vectors in pool.map(request, batches) for vector in vectors]
+
+    return embed
+
+
+@lru_cache(maxsize=2)
+def _local_model(name: str):
+    from sentence_transformers import SentenceTransformer
+
+    return SentenceTransformer(name)
+
+
+def local_embedder(model_name: str = "BAAI/bge-large-en-v1.5", batch_size: int = 64) -> Embedder:
+    """Stand-in for the endpoint: the same model run on the worker (loaded once per Python worker)."""
+
+    def embed(texts: List[str]) -> List[List[float]]:
+        vectors = _local_model(model_name).encode(texts, batch_size=batch_size, normalize_embeddings=True)
+        return vectors.tolist()
+
+    return embed
+
+
+def embedding_udf(embed: Embedder):
+    """pandas UDF (string -> array<float>) embedding every Arrow batch with one `embed` call."""
+    from pyspark.sql.functions import pandas_udf
+
+    @pandas_udf("array<float>")
+    def _embed(batches: Iterator[pd.Series]) -> Iterator[pd.Series]:
+        for texts in batches:
+            yield pd.Series(embed(texts.fillna("").tolist()), index=texts.index)
+
+    return _embed
+
+
+def update_embedding_store(spark, chunks_df, store_table: str, embed: Embedder, model: str,
+                           chunk_id_column: str = "chunk_id", text_column: str = "chunked_text",
+                           rows_per_partition: int = 2000) -> int:
+    """Embeds the chunks of `chunks_df` whose chunk_id is not in the store for `model`; returns how many were embedded."""
+    from delta.tables import DeltaTable
+    from pyspark.sql import functions as F
+
+    chunks = chunks_df.select(F.col(chunk_id_column).alias("chunk_id"), F.col(text_column).alias("text")).dropDuplicates(["chunk_id"])
+    exists = spark.catalog.tableExists(store_table)
+    if exists:
+        embedded = spark.table(store_table).where(F.col("model") == model).select("chunk_id")
+        chunks = chunks.join(embedded, "chunk_id", "left_anti")
+
+    missing = chunks.count()
+    if not missing:
+        return 0
+    # Enough partitions to keep the endpoint busy, few enough for large Arrow batches
+    new_vectors = (chunks.repartition(max(1, missing // rows_per_partition))
+        .select("chunk_id", F.lit(model).alias("model"), embedding_udf(embed)("text").alias("embedding"),
+                F.current_timestamp().alias("embedded_at")))
+
+    if not exists:
+        new_vectors.write.format("delta").saveAsTable(store_table)
+    else:
+        (DeltaTable.forName(spark, store_table).alias("t")
+            .merge(new_vectors.alias("s"), "t.chunk_id = s.chunk_id AND t.model = s.model")
+            .whenNotMatchedInsertAll()
+            .execute())
+    return missing
+
+
+def update_index_table(spark, chunks_table: str, store_table: str, index_table: str, model: str,
+                       columns: Sequence[str] = ("chunk_id", "id", "created", "chunked_text",
+                                                 "circular_day", "events", "instruments")) -> bool:
+    """
+    Source table of the self-managed embedding index: one row per chunk with its vector. MERGEd on chunk_id
+    (new chunks inserted, removed chunks deleted, chunks whose circular columns changed updated, others untouched),
+    so its change data feed only carries changes.
+    A table missing some of `columns` (new metadata columns) is rewritten: returns True, the index must be recreated.
+    """
+    from delta.tables import DeltaTable
+    from pyspark.sql import Window
+    from pyspark.sql import functions as F
+
+    vectors = spark.table(store_table).where(F.col("model") == model).select("chunk_id", "embedding")
+    # The same chunk text in several circulars: always the row of the first circular, so reruns do not flip it
+    first = Window.partitionBy("chunk_id").orderBy("id")
+    rows = (spark.table(chunks_table).select(*columns)
+        .withColumn("_rank", F.row_number().over(first)).where("_rank = 1").drop("_rank")
+        .join(vectors, "chunk_id"))
+
+    if not spark.catalog.tableExists(index_table) or not set(columns) <= set(spark.table(index_table).columns):
+        (rows.write.format("delta").mode("overwrite").option("overwriteSchema", "true")
+            .option("delta.enableChangeDataFeed", "true").saveAsTable(index_table))
+        return True
+    # A chunk kept by an edited circular has the same chunk_id (and vector) but may have new circular columns:
+    # updated, so the index filters follow the gold table
+    refreshed = [c for c in columns if c != "chunk_id"]
+    (DeltaTable.forName(spark, index_table).alias("t")
+        .merge(rows.alias("s"), "t.chunk_id = s.chunk_id")
+        .whenMatchedUpdate(
+            condition="NOT (" + " AND ".join(f"t.`{c}` <=> s.`{c}`" for c in refreshed) + ")",
+            set={c: f"s.`{c}`" for c in refreshed},
+        )
+        .whenNotMatchedInsertAll()
+        .whenNotMatchedBySourceDelete()
+        .execute())
+    return False
@@ -0,0 +1,88 @@
+"""
+Token-window chunker for the circulars, vectorized over Arrow batches.
+
+Every batch of texts is tokenized in one call of the fast (Rust) tokenizer with the offset mapping:
+chunks are windows of `chunk_size` tokens that overlap by `chunk_overlap` tokens, and the text of a
+chunk is sliced from the original string with the character offsets of its first and last token. No
+candidate split is re-tokenized, and the chunks fit the embedding model's context window exactly.
+
+The tokenizer is loaded once per Python worker (module-level cache), not shipped with the UDF.
+
+    df.withColumn("chunks", chunk_udf("BAAI/bge-large-en-v1.5", 500, 75)("text"))
+"""
+
+from functools import lru_cache
+from typing import Iterator, List, Sequence, Tuple
+
+import pandas as pd
+
+# A window starting or ending inside a word is moved back by up to this many tokens to the start of the word
+MAX_WORD_BACKTRACK_TOKENS = 8
+
+
+@lru_cache(maxsize=4)
+def get_tokenizer(name: str):
+    from transformers import AutoTokenizer
+
+    tokenizer = AutoTokenizer.from_pretrained(name, use_fast=True)
+    if not tokenizer.is_fast:
+        raise ValueError(f"{name} has no fast tokenizer: offset mappings are required")
+    return tokenizer
+
+
+def token_windows(offsets: Sequence[Tuple[int, int]], chunk_size: int, chunk_overlap: int) -> List[Tuple[int, int]]:
+    """(first char, last char + 1) of every window of at most `chunk_size` tokens, overlapping by `chunk_overlap` tokens."""
+    if chunk_overlap >= chunk_size:
+        raise ValueError(f"chunk_overlap ({chunk_overlap}) must be smaller than chunk_size ({chunk_size})")
+    n = len(offsets)
+    windows = []
+    start = 0
+    while start < n:
+        end = min(start + chunk_size, n)
+        if end < n:
+            # Do not cut a word in two: a token glued to the previous one (no gap) continues the same word
+            cut = end
+            while cut > start + chunk_overlap + 1 and end - cut < MAX_WORD_BACKTRACK_TOKENS and offsets[cut][0] == offsets[cut - 1][1]:
+                cut -= 1
+            if offsets[cut][0] != offsets[cut - 1][1]:
+                end = cut
+        windows.append((offsets[start][0], offsets[end - 1][1]))
+        if end == n:
+            break
+        next_start = max(end - chunk_overlap, start + 1)
+        # Same for the start of the overlapping window: begin at the start of the word, not inside it
+        cut = next_start
+        while cut > start + 1 and next_start - cut < MAX_WORD_BACKTRACK_TOKENS and offsets[cut][0] == offsets[cut - 1][1]:
+            cut -= 1
+        start = cut if offsets[cut][0] != offsets[cut - 1][1] else next_start
+    return windows
+
+
+def chunk_texts(texts: Sequence[str], tokenizer, chunk_size: int = 500, chunk_overlap: int = 75) -> List[List[str]]:
+    """Chunks of every text, tokenized in a single batch call."""
+    values = ["" if t is None else str(t) for t in texts]
+    encoded = tokenizer(
+        values,
+        add_special_tokens=False,
+        return_offsets_mapping=True,
+        return_attention_mask=False,
+        return_token_type_ids=False,
+        verbose=False,
+    )
+    return [
+        [text[start:end] for start, end in token_windows(offsets, chunk_size, chunk_overlap)]
+        for text, offsets in zip(values, encoded["offset_mapping"])
+    ]
+
+
+def chunk_udf(tokenizer_name: str, chunk_size: int = 500, chunk_overlap: int = 75):
+    """pandas UDF (string -> array<string>) chunking every value with `chunk_texts`."""
+    from pyspark.sql.functions import pandas_udf
+
+    @pandas_udf("array<string>")
+    def _chunk(batches: Iterator[pd.Series]) -> Iterator[pd.Series]:
+        tokenizer = get_tokenizer(tokenizer_name)
+        for texts in batches:
+            yield pd.Series(chunk_texts(texts.tolist(), tokenizer, chunk_size, chunk_overlap), index=texts.index)
+
+    return _chunk
@@ -0,0 +1,163 @@
+"""
+Structured metadata of the circulars, extracted at chunk time, and the index filters of a question.
+
+Every chunk carries the metadata of its circular, as filterable columns of the vector index:
+
+- `circular_day`: the circular date as yyyymmdd (int), for range filters;
+- `events`: the event designations (GRB 240101A, EP240315a, S240422ed, SN 2024abc, ...), normalized
+  without spaces and separated by spaces, so one designation is one token for a `LIKE` filter;
+- `instruments`: the instruments mentioned (Swift-BAT, Fermi-GBM, ...), in the same format.
+
+`question_filters` turns the date and designation constraints of a question into Vector Search filters,
+so the similarity search only ranks the chunks of the right period and event:
+
+    question_filters("GRBs related to supernova in 2024")   # {'circular_day >=': 20240101, 'circular_day <': 20250101}
+    question_filters("tell me about the afterglow of 221009A")   # {'events LIKE': 'GRB221009A'}
+"""
+
+import calendar
+import re
+from datetime import date
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import pandas as pd
+
+# (pattern, normalization) of the designations; the most specific first
+EVENT_PATTERNS: List[Tuple[re.Pattern, str]] = [
+    (re.compile(r"\bGRB\s?(\d{6}[A-Z]?)\b", re.I), "GRB{0}"),
+    (re.compile(r"\bEP\s?(\d{6}[a-z])\b", re.I), "EP{0}"),
+    (re.compile(r"\bFRB\s?(\d{8}[A-Z]?)\b", re.I), "FRB{0}"),
+    (re.compile(r"\bIceCube[-\s]?(\d{6}[A-Z])\b", re.I), "IceCube{0}"),
+    (re.compile(r"\b(SN|AT)\s?(\d{4}[a-z]{1,3})\b"), "{0}{1}"),
+    (re.compile(r"\bZTF\s?(\d{2}[a-z]{7})\b"), "ZTF{0}"),
+    (re.compile(r"\b(GW\d{6}(?:_\d{6})?)\b"), "{0}"),
+    (re.compile(r"\b(S\d{6}[a-z]{1,3})\b"), "{0}"),
+]
+# Alone in a question, "221009A" is a GRB
+BARE_GRB = re.compile(r"(?<![\w-])(\d{6}[A-Z])\b")
+
+# Case-sensitive: "bat", "agile" or "lat" in prose are not instruments
+INSTRUMENTS: Dict[str, re.Pattern] = {name: re.compile(pattern) for name, pattern in {
+    "Swift-BAT": r"\b(?:Swift[/\s-]*)?BAT\b",
+    "Swift-XRT": r"\b(?:Swift[/\s-]*)?XRT\b",
+    "Swift-UVOT": r"\b(?:Swift[/\s-]*)?UVOT\b",
+    "Fermi-GBM": r"\b(?:Fermi[/\s-]*)?GBM\b",
+    "Fermi-LAT": r"\b(?:Fermi[/\s-]*)?LAT\b",
+    "INTEGRAL": r"\bINTEGRAL\b|\bSPI-ACS\b",
+    "Konus-Wind": r"\bKonus[-\s]?Wind\b",
+    "AstroSat": r"\bAstroSat\b",
+    "MAXI": r"\bMAXI\b",
+    "GECAM": r"\bGECAM\b",
+    "Insight-HXMT": r"\bHXMT\b",
+    "AGILE": r"\bAGILE\b",
+    "SVOM": r"\bSVOM\b",
+    "Einstein-Probe": r"\bEinstein\s+Probe\b|\bEP[-\s]?(?:WXT|FXT)\b",
+    "IceCube": r"\bIceCube\b",
+    "LIGO-Virgo-KAGRA": r"\bLIGO\b|\bVirgo\b|\bKAGRA\b|\bLVK\b",
+    "NuSTAR": r"\bNuSTAR\b",
+    "Chandra": r"\bChandra\b",
+    "HST": r"\bHST\b|\bHubble\b",
+    "JWST": r"\bJWST\b",
+    "VLT": r"\bVLT\b",
+    "Gemini": r"\bGemini\b",
+    "ZTF": r"\bZTF\b",
+}.items()}
+
+MONTHS = {name.lower(): i for i, name in enumerate(calendar.month_name) if name}
+MONTHS.update({name.lower(): i for i, name in enumerate(calendar.month_abbr) if name})
+YEAR = r"(19[89]\d|20\d\d)"
+
+
+def extract_events(text: str) -> List[str]:
+    """Normalized designations, in order of appearance, without duplicates."""
+    found = []
+    for pattern, fmt in EVENT_PATTERNS:
+        for match in pattern.finditer(text or ""):
+            groups = match.groups()
+            # Designation suffixes of GRBs and IceCube alerts are upper case, of EP lower case
+            if fmt in ("GRB{0}", "IceCube{0}", "FRB{0}"):
+                groups = (groups[0].upper(),)
+            elif fmt == "EP{0}":
+                groups = (groups[0].lower(),)
+            found.append((match.start(), fmt.format(*groups)))
+    return list(dict.fromkeys(name for _, name in sorted(found)))
+
+
+def extract_instruments(text: str) -> List[str]:
+    return [name for name, pattern in INSTRUMENTS.items() if pattern.search(text or "")]
+
+
+def metadata_udf():
+    """pandas UDF (string -> struct<events, instruments>) with the space-separated metadata tokens of every text."""
+    from pyspark.sql.functions import pandas_udf
+
+    @pandas_udf("struct<events: string, instruments: string>")
+    def _metadata(batches: Iterator[pd.Series]) -> Iterator[pd.DataFrame]:
+        for texts in batches:
+            texts = texts.fillna("")
+            yield pd.DataFrame({
+                "events": [" ".join(extract_events(t)) for t in texts],
+                "instruments": [" ".join(extract_instruments(t)) for t in texts],
+            }, index=texts.index)
+
+    return _metadata
+
+
+def _day(year: int, month: int = 1, day: int = 1) -> int:
+    return year * 10000 + month * 100 + day
+
+
+def _next_month(year: int, month: int) -> int:
+    return _day(year + 1, 1) if month == 12 else _day(year, month + 1)
+
+
+def date_range(question: str, today: Optional[date] = None) -> Tuple[Optional[int], Optional[int]]:
+    """[start, end) of the period named in the question as yyyymmdd, None when open."""
+    today = today or date.today()
+    q = question.lower()
+
+    m = re.search(rf"\b(?:between|from)\s+{YEAR}\s+(?:and|to|until)\s+{YEAR}\b|\b{YEAR}\s*(?:-|–|to)\s*{YEAR}\b", q)
+    if m:
+        years = sorted(int(y) for y in m.groups() if y)
+        return _day(years[0]), _day(years[1] + 1)
+    m = re.search(rf"\b({'|'.join(MONTHS)})\.?\s+{YEAR}\b", q)
+    if m:
+        year, month = int(m.group(2)), MONTHS[m.group(1)]
+        return _day(year, month), _next_month(year, month)
+    m = re.search(rf"\b(since|after|from|before|until)\s+{YEAR}\b", q)
+    if m:
+        year = int(m.group(2))
+        return {"since": (_day(year), None), "from": (_day(year), None), "after": (_day(year + 1), None),
+                "before": (None, _day(year)), "until": (None, _day(year + 1))}[m.group(1)]
+    m = re.search(rf"\b{YEAR}\b", q)
+    if m:
+        year = int(m.group(1))
+        return _day(year), _day(year + 1)
+    if re.search(r"\bthis year\b", q):
+        return _day(today.year), None
+    if re.search(r"\blast year\b", q):
+        return _day(today.year - 1), _day(today.year)
+    return None, None
+
+
+def question_filters(question: str, today: Optional[date] = None) -> Dict[str, object]:
+    """Vector Search filters for the date range and the event designation of a question (empty when it has none)."""
+    events = extract_events(question)
+    bare = [f"GRB{m}" for m in BARE_GRB.findall(question)]
+    events = list(dict.fromkeys(events + bare))
+
+    # Designations contain digits that look like years (SN 2024abc): dates are read without them
+    without_events = question
+    for pattern, _ in EVENT_PATTERNS:
+        without_events = pattern.sub(" ", without_events)
+    start, end = date_range(BARE_GRB.sub(" ", without_events), today)
+
+    filters: Dict[str, object] = {}
+    if start is not None:
+        filters["circular_day >="] = start
+    if end is not None:
+        filters["circular_day <"] = end
+    # Several designations would need an OR of LIKEs: only one is filtered on, the others rely on similarity
+    if len(events) == 1:
+        filters["events LIKE"] = events[0]
+    return filters
@@ -6,7 +6,7 @@
 
 d_catalog = "demo_frank"
 d_schema = "nasa"
-d_table = "raw_events" 
+d_table = "swift_notices"
 
 f_schema = f"{d_catalog}.{d_schema}"
 f_table = f"{f_schema}.{d_table}"
@@ -23,7 +23,7 @@ spark.sql(f"CREATE SCHEMA IF NOT EXISTS {f_schema}; ")
 
 import pandas as pd
 
-def msg_to_pd(msg):
+def msg_to_dict(msg):
     lines = msg.split('\n')
     data = {}
     comments = ''
@@ -35,9 +35,11 @@ def msg_to_pd(msg):
             else:
                 data[key_value[0].strip()] = key_value[1].strip()
     data['COMMENTS'] = comments.strip()
-    df = pd.DataFrame(data, index=[0])
-    df['all_text'] = df.astype(str).apply(', '.join, axis=1)
-    return df
+    data['all_text'] = ', '.join(str(v) for v in data.values())
+    return data
+
+def msg_to_pd(msg):
+    return pd.DataFrame(msg_to_dict(msg), index=[0])
 
 
 # COMMAND ----------
@@ -46,15 +48,46 @@ def save_df(pdf, table_name):
     df = spark.createDataFrame(pdf)
     df.write.format("delta").mode("append").option("mergeSchema", "true").saveAsTable(table_name)
 
+# Typed notices (see gcn_parser.py): msg_to_pd above splits on every ':' and keeps strings
+from gcn_parser import parse_notice, SCHEMA as notice_arrow_schema
+from pyspark.sql.pandas.types import from_arrow_schema
+
+notice_schema = from_arrow_schema(notice_arrow_schema)
+
+# Notices are written in micro-batches (one Delta commit per batch instead of one per notice), see gcn_writer.py
+max_batch_rows = 1000
+max_batch_delay_s = 5
+
+# Notices are MERGEd on their natural key, so a re-delivered notice is not stored twice,
+# and the offsets of every written batch are checkpointed next to the table
+merge_keys = ["TGT_NUM", "SEG_NUM", "NOTICE_DATE"]
+offsets_table = f"{f_table}_offsets"
 
-# Drop duplicate rows based on all columns
-# deduplicated_table = delta_table.dropDuplicates()    
+# COMMAND ----------
+
+# Once: duplicates appended before the MERGE (restarts replayed the whole topic).
+# Marked done with a table property, so it never rewrites the table again. Do not run it while a consumer
+# (this notebook or 7 - GCN Multi-Topic Consumer) is writing to the table.
+from functools import reduce
+from pyspark.sql.functions import col
+
+if spark.catalog.tableExists(f_table):
+    properties = {r.key: r.value for r in spark.sql(f"SHOW TBLPROPERTIES {f_table}").collect()}
+    if properties.get("gcn.merge_keys_deduplicated") != "true":
+        notices = spark.read.table(f_table)
+        has_keys = reduce(lambda a, b: a & b, [col(k).isNotNull() for k in merge_keys])
+        # Rows with a null key field are never matched by the MERGE: kept as they are
+        deduplicated = notices.where(has_keys).dropDuplicates(merge_keys).unionByName(notices.where(~has_keys))
+        if notices.count() != deduplicated.count():
+            deduplicated.write.mode("overwrite").saveAsTable(f_table)
+        spark.sql(f"ALTER TABLE {f_table} SET TBLPROPERTIES ('gcn.merge_keys_deduplicated' = 'true')")
 
 # COMMAND ----------
 
-import datetime, time
+from confluent_kafka import TopicPartition
 from gcn_kafka import Consumer
-from pyspark.sql.types import StructType
+from gcn_writer import BufferedDeltaWriter
+from gcn_consumer import run_consumer, resume_from
 
 
 #config = {'max.poll.interval.ms': 600000, 'session.timeout.ms': 90000}
@@ -62,8 +95,10 @@ from pyspark.sql.types import StructType
 client_id = dbutils.secrets.get(scope="nasa-gcn", key="client_id")
 client_secret = dbutils.secrets.get(scope="nasa-gcn", key="client_secret")
 
-config = {'group.id': '',
-          'auto.offset.reset': 'earliest' }
+# Offsets are committed by the writer after each successful flush (and checkpointed in offsets_table)
+config = {'group.id': f'{f_table}-consumer',
+          'auto.offset.reset': 'earliest',
+          'enable.auto.commit': False }
 
 consumer = Consumer(config, 
                     client_id=client_id,
@@ -72,30 +107,20 @@ consumer = Consumer(config,
 
 topics = ['gcn.classic.text.SWIFT_POINTDIR']
 
-print(f'subscribing to: {topics}')
-
-consumer.subscribe(topics)
-
-while True:
-    
-    print(f'consume({datetime.datetime.now()})', end='')
-    
-    for message in consumer.consume(timeout=1):
-        if message.error():
-            print(message.error())
-            continue
-        
-        #regular output
-        print(f'topic={message.topic()}, offset={message.offset()} \n')
-        msg = message.value().decode('UTF-8')
-        
-        print(f'msg = {msg}')
-
-        pdf = msg_to_pd(msg)
-        save_df(pdf,f_table)
-        
-    print(f'- done')
-    time.sleep(20)
+def commit_offsets(offsets):
+    consumer.commit(offsets=[TopicPartition(topic, partition, offset) for topic, partition, offset in offsets], asynchronous=False)
+
+writer = BufferedDeltaWriter(spark, f_table, max_rows=max_batch_rows, max_delay_s=max_batch_delay_s, commit_offsets=commit_offsets,
+                             schema=notice_schema, merge_keys=merge_keys, offsets_table=offsets_table)
+
+# Resume after the last batch written to the table; partitions without a checkpoint use the group offsets / earliest
+checkpoint = writer.load_offsets()
+print(f'subscribing to: {topics}, resuming from {checkpoint}')
+
+consumer.subscribe(topics, on_assign=resume_from(checkpoint))
+
+# Runs until the notebook is cancelled, see gcn_consumer.py. The same loop runs against a local fake broker in the Ingest Benchmark notebook
+run_consumer(consumer, writer, parse=parse_notice, max_messages=max_batch_rows)
 
 # COMMAND ----------
 
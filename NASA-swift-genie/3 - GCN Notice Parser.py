@@ -0,0 +1,208 @@
+# Databricks notebook source
+# MAGIC %md
+# MAGIC # Typed GCN notice parser
+# MAGIC
+# MAGIC [gcn_parser.py]($./gcn_parser.py) parses SWIFT_POINTDIR notices into typed columns (RA/Dec in degrees, timestamps, TJD/DOY, seconds, integers) and builds one Arrow record batch per batch of notices. This notebook checks it on the example notices of the repository and on randomly generated notices, and benchmarks it against the `msg_to_pd` path of the [GCN Kafka Client]($./1 - GCN Kafka Client) notebook.
+
+# COMMAND ----------
+
+import datetime
+import re
+import time
+import numpy as np
+import pandas as pd
+from gcn_parser import parse_notice, parse_notices, format_notice, random_notice, sample_notices, tjd_to_date
+
+# COMMAND ----------
+
+# MAGIC %md
+# MAGIC ## Example notices
+
+# COMMAND ----------
+
+first, second = [parse_notice(msg) for msg in sample_notices()]
+
+assert first["NOTICE_DATE"] == datetime.datetime(2024, 5, 3, 4, 16, 31, tzinfo=datetime.timezone.utc)
+assert (first["NEXT_POINT_RA"], first["NEXT_POINT_DEC"], first["NEXT_POINT_ROLL"]) == (213.407, 70.472, 2.885)
+# The value contains colons: {04:17:00.00}
+assert first["SLEW_TIME"] == 15420.0
+assert (first["SLEW_TJD"], first["SLEW_DOY"], first["SLEW_DATE"]) == (20433, 124, datetime.date(2024, 5, 3))
+assert first["OBS_TIME"] == 900.0
+assert (first["TGT_NAME"], first["TGT_NUM"], first["SEG_NUM"]) == ("RX J1413.6+7029", 3111759, 10)
+assert (first["MERIT"], first["BAT_MODE"], first["XRT_MODE"], first["UVOT_MODE"]) == (60.0, 0, 7, 12525)
+assert (first["SUN_RA"], first["SUN_DEC"], first["SUN_DIST"], first["SUN_ANGLE"]) == (40.78, 15.81, 93.68, -11.5)
+assert (first["MOON_RA"], first["MOON_DEC"], first["MOON_DIST"], first["MOON_ILLUM"]) == (338.61, -12.48, 113.09, 31.0)
+assert (first["GAL_LON"], first["GAL_LAT"], first["ECL_LON"], first["ECL_LAT"]) == (113.36, 45.10, 143.56, 69.70)
+assert first["COMMENTS"].startswith("SWIFT Slew Notice to a preplanned target.")
+
+# Sexagesimal parts missing their quote (+08d 44 34") do not matter, the decimal degrees are parsed
+assert (second["SUN_RA"], second["SUN_DEC"], second["MOON_DEC"]) == (20.78, 8.74, 25.03)
+assert (second["NEXT_POINT_DEC"], second["GAL_LAT"], second["ECL_LAT"]) == (-30.147, -58.82, -45.88)
+
+display(pd.DataFrame([first, second]).drop(columns=["RAW"]))
+
+# COMMAND ----------
+
+# MAGIC %md
+# MAGIC ## Properties
+# MAGIC Checked on the example notices and on 1000 random ones:
+# MAGIC - every field is parsed (no nulls) and coordinates are in range
+# MAGIC - the parsed values agree with the redundant parts of the text: TJD, DOY and calendar date, seconds of day and `{hh:mm:ss}`, seconds and `(=x [min])`
+# MAGIC - `parse_notice(format_notice(values)) == values`
+
+# COMMAND ----------
+
+def check_properties(row):
+    raw = row["RAW"]
+    assert all(value is not None for value in row.values()), [k for k, v in row.items() if v is None]
+    assert 0 <= row["NEXT_POINT_RA"] < 360 and -90 <= row["NEXT_POINT_DEC"] <= 90
+    assert tjd_to_date(row["SLEW_TJD"]) == row["SLEW_DATE"]
+    assert row["SLEW_DATE"].timetuple().tm_yday == row["SLEW_DOY"]
+    hours, minutes, seconds = re.search(r"\{(\d{2}):(\d{2}):(\d{2})", raw).groups()
+    assert row["SLEW_TIME"] == int(hours) * 3600 + int(minutes) * 60 + int(seconds)
+    assert abs(row["OBS_TIME"] / 60 - float(re.search(r"\(=([\d.]+) \[min\]\)", raw).group(1))) < 0.05
+    # The slew follows the notice by a few minutes
+    slew = datetime.datetime.combine(row["SLEW_DATE"], datetime.time(), tzinfo=datetime.timezone.utc) + datetime.timedelta(seconds=row["SLEW_TIME"])
+    assert datetime.timedelta(0) <= slew - row["NOTICE_DATE"] < datetime.timedelta(hours=1)
+
+for row in [first, second]:
+    check_properties(row)
+
+rng = np.random.default_rng(42)
+start = datetime.datetime(2024, 1, 1, tzinfo=datetime.timezone.utc)
+for i in range(1000):
+    values = random_notice(rng, start + datetime.timedelta(minutes=int(rng.integers(0, 525600))))
+    row = parse_notice(format_notice(values))
+    check_properties(row)
+    mismatches = {k: (v, row[k]) for k, v in values.items() if row[k] != v}
+    assert not mismatches, mismatches
+
+print("All checks passed")
+
+# COMMAND ----------
+
+# MAGIC %md
+# MAGIC ## Benchmark against the pandas path
+# MAGIC `msg_to_pd` builds a one-row DataFrame per notice (and keeps strings); the typed parser builds one Arrow record batch for the whole batch.
+
+# COMMAND ----------
+
+def msg_to_pd(msg):
+    lines = msg.split('\n')
+    data = {}
+    comments = ''
+    for line in lines:
+        if line.strip():
+            key_value = line.split(':')
+            if key_value[0].strip() == 'COMMENTS':
+                comments += key_value[1].strip() + ' '
+            else:
+                data[key_value[0].strip()] = key_value[1].strip()
+    data['COMMENTS'] = comments.strip()
+    df = pd.DataFrame(data, index=[0])
+    df['all_text'] = df.astype(str).apply(', '.join, axis=1)
+    return df
+
+messages = [format_notice(random_notice(rng)) for _ in range(20000)]
+
+results = []
+for name, parse, n in [
+    ("msg_to_pd + concat", lambda msgs: pd.concat([msg_to_pd(m) for m in msgs]), 2000),
+    ("parse_notices (Arrow)", parse_notices, 20000),
+    ("parse_notices + to_pandas", lambda msgs: parse_notices(msgs).to_pandas(), 20000),
+]:
+    start = time.perf_counter()
+    parse(messages[:n])
+    elapsed = time.perf_counter() - start
+    results.append({"parser": name, "notices": n, "seconds": elapsed, "notices_per_s": n / elapsed})
+
+display(pd.DataFrame(results))
+
+# COMMAND ----------
+
+# MAGIC %md
+# MAGIC ## Spark: single-pass parsing vs explode + pivot
+# MAGIC The `split_events` streaming table of the [pipeline]($./supernova-pipeline/Kafka-Pipeline-SQL.sql) used to explode every message into key/value rows (about 25 per notice) and pivot them back, which shuffles. It now extracts every field with `regexp_extract` in a single projection, straight from the stream of `raw_space_events` (one row per Kafka offset already, so there is nothing to de-duplicate and no watermark delay). Both queries, plus the Arrow parser in `mapInArrow`, run here on synthetic notices shaped like `raw_space_events`, written to the `noop` sink so only the parsing is measured.
+
+# COMMAND ----------
+
+from pyspark.sql.functions import col, lit, monotonically_increasing_id, timestamp_seconds
+from pyspark.sql.pandas.types import from_arrow_schema
+from gcn_parser import SCHEMA as notice_arrow_schema
+
+benchmark_rows = 1_000_000
+distinct_messages = 10_000
+
+seed_df = spark.createDataFrame([(m,) for m in messages[:distinct_messages]], "msg string")
+raw_df = (spark.range(benchmark_rows // distinct_messages).crossJoin(seed_df)
+    .select(lit(0).alias("partition"), monotonically_increasing_id().alias("offset"), "msg")
+    # The previous view pivots by timestamp: one distinct timestamp per message, like Kafka's
+    .withColumn("timestamp", timestamp_seconds(col("offset")))
+    .cache())
+raw_df.count()
+raw_df.createOrReplaceTempView("raw_space_events_benchmark")
+
+explode_pivot_sql = """
+  WITH extracted_key_values AS (
+    SELECT
+      timestamp,
+      split_part(line, ':', 1) AS key,
+      TRIM(SUBSTRING(line, INSTR(line, ':') + 1)) AS value
+    FROM (
+      SELECT
+        timestamp,
+        explode(split(msg, '\\\\n')) AS line
+      FROM raw_space_events_benchmark
+    )
+    WHERE line != ''
+  ),
+  pivot_table AS (
+    SELECT *
+    FROM (
+      SELECT key, value, timestamp
+      FROM extracted_key_values
+    )
+    PIVOT (
+      MAX(value) FOR key IN ('TITLE', 'NOTICE_DATE', 'NOTICE_TYPE', 'NEXT_POINT_RA', 'NEXT_POINT_DEC', 'NEXT_POINT_ROLL', 'SLEW_TIME', 'SLEW_DATE', 'OBS_TIME', 'TGT_NAME', 'TGT_NUM', 'MERIT', 'INST_MODES', 'SUN_POSTN', 'SUN_DIST', 'MOON_POSTN', 'MOON_DIST', 'MOON_ILLUM', 'GAL_COORDS', 'ECL_COORDS', 'COMMENTS')
+    )
+  )
+  SELECT timestamp, TITLE, CAST(NOTICE_DATE AS TIMESTAMP) AS NOTICE_DATE, NOTICE_TYPE, NEXT_POINT_RA, NEXT_POINT_DEC, NEXT_POINT_ROLL, SLEW_TIME, SLEW_DATE, OBS_TIME, TGT_NAME, TGT_NUM, CAST(MERIT AS DECIMAL) AS MERIT, INST_MODES, SUN_POSTN, SUN_DIST, MOON_POSTN, MOON_DIST, MOON_ILLUM, GAL_COORDS, ECL_COORDS, COMMENTS
+  FROM pivot_table
+"""
+
+# The split_events query of the pipeline, read from the pipeline source so the benchmark runs exactly that code
+pipeline_sql = open("supernova-pipeline/Kafka-Pipeline-SQL.sql").read()
+split_events_sql = re.search(r"CREATE OR (?:REPLACE|REFRESH) [\w ]*?split_events.*?\nAS\n(.*?)\n-- COMMAND", pipeline_sql, re.S).group(1)
+# Run as a batch query
+split_events_sql = split_events_sql.replace("STREAM(LIVE.raw_space_events)", "raw_space_events_benchmark")
+
+def parse_arrow_batches(batches):
+    for batch in batches:
+        yield parse_notices(batch.column("msg").to_pylist())
+
+benchmarks = {
+    "explode + pivot (previous split_events)": lambda: spark.sql(explode_pivot_sql),
+    "regexp_extract projection (split_events)": lambda: spark.sql(split_events_sql),
+    "Arrow parser in mapInArrow": lambda: raw_df.select("msg").mapInArrow(parse_arrow_batches, from_arrow_schema(notice_arrow_schema)),
+}
+
+spark_results = []
+for name, query in benchmarks.items():
+    start = time.perf_counter()
+    query().write.format("noop").mode("overwrite").save()
+    elapsed = time.perf_counter() - start
+    spark_results.append({"query": name, "rows": benchmark_rows, "seconds": elapsed, "rows_per_s": benchmark_rows / elapsed})
+
+display(pd.DataFrame(spark_results))
+
+# COMMAND ----------
+
+# Both single-pass parsers agree on the typed values
+typed = spark.sql(split_events_sql).join(raw_df.select("offset", "msg"), "offset").limit(1000).toPandas()
+for row in typed.itertuples():
+    expected = parse_notice(row.msg)
+    assert (row.NEXT_POINT_RA, row.NEXT_POINT_DEC, row.TGT_NUM, row.SEG_NUM, row.OBS_TIME, row.MERIT) == (
+        expected["NEXT_POINT_RA"], expected["NEXT_POINT_DEC"], expected["TGT_NUM"], expected["SEG_NUM"], expected["OBS_TIME"], expected["MERIT"]
+    )
+
+raw_df.unpersist()
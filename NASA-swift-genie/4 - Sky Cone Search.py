@@ -0,0 +1,153 @@
+# Databricks notebook source
+# MAGIC %md
+# MAGIC # Cone search over the Swift pointings
+# MAGIC "Which targets did Swift point at within 2° of this GRB?"
+# MAGIC
+# MAGIC Every notice carries the HEALPix pixel of its pointing direction (`HPX_4`, `HPX_10`, computed by [gcn_parser.py]($./gcn_parser.py) at parse time, see [sky_index.py]($./sky_index.py)). The table is clustered by `HPX_10`: a cone search is turned into a few `HPX_10` ranges, so only the files of those sky regions are read, and the exact angular distance is computed on the remaining rows only.
+
+# COMMAND ----------
+
+d_catalog = "demo_frank"
+d_schema = "nasa"
+d_table = "swift_notices"
+
+f_schema = f"{d_catalog}.{d_schema}"
+f_table = f"{f_schema}.{d_table}"
+
+# COMMAND ----------
+
+import time
+import pandas as pd
+from pyspark.sql.functions import col, pandas_udf, shiftright
+from sky_index import ORDERS, INDEX_ORDER, ang2pix, angular_distance_deg, cone_ranges, cone_search
+
+# COMMAND ----------
+
+# MAGIC %md
+# MAGIC ## Index and cluster the table
+# MAGIC Notices written before the sky index existed have no `HPX_*` columns yet: they are computed once here.
+
+# COMMAND ----------
+
+@pandas_udf("long")
+def healpix_udf(ra: pd.Series, dec: pd.Series) -> pd.Series:
+    pixels = pd.Series(ang2pix(INDEX_ORDER, ra.fillna(0).to_numpy(), dec.fillna(0).to_numpy()), dtype="Int64")
+    return pixels.mask(ra.isna() | dec.isna())
+
+# The consumer keeps appending to the table: the columns are added in place and only the
+# unindexed rows are updated, the live table is never rewritten
+missing = [f"HPX_{order}" for order in ORDERS if f"HPX_{order}" not in spark.read.table(f_table).columns]
+if missing:
+    spark.sql(f"ALTER TABLE {f_table} ADD COLUMNS ({', '.join(f'{c} BIGINT' for c in missing)})")
+
+from delta.tables import DeltaTable
+
+match_cols = ["TGT_NUM", "SEG_NUM", "NOTICE_DATE", "NEXT_POINT_RA", "NEXT_POINT_DEC"]
+unindexed = (spark.read.table(f_table)
+             .where(col(f"HPX_{INDEX_ORDER}").isNull() & col("NEXT_POINT_RA").isNotNull() & col("NEXT_POINT_DEC").isNotNull())
+             .select(*match_cols).distinct()
+             .withColumn(f"HPX_{INDEX_ORDER}", healpix_udf("NEXT_POINT_RA", "NEXT_POINT_DEC")))
+for order in ORDERS:
+    # Nested scheme: the pixel at a coarser order is a bit shift of the finest one
+    unindexed = unindexed.withColumn(f"HPX_{order}", shiftright(col(f"HPX_{INDEX_ORDER}"), 2 * (INDEX_ORDER - order)))
+
+(DeltaTable.forName(spark, f_table).alias("t")
+ .merge(unindexed.alias("s"), " AND ".join([f"t.{c} <=> s.{c}" for c in match_cols] + [f"t.HPX_{INDEX_ORDER} IS NULL"]))
+ .whenMatchedUpdate(set={f"HPX_{order}": f"s.HPX_{order}" for order in ORDERS})
+ .execute())
+
+# Liquid clustering: new notices appended by the consumer are clustered by the next OPTIMIZE
+spark.sql(f"ALTER TABLE {f_table} CLUSTER BY (HPX_{INDEX_ORDER})")
+spark.sql(f"OPTIMIZE {f_table}")
+
+# COMMAND ----------
+
+# MAGIC %md
+# MAGIC ## SQL functions
+# MAGIC `angular_distance_deg` is the exact (haversine) distance. `swift_cone_search` is the simple SQL entry point, but it does **not** use the HEALPix index: it only prunes files by the declination band (folded into literals with constant arguments) and computes the distance on every row of the band.
+# MAGIC
+# MAGIC For the indexed path in SQL, `healpix_cone_ranges` (a Python UDTF registered in this session, see below) returns the `HPX_10` ranges of a cone to join on, like the Python `cone_search`.
+
+# COMMAND ----------
+
+spark.sql(f"""
+CREATE OR REPLACE FUNCTION {f_schema}.angular_distance_deg(ra1 DOUBLE, dec1 DOUBLE, ra2 DOUBLE, dec2 DOUBLE)
+RETURNS DOUBLE
+COMMENT 'Great-circle distance in degrees between two (RA, Dec) positions in degrees'
+RETURN degrees(2 * asin(sqrt(least(1D,
+  pow(sin(radians(dec2 - dec1) / 2), 2) + cos(radians(dec1)) * cos(radians(dec2)) * pow(sin(radians(ra2 - ra1) / 2), 2)
+))))
+""")
+
+spark.sql(f"""
+CREATE OR REPLACE FUNCTION {f_schema}.swift_cone_search(ra DOUBLE, dec DOUBLE, radius_deg DOUBLE)
+RETURNS TABLE (TGT_NAME STRING, TGT_NUM BIGINT, SEG_NUM INT, NOTICE_DATE TIMESTAMP, NEXT_POINT_RA DOUBLE, NEXT_POINT_DEC DOUBLE, MERIT DOUBLE, OBS_TIME DOUBLE, distance_deg DOUBLE)
+COMMENT 'Swift pointings within radius_deg of (ra, dec). Prunes by declination only, not by the HPX_10 index'
+RETURN
+  SELECT TGT_NAME, TGT_NUM, SEG_NUM, NOTICE_DATE, NEXT_POINT_RA, NEXT_POINT_DEC, MERIT, OBS_TIME,
+         {f_schema}.angular_distance_deg(ra, dec, NEXT_POINT_RA, NEXT_POINT_DEC) AS distance_deg
+  FROM {f_table}
+  WHERE NEXT_POINT_DEC BETWEEN dec - radius_deg AND dec + radius_deg
+    AND {f_schema}.angular_distance_deg(ra, dec, NEXT_POINT_RA, NEXT_POINT_DEC) <= radius_deg
+""")
+
+# COMMAND ----------
+
+display(spark.sql(f"SELECT * FROM {f_schema}.swift_cone_search(213.407, 70.472, 2) ORDER BY distance_deg"))
+
+# COMMAND ----------
+
+# MAGIC %md
+# MAGIC ### Indexed cone search in SQL
+# MAGIC Unity Catalog SQL functions cannot compute the HEALPix ranges, so they come from a Python UDTF (session-scoped: register it in the notebook or job that runs the query). The ranges are joined on `HPX_10`; the distance is only computed on the rows of the candidate pixels.
+
+# COMMAND ----------
+
+from pyspark.sql.functions import udtf
+
+@udtf(returnType="lo BIGINT, hi BIGINT")
+class HealpixConeRanges:
+    def eval(self, ra: float, dec: float, radius_deg: float):
+        for lo, hi in cone_ranges(ra, dec, radius_deg):
+            yield lo, hi
+
+spark.udtf.register("healpix_cone_ranges", HealpixConeRanges)
+
+display(spark.sql(f"""
+SELECT n.TGT_NAME, n.TGT_NUM, n.SEG_NUM, n.NOTICE_DATE, n.NEXT_POINT_RA, n.NEXT_POINT_DEC,
+       {f_schema}.angular_distance_deg(213.407, 70.472, n.NEXT_POINT_RA, n.NEXT_POINT_DEC) AS distance_deg
+FROM healpix_cone_ranges(213.407, 70.472, 2.0) r
+JOIN {f_table} n ON n.HPX_{INDEX_ORDER} BETWEEN r.lo AND r.hi
+WHERE {f_schema}.angular_distance_deg(213.407, 70.472, n.NEXT_POINT_RA, n.NEXT_POINT_DEC) <= 2.0
+ORDER BY distance_deg
+"""))
+
+# COMMAND ----------
+
+# MAGIC %md
+# MAGIC ## Python API and comparison with a full scan
+# MAGIC The query profile (Spark UI) shows the number of files read and pruned for each query.
+
+# COMMAND ----------
+
+ra, dec, radius_deg = 213.407, 70.472, 2.0
+print(f"{len(cone_ranges(ra, dec, radius_deg))} HPX_{INDEX_ORDER} ranges")
+
+notices = spark.read.table(f_table)
+
+start = time.perf_counter()
+matches = cone_search(notices, ra, dec, radius_deg).toPandas()
+indexed_s = time.perf_counter() - start
+
+# Previous approach: every notice is collected and filtered with trigonometry in pandas
+start = time.perf_counter()
+pdf = notices.select("TGT_NUM", "SEG_NUM", "NOTICE_DATE", "NEXT_POINT_RA", "NEXT_POINT_DEC").toPandas()
+brute = pdf[angular_distance_deg(ra, dec, pdf["NEXT_POINT_RA"], pdf["NEXT_POINT_DEC"]) <= radius_deg]
+full_scan_s = time.perf_counter() - start
+
+# Same result: the candidate pixels are a superset of the cone
+key = ["TGT_NUM", "SEG_NUM", "NOTICE_DATE"]
+assert sorted(map(tuple, matches[key].values.tolist())) == sorted(map(tuple, brute[key].values.tolist()))
+
+print(f"{len(matches)} pointings within {radius_deg}°: cone search {indexed_s:.2f} s, full scan {full_scan_s:.2f} s")
+display(matches.sort_values("distance_deg"))
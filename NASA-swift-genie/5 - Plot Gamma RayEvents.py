@@ -4,48 +4,56 @@
 
 # COMMAND ----------
 
+# MAGIC %md
+# MAGIC The notices are binned on the sky in Spark (see [sky_bins.py]($./sky_bins.py)): only the bins, or a capped sample of the notices, are collected and plotted, so the driver memory and the size of the page do not grow with the table.
+
+# COMMAND ----------
+
 from pyspark.sql.functions import col
 import matplotlib.pyplot as plt
 from astropy import units as u
 from astropy.coordinates import SkyCoord
 import mpld3
 import numpy as np
+from sky_bins import bin_pointings, adaptive_sample
+
+# Bin width in degrees: 360 / bin_deg * 180 / bin_deg bins at most
+bin_deg = 3
+max_points = 2000
 
 # Read the Unity Catalog table
-swift_notices_df = spark.read.table("demo_frank.nasa.raw_events")
+# The notices are parsed and typed at ingest (see gcn_parser.py)
+swift_notices_df = spark.read.table("demo_frank.nasa.swift_notices").where(col("NEXT_POINT_RA").isNotNull() & col("NEXT_POINT_DEC").isNotNull())
 
-# Convert the DataFrame to a Pandas DataFrame for plotting
-pdf = swift_notices_df.toPandas()
+# Counts, exposure and max merit per bin, aggregated in Spark
+bins = bin_pointings(swift_notices_df, bin_deg).toPandas()
+print(f"{bins['notices'].sum()} notices in {len(bins)} bins")
 
-# Extract the required columns
-ra = pdf['NEXT_POINT_RA'].str.extract(r'([\d\.]+)d', expand=False).astype(float)
-dec = pdf['NEXT_POINT_DEC'].str.extract(r'([-\d\.]+)d', expand=False).astype(float)
-merit = pdf['MERIT'].astype(float)  # Convert merit to numeric
-target_name = pdf['TGT_NAME']
+# COMMAND ----------
 
-# Extract the observation time in minutes
-obs_time = pdf['OBS_TIME'].str.extract(r'(?:\d+\.\d+\s+\[sec\]\s+\(=)(\d+\.\d+)(?:\s+\[min\]\))', expand=False).astype(float)
+# Create a SkyCoord object for the bin centers
+bin_coords = SkyCoord(ra=bins['ra_center'].to_numpy()*u.deg, dec=bins['dec_center'].to_numpy()*u.deg, frame='icrs')
 
-# Create a SkyCoord object for the target coordinates
-target_coords = SkyCoord(ra=ra*u.deg, dec=dec*u.deg, frame='icrs')
+# Exposure per bin in hours
+exposure_h = bins['exposure_s'] / 3600
 
-# Create a scatter plot
+# Create a scatter plot: one point per bin, sized by exposure, colored by the highest merit
 fig, ax = plt.subplots(figsize=(10, 8))
-scatter = ax.scatter(target_coords.ra.deg, target_coords.dec.deg, s=obs_time, c=merit, cmap='viridis', alpha=0.7)
+scatter = ax.scatter(bin_coords.ra.deg, bin_coords.dec.deg, s=20 + 200 * exposure_h / exposure_h.max(), c=bins['max_merit'], cmap='viridis', alpha=0.7)
 
 # Set the plot title and labels
-ax.set_title('SWIFT Pointing Directions')
+ax.set_title(f'SWIFT Pointing Directions ({bin_deg}° equal-area bins)')
 ax.set_xlabel('Right Ascension (deg)')
 ax.set_ylabel('Declination (deg)')
 
 # Create interactive labels using mpld3
-labels = target_name.tolist()
+labels = [f"{r.notices} notices, {r.exposure_s / 3600:.1f} h, top: {r.top_target} (merit {r.max_merit:g})" for r in bins.itertuples()]
 tooltip = mpld3.plugins.PointLabelTooltip(scatter, labels=labels)
 mpld3.plugins.connect(fig, tooltip)
 
 # Create a color bar
 cbar = fig.colorbar(scatter, ax=ax)
-cbar.set_label('Merit')
+cbar.set_label('Max merit')
 
 # Add zooming functionality using the zoom_button plugin
 zoom_button = mpld3.plugins.MousePosition(fontsize=12)
@@ -53,3 +61,29 @@ mpld3.plugins.connect(fig, zoom_button)
 
 # Display the interactive plot using mpld3
 mpld3.display()
+
+# COMMAND ----------
+
+# MAGIC %md
+# MAGIC Individual pointings: at most `max_points` notices, the same number per occupied bin (highest merit first), so isolated pointings stay visible and dense regions are thinned.
+
+# COMMAND ----------
+
+pdf = adaptive_sample(swift_notices_df, max_points, bin_deg).select("NEXT_POINT_RA", "NEXT_POINT_DEC", "MERIT", "OBS_TIME", "TGT_NAME").toPandas()
+
+# Observation time in minutes
+obs_time = pdf['OBS_TIME'] / 60
+
+fig, ax = plt.subplots(figsize=(10, 8))
+scatter = ax.scatter(pdf['NEXT_POINT_RA'], pdf['NEXT_POINT_DEC'], s=obs_time, c=pdf['MERIT'], cmap='viridis', alpha=0.7)
+ax.set_title(f'SWIFT Pointing Directions (sample of {len(pdf)} notices)')
+ax.set_xlabel('Right Ascension (deg)')
+ax.set_ylabel('Declination (deg)')
+
+tooltip = mpld3.plugins.PointLabelTooltip(scatter, labels=pdf['TGT_NAME'].tolist())
+mpld3.plugins.connect(fig, tooltip)
+cbar = fig.colorbar(scatter, ax=ax)
+cbar.set_label('Merit')
+mpld3.plugins.connect(fig, mpld3.plugins.MousePosition(fontsize=12))
+
+mpld3.display()
@@ -0,0 +1,161 @@
+# Databricks notebook source
+# MAGIC %md
+# MAGIC # GCN ingest benchmark without Kafka credentials
+# MAGIC The consumer loop of the [GCN Kafka Client]($./1 - GCN Kafka Client) (see [gcn_consumer.py]($./gcn_consumer.py)) runs here against an in-process broker ([gcn_fake.py]($./gcn_fake.py)). A replay producer synthesizes SWIFT_POINTDIR notices at a fixed rate.
+# MAGIC
+# MAGIC - **Sustained throughput**: the notices written per second while the producer runs at a given rate. A rate the consumer cannot keep up with shows up as a growing latency.
+# MAGIC - **End-to-end latency**: from the Kafka timestamp of a notice (produced) to the end of the Delta commit that contains it (visible in the table).
+# MAGIC - **Catch-up throughput**: a backlog produced upfront and consumed as fast as possible, like a restart after a downtime.
+# MAGIC - **Restart**: a consumer stopped halfway resumes from the offsets checkpointed with the table, and re-delivered notices are not duplicated.
+# MAGIC - **Many topics**: per-topic throughput, latency and lag of the multi-topic consumer.
+# MAGIC
+# MAGIC Notices are written to a scratch table, which is dropped at the end.
+
+# COMMAND ----------
+
+d_catalog = "demo_frank"
+d_schema = "nasa"
+d_table = "swift_notices_benchmark"
+
+f_schema = f"{d_catalog}.{d_schema}"
+f_table = f"{f_schema}.{d_table}"
+
+topic = "gcn.classic.text.SWIFT_POINTDIR"
+rates_per_s = [10, 100, 1000, 5000]
+duration_s = 60
+backlog = 100_000
+
+# COMMAND ----------
+
+import pandas as pd
+from pyspark.sql.pandas.types import from_arrow_schema
+from gcn_parser import parse_notice, SCHEMA as notice_arrow_schema
+from gcn_writer import BufferedDeltaWriter
+from gcn_consumer import run_consumer, resume_from
+from gcn_fake import FakeBroker, FakeConsumer, FakeTopicPartition, ReplayProducer
+
+notice_schema = from_arrow_schema(notice_arrow_schema)
+
+def run(rate_per_s, duration_s=None, count=None, max_rows=1000, max_delay_s=5.0, upfront=False):
+    spark.sql(f"DROP TABLE IF EXISTS {f_table}")
+    broker = FakeBroker()
+    producer = ReplayProducer(broker, topic, rate_per_s=rate_per_s, duration_s=duration_s, count=count)
+    consumer = FakeConsumer(broker, {'group.id': f'{f_table}-consumer', 'auto.offset.reset': 'earliest', 'enable.auto.commit': False})
+
+    def commit_offsets(offsets):
+        consumer.commit(offsets=[FakeTopicPartition(t, p, o) for t, p, o in offsets], asynchronous=False)
+
+    writer = BufferedDeltaWriter(spark, f_table, max_rows=max_rows, max_delay_s=max_delay_s, commit_offsets=commit_offsets, schema=notice_schema)
+    producer.start()
+    if upfront:
+        # Backlog: everything is in the topic before the consumer starts
+        producer.join()
+    consumer.subscribe([topic])
+    stats = run_consumer(consumer, writer, parse=parse_notice, max_messages=max_rows,
+                         stop=lambda s: not producer.running and s.messages >= producer.produced, log=None)
+
+    visible = spark.read.table(f_table).count()
+    assert visible == producer.produced, (visible, producer.produced)
+    return {"rate_per_s": rate_per_s, "produced": producer.produced, "visible_rows": visible, "flushes": writer.stats["flushes"], **stats.summary()}
+
+# COMMAND ----------
+
+# MAGIC %md
+# MAGIC ## Sustained rate
+# MAGIC With `max_delay_s = 5`, the latency at low rates is bounded by the flush delay; at high rates by the time to fill and write `max_rows` notices.
+
+# COMMAND ----------
+
+results = [run(rate, duration_s=duration_s) for rate in rates_per_s]
+display(pd.DataFrame(results))
+
+# COMMAND ----------
+
+# MAGIC %md
+# MAGIC ## Batch size vs. latency at 1000 notices/s
+
+# COMMAND ----------
+
+results = [run(1000, duration_s=duration_s, max_rows=max_rows, max_delay_s=1.0) for max_rows in [100, 1000, 10000]]
+display(pd.DataFrame(results).assign(max_rows=[100, 1000, 10000]))
+
+# COMMAND ----------
+
+# MAGIC %md
+# MAGIC ## Catch-up after a downtime
+
+# COMMAND ----------
+
+display(pd.DataFrame([run(100_000, count=backlog, max_rows=10000, upfront=True)]))
+
+# COMMAND ----------
+
+# MAGIC %md
+# MAGIC ## Restart
+# MAGIC The first consumer stops after half of the backlog. The second one uses a new consumer group, as if the Kafka group offsets were lost, and resumes from the offsets table. Then a third consumer replays the whole topic from the beginning, and the MERGE on (TGT_NUM, SEG_NUM, NOTICE_DATE) ignores every notice.
+
+# COMMAND ----------
+
+import time
+
+merge_keys = ["TGT_NUM", "SEG_NUM", "NOTICE_DATE"]
+offsets_table = f"{f_table}_offsets"
+spark.sql(f"DROP TABLE IF EXISTS {f_table}")
+spark.sql(f"DROP TABLE IF EXISTS {offsets_table}")
+
+broker = FakeBroker()
+producer = ReplayProducer(broker, topic, rate_per_s=100_000, count=20_000).start()
+producer.join()
+
+def restart(group_id, checkpoint, stop):
+    consumer = FakeConsumer(broker, {'group.id': group_id, 'auto.offset.reset': 'earliest', 'enable.auto.commit': False})
+    writer = BufferedDeltaWriter(spark, f_table, max_rows=5000, schema=notice_schema, merge_keys=merge_keys, offsets_table=offsets_table,
+                                 commit_offsets=lambda offsets: consumer.commit(offsets=[FakeTopicPartition(*o) for o in offsets]))
+    start = time.perf_counter()
+    consumer.subscribe([topic], on_assign=resume_from(writer.load_offsets() if checkpoint else {}))
+    stats = run_consumer(consumer, writer, max_messages=5000, stop=stop, log=None)
+    return {"group": group_id, "checkpoint": checkpoint, "messages": stats.messages, "seconds": time.perf_counter() - start,
+            "table_rows": spark.read.table(f_table).count()}
+
+restarts = [
+    restart("first", False, lambda s: s.messages >= producer.produced // 2),
+    restart("second", True, lambda s: s.messages >= producer.produced - producer.produced // 2),
+    restart("replay", False, lambda s: s.messages >= producer.produced),
+]
+display(pd.DataFrame(restarts))
+assert [r["table_rows"] for r in restarts] == [producer.produced // 2, producer.produced, producer.produced]
+
+# COMMAND ----------
+
+# MAGIC %md
+# MAGIC ## Many topics
+# MAGIC The multi-topic consumer of the [GCN Multi-Topic Consumer]($./7 - GCN Multi-Topic Consumer) notebook, following 24 topics at 100 notices/s each: every topic has its own table, and the per-topic lag should stay close to zero.
+
+# COMMAND ----------
+
+from gcn_consumer import MultiTopicConsumer
+
+many_topics = [f"gcn.classic.text.BENCHMARK_{i}" for i in range(24)]
+broker = FakeBroker()
+producers = [ReplayProducer(broker, t, rate_per_s=100, duration_s=duration_s, seed=i) for i, t in enumerate(many_topics)]
+consumer = FakeConsumer(broker, {'group.id': 'many-topics', 'auto.offset.reset': 'earliest', 'enable.auto.commit': False})
+consumer.subscribe(many_topics)
+
+def sink_factory(topic, parser):
+    return BufferedDeltaWriter(spark, f"{f_table}_{topic.rsplit('_', 1)[-1]}", max_rows=1000, max_delay_s=5.0,
+                               commit_offsets=lambda offsets: consumer.commit(offsets=[FakeTopicPartition(*o) for o in offsets]))
+
+multi = MultiTopicConsumer(consumer, sink_factory, workers=4, log=None)
+for producer in producers:
+    producer.start()
+multi.run(stop=lambda m: all(not p.running for p in producers) and sum(s.messages for s in m.stats.values()) >= sum(p.produced for p in producers))
+multi.close()
+display(multi.metrics())
+
+for topic in many_topics:
+    spark.sql(f"DROP TABLE IF EXISTS {f_table}_{topic.rsplit('_', 1)[-1]}")
+
+# COMMAND ----------
+
+spark.sql(f"DROP TABLE IF EXISTS {f_table}")
+spark.sql(f"DROP TABLE IF EXISTS {offsets_table}")
@@ -0,0 +1,108 @@
+# Databricks notebook source
+# MAGIC %pip install  --quiet gcn-kafka
+# MAGIC dbutils.library.restartPython()
+
+# COMMAND ----------
+
+# MAGIC %md
+# MAGIC # Multi-topic GCN consumer
+# MAGIC One process follows many GCN topics (see `MultiTopicConsumer` in [gcn_consumer.py]($./gcn_consumer.py)):
+# MAGIC - every topic gets a parser from the registry in [gcn_topics.py]($./gcn_topics.py): the typed SWIFT_POINTDIR parser, a generic parser for the other classic text notices, JSON for the new notices and LVK alerts;
+# MAGIC - messages are decoded and parsed in a pool of worker processes;
+# MAGIC - every topic is written to its own Delta table with its own micro-batching and offset checkpoints, and the due tables are committed in parallel;
+# MAGIC - `metrics()` shows per-topic throughput, latency and lag.
+
+# COMMAND ----------
+
+d_catalog = "demo_frank"
+d_schema = "nasa"
+
+f_schema = f"{d_catalog}.{d_schema}"
+
+topics = [
+    'gcn.classic.text.SWIFT_POINTDIR',
+    'gcn.classic.text.SWIFT_BAT_GRB_POS_ACK',
+    'gcn.classic.text.SWIFT_XRT_POSITION',
+    'gcn.classic.text.SWIFT_UVOT_POS',
+    'gcn.classic.text.FERMI_GBM_ALERT',
+    'gcn.classic.text.FERMI_GBM_FLT_POS',
+    'gcn.classic.text.FERMI_GBM_GND_POS',
+    'gcn.classic.text.FERMI_GBM_FIN_POS',
+    'gcn.classic.text.FERMI_LAT_OFFLINE',
+    'gcn.classic.text.ICECUBE_ASTROTRACK_GOLD',
+    'gcn.classic.text.ICECUBE_ASTROTRACK_BRONZE',
+    'gcn.notices.icecube.lvk_nu_track_search',
+    'gcn.notices.einstein_probe.wxt.alert',
+    'igwn.gwalert',
+]
+
+max_batch_rows = 1000
+max_batch_delay_s = 5
+workers = 4
+
+def table_for(topic):
+    # SWIFT_POINTDIR keeps the table of the single-topic consumer
+    if topic == 'gcn.classic.text.SWIFT_POINTDIR':
+        return f"{f_schema}.swift_notices"
+    return f"{f_schema}.gcn_" + topic.replace('gcn.', '').replace('.', '_').lower()
+
+# COMMAND ----------
+
+from confluent_kafka import TopicPartition
+from gcn_kafka import Consumer
+from pyspark.sql.pandas.types import from_arrow_schema
+from gcn_writer import BufferedDeltaWriter
+from gcn_consumer import MultiTopicConsumer, resume_from
+from gcn_topics import parser_for
+
+client_id = dbutils.secrets.get(scope="nasa-gcn", key="client_id")
+client_secret = dbutils.secrets.get(scope="nasa-gcn", key="client_secret")
+
+config = {'group.id': f'{f_schema}-multi-topic-consumer',
+          'auto.offset.reset': 'earliest',
+          'enable.auto.commit': False }
+
+consumer = Consumer(config, client_id=client_id, client_secret=client_secret)
+
+def commit_offsets(offsets):
+    consumer.commit(offsets=[TopicPartition(topic, partition, offset) for topic, partition, offset in offsets], asynchronous=False)
+
+def sink_factory(topic, parser):
+    table = table_for(topic)
+    return BufferedDeltaWriter(spark, table, max_rows=max_batch_rows, max_delay_s=max_batch_delay_s, commit_offsets=commit_offsets,
+                               schema=from_arrow_schema(parser.schema) if parser.schema is not None else None,
+                               merge_keys=parser.merge_keys, offsets_table=f"{table}_multi_topic_offsets")
+
+# Resume every topic from the offsets checkpointed with its table. The checkpoints are this consumer's own
+# (swift_notices_offsets belongs to 1 - GCN Kafka Client): the MERGE keeps the two from storing a notice twice
+checkpoint = {}
+for topic in topics:
+    checkpoint.update(sink_factory(topic, parser_for(topic)).load_offsets())
+
+consumer.subscribe(topics, on_assign=resume_from(checkpoint))
+multi = MultiTopicConsumer(consumer, sink_factory, workers=workers, max_messages=5 * max_batch_rows)
+
+# COMMAND ----------
+
+# MAGIC %md
+# MAGIC The consumer runs in a background thread, so the metrics can be displayed from the next cell while it runs.
+
+# COMMAND ----------
+
+import threading
+
+stop_event = threading.Event()
+consumer_thread = threading.Thread(target=multi.run, kwargs={"stop": lambda m: stop_event.is_set()}, daemon=True)
+consumer_thread.start()
+
+# COMMAND ----------
+
+display(multi.metrics())
+
+# COMMAND ----------
+
+# Stop: the buffered notices of every topic are flushed before the thread ends
+stop_event.set()
+consumer_thread.join()
+multi.close()
+consumer.close()
@@ -0,0 +1,290 @@
+"""
+Consumer loop of the GCN ingest: Kafka messages -> parser -> BufferedDeltaWriter.
+
+The loop of the consumer notebook, usable with the real gcn_kafka Consumer or with gcn_fake.FakeConsumer.
+It records the end-to-end latency of every notice: from its Kafka timestamp (produce time) to the end of
+the flush that made it visible in Delta.
+
+    stats = run_consumer(consumer, writer, stop=lambda stats: stats.rows >= 10000)
+    stats.summary()
+"""
+
+import copy
+import datetime
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from gcn_parser import parse_notice
+
+
+class IngestStats:
+    """Messages, rows and per-notice end-to-end latencies of a consumer run."""
+
+    def __init__(self):
+        self.started = time.time()
+        self.messages = 0
+        self.errors = 0
+        self.rows = 0
+        self.latencies_s: List[float] = []
+
+    @property
+    def elapsed_s(self) -> float:
+        return time.time() - self.started
+
+    def summary(self) -> dict:
+        latencies = np.array(self.latencies_s) if self.latencies_s else np.array([np.nan])
+        return {
+            "messages": self.messages,
+            "errors": self.errors,
+            "rows": self.rows,
+            "elapsed_s": self.elapsed_s,
+            "rows_per_s": self.rows / self.elapsed_s if self.elapsed_s else 0.0,
+            "latency_p50_s": float(np.percentile(latencies, 50)),
+            "latency_p95_s": float(np.percentile(latencies, 95)),
+            "latency_p99_s": float(np.percentile(latencies, 99)),
+            "latency_max_s": float(np.max(latencies)),
+        }
+
+
+def resume_from(offsets: Dict[Tuple[str, int], int]):
+    """
+    `on_assign` callback for `consumer.subscribe(topics, on_assign=...)`: partitions start at the offsets
+    checkpointed with the table (BufferedDeltaWriter.load_offsets) instead of the consumer group offsets.
+    """
+    def on_assign(consumer, partitions):
+        for tp in partitions:
+            if (tp.topic, tp.partition) in offsets:
+                tp.offset = offsets[(tp.topic, tp.partition)]
+        consumer.assign(partitions)
+
+    return on_assign
+
+
+def run_consumer(
+    consumer,
+    writer,
+    parse: Callable[[str], dict] = parse_notice,
+    max_messages: int = 1000,
+    timeout: float = 1.0,
+    stop: Optional[Callable[[IngestStats], bool]] = None,
+    log: Optional[Callable[[str], None]] = print,
+) -> IngestStats:
+    """Consume, parse and write until `stop(stats)` returns True (forever without `stop`); the last batch is flushed."""
+    stats = IngestStats()
+    # Kafka timestamps (ms) of the buffered notices
+    pending_ts: List[int] = []
+
+    def flush():
+        written = writer.flush()
+        now_ms = time.time() * 1000
+        stats.rows += written
+        stats.latencies_s.extend((now_ms - ts) / 1000 for ts in pending_ts)
+        pending_ts.clear()
+        if written and log:
+            log(f'{datetime.datetime.now()} - wrote {written} notices, {writer.stats["rows"]} in {writer.stats["flushes"]} commits')
+
+    while not (stop and stop(stats)):
+        # Short poll: an idle topic still gets its buffered notices flushed within the writer's max_delay_s
+        for message in consumer.consume(num_messages=max_messages, timeout=timeout):
+            if message.error():
+                stats.errors += 1
+                if log:
+                    log(str(message.error()))
+                continue
+
+            stats.messages += 1
+            writer.add(parse(message.value().decode('UTF-8')), message.topic(), message.partition(), message.offset())
+            pending_ts.append(message.timestamp()[1])
+
+        if writer.due():
+            flush()
+
+    flush()
+    return stats
+
+
+def _parse_chunk(parse: Callable[[str], dict], values: List[bytes]) -> Tuple[List[Optional[dict]], List[str]]:
+    # Runs in a worker: None (and an error message) for the messages that fail to parse
+    rows, errors = [], []
+    for value in values:
+        try:
+            rows.append(parse(value.decode("utf-8")))
+        except Exception as e:
+            rows.append(None)
+            errors.append(f"{type(e).__name__}: {e}")
+    return rows, errors
+
+
+class TopicStats:
+    def __init__(self):
+        self.messages = 0
+        self.errors = 0
+        self.rows = 0
+        self.parse_s = 0.0
+        self.flushes = 0
+        self.last_flush_s = 0.0
+        self.last_error: Optional[str] = None
+        self.latencies_s: List[float] = []
+        # (partition) -> next offset consumed / written to the sink
+        self.consumed: Dict[int, int] = {}
+        self.written: Dict[int, int] = {}
+
+
+class MultiTopicConsumer:
+    """
+    One consumer for many topics: every consumed batch is grouped by topic and decoded / parsed in a worker
+    pool with the parser of the topic (gcn_topics registry); each topic has its own sink (a BufferedDeltaWriter
+    from `sink_factory(topic, parser)`) with its own micro-batching, and the due sinks are flushed in parallel.
+    A sink commits the offsets of its topic's partitions after its own flush.
+
+        consumer.subscribe(topics)
+        multi = MultiTopicConsumer(consumer, sink_factory, workers=4)
+        multi.run()          # in the notebook; multi.metrics() from another cell / thread
+
+    `stats` and `sinks` are only changed under `_lock`, so `metrics()` reads a consistent snapshot while `run` goes on.
+    """
+
+    def __init__(self, consumer, sink_factory, parser_for=None, workers: int = 4, processes: bool = True,
+                 max_messages: int = 5000, chunk_size: int = 500, timeout: float = 1.0,
+                 log: Optional[Callable[[str], None]] = print):
+        from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+        if parser_for is None:
+            from gcn_topics import parser_for
+        self.consumer = consumer
+        self.sink_factory = sink_factory
+        self.parser_for = parser_for
+        self.max_messages, self.chunk_size, self.timeout, self.log = max_messages, chunk_size, timeout, log
+        # Parsing is CPU-bound Python: processes run it in parallel, threads only overlap it with I/O
+        self.pool = (ProcessPoolExecutor if processes and workers > 1 else ThreadPoolExecutor)(max_workers=max(workers, 1))
+        # Flushes are Spark jobs: threads are enough to run the commits of several tables at once
+        self.flush_pool = ThreadPoolExecutor(max_workers=8)
+        self.sinks: Dict[str, object] = {}
+        self.stats: Dict[str, TopicStats] = {}
+        self._pending_ts: Dict[str, List[int]] = {}
+        self._lock = threading.Lock()
+        self.started = time.time()
+
+    def _sink(self, topic: str):
+        if topic not in self.sinks:
+            sink = self.sink_factory(topic, self.parser_for(topic))
+            with self._lock:
+                self.sinks[topic] = sink
+                self.stats[topic] = TopicStats()
+                self._pending_ts[topic] = []
+        return self.sinks[topic]
+
+    def _process(self, messages: list):
+        by_topic: Dict[str, list] = {}
+        for message in messages:
+            if message.error():
+                if self.log:
+                    self.log(str(message.error()))
+                continue
+            by_topic.setdefault(message.topic(), []).append(message)
+
+        # Submit every chunk first, then add the results in order: offsets stay monotonic per partition
+        futures = []
+        for topic, topic_messages in by_topic.items():
+            parse = self.parser_for(topic).parse
+            for i in range(0, len(topic_messages), self.chunk_size):
+                chunk = topic_messages[i:i + self.chunk_size]
+                futures.append((topic, chunk, time.monotonic(), self.pool.submit(_parse_chunk, parse, [m.value() for m in chunk])))
+
+        for topic, chunk, submitted, future in futures:
+            rows, errors = future.result()
+            sink = self._sink(topic)
+            with self._lock:
+                stats = self.stats[topic]
+                stats.parse_s += time.monotonic() - submitted
+                stats.messages += len(chunk)
+                stats.errors += len(errors)
+                if errors:
+                    stats.last_error = errors[-1]
+                for message, row in zip(chunk, rows):
+                    stats.consumed[message.partition()] = message.offset() + 1
+                    if row is not None:
+                        sink.add(row, topic, message.partition(), message.offset())
+                        self._pending_ts[topic].append(message.timestamp()[1])
+
+    def _flush(self, topic: str):
+        sink = self.sinks[topic]
+        start = time.monotonic()
+        written = sink.flush()
+        now_ms = time.time() * 1000
+        with self._lock:
+            stats = self.stats[topic]
+            stats.rows += written
+            stats.flushes += 1
+            stats.last_flush_s = time.monotonic() - start
+            stats.latencies_s.extend((now_ms - ts) / 1000 for ts in self._pending_ts[topic])
+            # Keep the latest latencies only
+            del stats.latencies_s[:-10000]
+            self._pending_ts[topic] = []
+            if written:
+                for _, partition, offset in sink.committed_offsets:
+                    stats.written[partition] = offset
+        return written
+
+    def flush(self, all_topics: bool = False):
+        """Flushes the due sinks (all of them with `all_topics`) in parallel."""
+        topics = [t for t, sink in self.sinks.items() if sink.pending and (all_topics or sink.due())]
+        for topic, written in zip(topics, self.flush_pool.map(self._flush, topics)):
+            if written and self.log:
+                self.log(f"{datetime.datetime.now()} - {topic}: wrote {written} notices")
+
+    def run(self, stop: Optional[Callable[["MultiTopicConsumer"], bool]] = None):
+        """Consumes until `stop(self)` returns True (forever without `stop`); every buffered notice is flushed."""
+        try:
+            while not (stop and stop(self)):
+                self._process(self.consumer.consume(num_messages=self.max_messages, timeout=self.timeout))
+                self.flush()
+        finally:
+            self.flush(all_topics=True)
+
+    def close(self):
+        self.pool.shutdown()
+        self.flush_pool.shutdown()
+
+    def metrics(self, lag: bool = True):
+        """
+        One row per topic: messages, rows, errors, rows/s since the start, parse time, flush time, end-to-end
+        latency, and the lag in messages behind the end of the topic, of the consumer and of the sink
+        (high watermark - next offset consumed / written). Lag queries the broker for each assigned partition.
+        """
+        import numpy as np
+        import pandas as pd
+
+        high: Dict[Tuple[str, int], int] = {}
+        if lag:
+            for tp in self.consumer.assignment():
+                high[(tp.topic, tp.partition)] = self.consumer.get_watermark_offsets(tp, timeout=5)[1]
+
+        with self._lock:
+            snapshot = copy.deepcopy(self.stats)
+
+        elapsed = time.time() - self.started
+        rows = []
+        for topic in sorted(set(snapshot) | {t for t, _ in high}):
+            stats = snapshot.get(topic, TopicStats())
+            partitions = [p for t, p in high if t == topic]
+            latencies = np.array(stats.latencies_s) if stats.latencies_s else np.array([np.nan])
+            rows.append({
+                "topic": topic,
+                "messages": stats.messages,
+                "rows": stats.rows,
+                "errors": stats.errors,
+                "rows_per_s": stats.rows / elapsed if elapsed else 0.0,
+                "parse_s": stats.parse_s,
+                "flushes": stats.flushes,
+                "last_flush_s": stats.last_flush_s,
+                "latency_p50_s": float(np.percentile(latencies, 50)),
+                "latency_p95_s": float(np.percentile(latencies, 95)),
+                "consumer_lag": sum(max(high[(topic, p)] - stats.consumed.get(p, 0), 0) for p in partitions) if lag else None,
+                "sink_lag": sum(max(high[(topic, p)] - stats.written.get(p, 0), 0) for p in partitions) if lag else None,
+                "last_error": stats.last_error,
+            })
+        return pd.DataFrame(rows)
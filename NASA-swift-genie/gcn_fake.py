@@ -0,0 +1,249 @@
+"""
+In-process stand-in for the GCN Kafka broker, to run and benchmark the consumer without credentials.
+
+`FakeBroker` keeps the messages of each topic partition in memory and the committed offsets of each
+consumer group. `FakeConsumer` has the subset of the confluent_kafka / gcn_kafka `Consumer` API used by
+the consumer notebook (subscribe with on_assign, assign, assignment, consume, commit, committed, get_watermark_offsets,
+close), and its
+messages the `Message` methods (value, topic, partition, offset, timestamp, error).
+`ReplayProducer` synthesizes SWIFT_POINTDIR notices (gcn_parser.random_notice / format_notice) into a
+topic at a configurable rate, in a background thread.
+
+    broker = FakeBroker()
+    producer = ReplayProducer(broker, "gcn.classic.text.SWIFT_POINTDIR", rate_per_s=500, duration_s=60).start()
+    consumer = FakeConsumer(broker, {"group.id": "benchmark", "auto.offset.reset": "earliest"})
+"""
+
+import datetime
+import math
+import threading
+import time
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from gcn_parser import format_notice, random_notice
+
+# confluent_kafka.TIMESTAMP_CREATE_TIME
+TIMESTAMP_CREATE_TIME = 1
+
+
+class FakeTopicPartition:
+    """Same attributes as confluent_kafka.TopicPartition."""
+
+    def __init__(self, topic: str, partition: int = 0, offset: int = -1001):
+        self.topic, self.partition, self.offset = topic, partition, offset
+
+    def __repr__(self):
+        return f"FakeTopicPartition({self.topic!r}, {self.partition}, {self.offset})"
+
+
+class FakeMessage:
+    def __init__(self, topic: str, partition: int, offset: int, value: bytes, timestamp_ms: int):
+        self._topic, self._partition, self._offset, self._value, self._timestamp_ms = topic, partition, offset, value, timestamp_ms
+
+    def topic(self):
+        return self._topic
+
+    def partition(self):
+        return self._partition
+
+    def offset(self):
+        return self._offset
+
+    def value(self):
+        return self._value
+
+    def key(self):
+        return None
+
+    def timestamp(self):
+        return TIMESTAMP_CREATE_TIME, self._timestamp_ms
+
+    def error(self):
+        return None
+
+
+class FakeBroker:
+    """Topics of in-memory partitions and the committed offsets of the consumer groups."""
+
+    def __init__(self, partitions: int = 1):
+        self.default_partitions = partitions
+        self._log: Dict[Tuple[str, int], List[FakeMessage]] = {}
+        self._partitions: Dict[str, int] = {}
+        self._committed: Dict[Tuple[str, str, int], int] = {}
+        self._next_partition: Dict[str, int] = defaultdict(int)
+        self._cond = threading.Condition()
+
+    def create_topic(self, topic: str, partitions: Optional[int] = None):
+        with self._cond:
+            if topic not in self._partitions:
+                self._partitions[topic] = partitions or self.default_partitions
+                for p in range(self._partitions[topic]):
+                    self._log[(topic, p)] = []
+
+    def partitions(self, topic: str) -> List[int]:
+        self.create_topic(topic)
+        return list(range(self._partitions[topic]))
+
+    def produce(self, topic: str, value: bytes, partition: Optional[int] = None, timestamp_ms: Optional[int] = None) -> FakeMessage:
+        self.create_topic(topic)
+        with self._cond:
+            if partition is None:
+                # Round robin, like a producer without key
+                partition = self._next_partition[topic] % self._partitions[topic]
+                self._next_partition[topic] += 1
+            log = self._log[(topic, partition)]
+            message = FakeMessage(topic, partition, len(log), value, timestamp_ms if timestamp_ms is not None else int(time.time() * 1000))
+            log.append(message)
+            self._cond.notify_all()
+        return message
+
+    def high_watermark(self, topic: str, partition: int) -> int:
+        self.create_topic(topic)
+        return len(self._log[(topic, partition)])
+
+
+class FakeConsumer:
+    """In-process consumer of a FakeBroker, with the Consumer methods used by the GCN consumer."""
+
+    def __init__(self, broker: FakeBroker, config: Optional[dict] = None):
+        config = config or {}
+        self.broker = broker
+        self.group_id = config.get("group.id", "")
+        self.reset = config.get("auto.offset.reset", "latest")
+        self.auto_commit = config.get("enable.auto.commit", True)
+        self._positions: Dict[Tuple[str, int], int] = {}
+        self._closed = False
+
+    def subscribe(self, topics: List[str], on_assign=None):
+        # All partitions are assigned at once (a single consumer in the group)
+        partitions = [
+            FakeTopicPartition(topic, p, self.broker._committed.get((self.group_id, topic, p), -1001))
+            for topic in topics
+            for p in self.broker.partitions(topic)
+        ]
+        if on_assign:
+            on_assign(self, partitions)
+        else:
+            self.assign(partitions)
+
+    def assign(self, partitions):
+        for tp in partitions:
+            offset = tp.offset
+            if offset < 0:
+                offset = 0 if self.reset == "earliest" else self.broker.high_watermark(tp.topic, tp.partition)
+            self._positions[(tp.topic, tp.partition)] = offset
+
+    def assignment(self) -> List[FakeTopicPartition]:
+        return [FakeTopicPartition(t, p, o) for (t, p), o in self._positions.items()]
+
+    def _fetch(self, num_messages: int) -> List[FakeMessage]:
+        messages: List[FakeMessage] = []
+        for (topic, p), position in self._positions.items():
+            log = self.broker._log[(topic, p)]
+            batch = log[position: position + num_messages - len(messages)]
+            messages.extend(batch)
+            self._positions[(topic, p)] = position + len(batch)
+            if len(messages) >= num_messages:
+                break
+        return messages
+
+    def consume(self, num_messages: int = 1, timeout: float = -1) -> List[FakeMessage]:
+        deadline = None if timeout is None or timeout < 0 else time.monotonic() + timeout
+        with self.broker._cond:
+            messages = self._fetch(num_messages)
+            while not messages and not self._closed:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    break
+                self.broker._cond.wait(remaining)
+                messages = self._fetch(num_messages)
+        if self.auto_commit and messages:
+            self.commit(offsets=[FakeTopicPartition(t, p, o) for (t, p), o in self._positions.items()])
+        return messages
+
+    def poll(self, timeout: float = -1) -> Optional[FakeMessage]:
+        messages = self.consume(1, timeout)
+        return messages[0] if messages else None
+
+    def commit(self, message=None, offsets=None, asynchronous: bool = True):
+        if message is not None:
+            offsets = [FakeTopicPartition(message.topic(), message.partition(), message.offset() + 1)]
+        if offsets is None:
+            offsets = [FakeTopicPartition(t, p, o) for (t, p), o in self._positions.items()]
+        with self.broker._cond:
+            for tp in offsets:
+                self.broker._committed[(self.group_id, tp.topic, tp.partition)] = tp.offset
+        return offsets
+
+    def committed(self, partitions, timeout: float = None):
+        return [
+            FakeTopicPartition(tp.topic, tp.partition, self.broker._committed.get((self.group_id, tp.topic, tp.partition), -1001))
+            for tp in partitions
+        ]
+
+    def get_watermark_offsets(self, partition, timeout: float = None, cached: bool = False) -> Tuple[int, int]:
+        return 0, self.broker.high_watermark(partition.topic, partition.partition)
+
+    def close(self):
+        self._closed = True
+        with self.broker._cond:
+            self.broker._cond.notify_all()
+
+
+class ReplayProducer:
+    """Produces synthetic SWIFT_POINTDIR notices into a FakeBroker topic at `rate_per_s`, in a background thread."""
+
+    def __init__(self, broker: FakeBroker, topic: str, rate_per_s: float, duration_s: Optional[float] = None,
+                 count: Optional[int] = None, seed: int = 0, pregenerate: int = 10000):
+        """Stops after `duration_s` or `count` notices; without either, runs until `stop()` and cycles through `pregenerate` notices."""
+        self.broker, self.topic, self.rate_per_s = broker, topic, rate_per_s
+        self.duration_s = duration_s
+        rng = np.random.default_rng(seed)
+        # Rendering a notice costs ~50 us: they are generated upfront so the producer keeps its rate.
+        # One NOTICE_DATE per second: the notices of a bounded replay are all distinct
+        if count is None and duration_s is not None:
+            count = int(math.ceil(rate_per_s * duration_s))
+        self.count = count
+        start = datetime.datetime.now(datetime.timezone.utc).replace(microsecond=0)
+        self._messages = [
+            format_notice(random_notice(rng, start + datetime.timedelta(seconds=i))).encode("utf-8")
+            for i in range(pregenerate if count is None else count)
+        ]
+        self.produced = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        start = time.monotonic()
+        while not self._stop.is_set():
+            elapsed = time.monotonic() - start
+            if self.duration_s is not None and elapsed >= self.duration_s:
+                break
+            # Catch up with the schedule in one go when the thread was not scheduled in time
+            due = int(elapsed * self.rate_per_s) + 1 - self.produced
+            if self.count is not None:
+                due = min(due, self.count - self.produced)
+                if due <= 0 and self.produced >= self.count:
+                    break
+            for _ in range(max(due, 0)):
+                self.broker.produce(self.topic, self._messages[self.produced % len(self._messages)])
+                self.produced += 1
+            time.sleep(max(0.0, (self.produced / self.rate_per_s) - (time.monotonic() - start)))
+
+    def start(self) -> "ReplayProducer":
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def join(self, timeout: Optional[float] = None):
+        self._thread.join(timeout)
+
+    @property
+    def running(self) -> bool:
+        return self._thread.is_alive()
@@ -0,0 +1,290 @@
+"""
+Typed parser for GCN classic text SWIFT_POINTDIR notices.
+
+Every line is split on its first colon only and its value matched against the precompiled pattern
+of that field, so values containing colons (`SLEW_TIME ... {04:17:00.00}`) are parsed correctly.
+Values are typed:
+
+- NEXT_POINT_RA / NEXT_POINT_DEC / NEXT_POINT_ROLL, SUN_RA / SUN_DEC, MOON_RA / MOON_DEC,
+  GAL_LON / GAL_LAT, ECL_LON / ECL_LAT in degrees (double)
+- NOTICE_DATE as a UTC timestamp, SLEW_TIME in seconds of day, SLEW_TJD / SLEW_DOY / SLEW_DATE
+- OBS_TIME in seconds, MERIT, SUN_DIST / MOON_DIST, SUN_ANGLE (hours), MOON_ILLUM (%)
+- TGT_NUM / SEG_NUM and the BAT / XRT / UVOT instrument modes as integers
+- HPX_4 / HPX_10: HEALPix pixels of the pointing direction, the sky index of sky_index.py
+
+`parse_notices` parses many notices into one Arrow record batch (columnar, no per-notice
+DataFrame). `format_notice` is the inverse of `parse_notice` and, with `random_notice`, synthesizes notices.
+
+    batch = parse_notices([message.value().decode("utf-8") for message in messages])
+"""
+
+import datetime
+import re
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+import pyarrow as pa
+
+from sky_index import sky_index
+
+_NUMBER = r"([-+]?\d+(?:\.\d*)?)"
+_MONTHS = {m: i + 1 for i, m in enumerate(["Jan", "Feb", "Mar", "Apr", "May", "Jun", "Jul", "Aug", "Sep", "Oct", "Nov", "Dec"])}
+
+# Field -> (value pattern, output columns, converters)
+_FIELDS = {
+    "TITLE": (re.compile(r"(.*)"), ["TITLE"], [str]),
+    "NOTICE_DATE": (re.compile(r"\w{3} (\d{1,2}) (\w{3}) (\d{2}) (\d{2}):(\d{2}):(\d{2})"), None, None),
+    "NOTICE_TYPE": (re.compile(r"(.*)"), ["NOTICE_TYPE"], [str]),
+    "NEXT_POINT_RA": (re.compile(_NUMBER + r"d"), ["NEXT_POINT_RA"], [float]),
+    "NEXT_POINT_DEC": (re.compile(_NUMBER + r"d"), ["NEXT_POINT_DEC"], [float]),
+    "NEXT_POINT_ROLL": (re.compile(_NUMBER + r"d"), ["NEXT_POINT_ROLL"], [float]),
+    "SLEW_TIME": (re.compile(_NUMBER + r" SOD"), ["SLEW_TIME"], [float]),
+    "SLEW_DATE": (re.compile(r"(\d+) TJD;\s*(\d+) DOY;\s*(\d{2})/(\d{2})/(\d{2})"), None, None),
+    "OBS_TIME": (re.compile(_NUMBER + r" \[sec\]"), ["OBS_TIME"], [float]),
+    "TGT_NAME": (re.compile(r"(.*)"), ["TGT_NAME"], [str]),
+    "TGT_NUM": (re.compile(r"(\d+),\s*Seg_Num:\s*(\d+)"), ["TGT_NUM", "SEG_NUM"], [int, int]),
+    "MERIT": (re.compile(_NUMBER), ["MERIT"], [float]),
+    "INST_MODES": (re.compile(r"BAT=(\d+)=\S+\s+XRT=(\d+)=\S+\s+UVOT=(\d+)=\S+"), ["BAT_MODE", "XRT_MODE", "UVOT_MODE"], [int, int, int]),
+    "SUN_POSTN": (re.compile(_NUMBER + r"d\s*\{[^}]*\}\s*" + _NUMBER + r"d"), ["SUN_RA", "SUN_DEC"], [float, float]),
+    "SUN_DIST": (re.compile(_NUMBER + r" \[deg\](?:\s*Sun_angle=\s*" + _NUMBER + r" \[hr\])?"), ["SUN_DIST", "SUN_ANGLE"], [float, float]),
+    "MOON_POSTN": (re.compile(_NUMBER + r"d\s*\{[^}]*\}\s*" + _NUMBER + r"d"), ["MOON_RA", "MOON_DEC"], [float, float]),
+    "MOON_DIST": (re.compile(_NUMBER + r" \[deg\]"), ["MOON_DIST"], [float]),
+    "MOON_ILLUM": (re.compile(_NUMBER + r" \[%\]"), ["MOON_ILLUM"], [float]),
+    "GAL_COORDS": (re.compile(_NUMBER + r",\s*" + _NUMBER), ["GAL_LON", "GAL_LAT"], [float, float]),
+    "ECL_COORDS": (re.compile(_NUMBER + r",\s*" + _NUMBER), ["ECL_LON", "ECL_LAT"], [float, float]),
+}
+
+SCHEMA = pa.schema([
+    ("TITLE", pa.string()),
+    ("NOTICE_DATE", pa.timestamp("us", tz="UTC")),
+    ("NOTICE_TYPE", pa.string()),
+    ("NEXT_POINT_RA", pa.float64()),
+    ("NEXT_POINT_DEC", pa.float64()),
+    ("NEXT_POINT_ROLL", pa.float64()),
+    ("SLEW_TIME", pa.float64()),
+    ("SLEW_TJD", pa.int32()),
+    ("SLEW_DOY", pa.int32()),
+    ("SLEW_DATE", pa.date32()),
+    ("OBS_TIME", pa.float64()),
+    ("TGT_NAME", pa.string()),
+    ("TGT_NUM", pa.int64()),
+    ("SEG_NUM", pa.int32()),
+    ("MERIT", pa.float64()),
+    ("BAT_MODE", pa.int32()),
+    ("XRT_MODE", pa.int32()),
+    ("UVOT_MODE", pa.int32()),
+    ("SUN_RA", pa.float64()),
+    ("SUN_DEC", pa.float64()),
+    ("SUN_DIST", pa.float64()),
+    ("SUN_ANGLE", pa.float64()),
+    ("MOON_RA", pa.float64()),
+    ("MOON_DEC", pa.float64()),
+    ("MOON_DIST", pa.float64()),
+    ("MOON_ILLUM", pa.float64()),
+    ("GAL_LON", pa.float64()),
+    ("GAL_LAT", pa.float64()),
+    ("ECL_LON", pa.float64()),
+    ("ECL_LAT", pa.float64()),
+    ("HPX_4", pa.int64()),
+    ("HPX_10", pa.int64()),
+    ("COMMENTS", pa.string()),
+    ("RAW", pa.string()),
+])
+
+
+def parse_notice(msg: str) -> Dict[str, object]:
+    """Parse one notice into {column: typed value}; fields that are absent or malformed are None."""
+    row: Dict[str, object] = dict.fromkeys(SCHEMA.names)
+    comments: List[str] = []
+    for line in msg.splitlines():
+        key, _, value = line.partition(":")
+        key, value = key.strip(), value.strip()
+        if key == "COMMENTS":
+            comments.append(value)
+            continue
+        field = _FIELDS.get(key)
+        if field is None:
+            continue
+        pattern, columns, converters = field
+        m = pattern.match(value)
+        if not m:
+            continue
+        if key == "NOTICE_DATE":
+            day, month, year, hour, minute, second = m.groups()
+            # Out-of-range values (day 32, hour 25) leave the field None instead of failing the notice
+            try:
+                row["NOTICE_DATE"] = datetime.datetime(
+                    2000 + int(year), _MONTHS[month], int(day), int(hour), int(minute), int(second), tzinfo=datetime.timezone.utc
+                )
+            except (KeyError, ValueError):
+                pass
+        elif key == "SLEW_DATE":
+            tjd, doy, year, month, day = m.groups()
+            row["SLEW_TJD"], row["SLEW_DOY"] = int(tjd), int(doy)
+            try:
+                row["SLEW_DATE"] = datetime.date(2000 + int(year), int(month), int(day))
+            except ValueError:
+                pass
+        else:
+            for column, convert, group in zip(columns, converters, m.groups()):
+                row[column] = convert(group) if group is not None else None
+    row.update(sky_index(row["NEXT_POINT_RA"], row["NEXT_POINT_DEC"]))
+    row["COMMENTS"] = " ".join(comments) if comments else None
+    row["RAW"] = msg
+    return row
+
+
+def parse_notices(messages: Iterable[str]) -> pa.RecordBatch:
+    """Parse many notices into one Arrow record batch with `SCHEMA`."""
+    rows = [parse_notice(msg) for msg in messages]
+    return pa.RecordBatch.from_arrays(
+        [pa.array([row[name] for row in rows], type=field.type) for name, field in zip(SCHEMA.names, SCHEMA)],
+        schema=SCHEMA,
+    )
+
+
+def _sexagesimal(value: float, hours: bool) -> str:
+    sign = "-" if value < 0 else "+"
+    value = abs(value) / 15 if hours else abs(value)
+    whole = int(value)
+    minutes = int((value - whole) * 60)
+    seconds = int(round(((value - whole) * 60 - minutes) * 60)) % 60
+    return f"{sign}{whole:02d}{'h' if hours else 'd'} {minutes:02d}{'m' if hours else chr(39)} {seconds:02d}{'s' if hours else chr(34)}"
+
+
+def format_notice(values: Dict[str, object]) -> str:
+    """Render a notice in the GCN classic text format from the typed values of `parse_notice`."""
+    v = values
+    slew = int(v["SLEW_TIME"])
+    comments = "".join(f"COMMENTS:        {c.strip()}  \n" for c in re.split(r"(?<=\.)\s+", v.get("COMMENTS") or "") if c.strip())
+    return (
+        f"TITLE:           {v['TITLE']}\n"
+        f"NOTICE_DATE:     {v['NOTICE_DATE'].strftime('%a %d %b %y %H:%M:%S')} UT\n"
+        f"NOTICE_TYPE:     {v['NOTICE_TYPE']}\n"
+        f"NEXT_POINT_RA:   {v['NEXT_POINT_RA']:7.3f}d {{{_sexagesimal(v['NEXT_POINT_RA'], True)}}} (J2000)\n"
+        f"NEXT_POINT_DEC:  {v['NEXT_POINT_DEC']:+7.3f}d {{{_sexagesimal(v['NEXT_POINT_DEC'], False)}}} (J2000)\n"
+        f"NEXT_POINT_ROLL: {v['NEXT_POINT_ROLL']:7.3f}d\n"
+        f"SLEW_TIME:       {v['SLEW_TIME']:.2f} SOD {{{slew // 3600:02d}:{slew % 3600 // 60:02d}:{slew % 60:02d}.00}} UT\n"
+        f"SLEW_DATE:       {v['SLEW_TJD']} TJD;   {v['SLEW_DOY']} DOY;   {v['SLEW_DATE'].strftime('%y/%m/%d')}\n"
+        f"OBS_TIME:        {v['OBS_TIME']:.2f} [sec]   (={v['OBS_TIME'] / 60:.1f} [min])\n"
+        f"TGT_NAME:        {v['TGT_NAME']} \n"
+        f"TGT_NUM:         {v['TGT_NUM']},   Seg_Num: {v['SEG_NUM']}\n"
+        f"MERIT:           {v['MERIT']:.2f}\n"
+        f"INST_MODES:      BAT={v['BAT_MODE']}=0x{v['BAT_MODE']:X}  XRT={v['XRT_MODE']}=0x{v['XRT_MODE']:X}  UVOT={v['UVOT_MODE']}=0x{v['UVOT_MODE']:X}\n"
+        f"SUN_POSTN:       {v['SUN_RA']:6.2f}d {{{_sexagesimal(v['SUN_RA'], True)}}}  {v['SUN_DEC']:+6.2f}d {{{_sexagesimal(v['SUN_DEC'], False)}}}\n"
+        f"SUN_DIST:        {v['SUN_DIST']:6.2f} [deg]   Sun_angle= {v['SUN_ANGLE']:.1f} [hr] ({'East' if v['SUN_ANGLE'] < 0 else 'West'} of Sun)\n"
+        f"MOON_POSTN:      {v['MOON_RA']:6.2f}d {{{_sexagesimal(v['MOON_RA'], True)}}}  {v['MOON_DEC']:+6.2f}d {{{_sexagesimal(v['MOON_DEC'], False)}}}\n"
+        f"MOON_DIST:       {v['MOON_DIST']:6.2f} [deg]\n"
+        f"MOON_ILLUM:      {v['MOON_ILLUM']:.0f} [%]\n"
+        f"GAL_COORDS:      {v['GAL_LON']:6.2f},{v['GAL_LAT']:6.2f} [deg] galactic lon,lat of the pointing direction\n"
+        f"ECL_COORDS:      {v['ECL_LON']:6.2f},{v['ECL_LAT']:6.2f} [deg] ecliptic lon,lat of the pointing direction\n"
+        f"{comments}"
+    )
+
+
+def random_notice(rng: np.random.Generator, notice_date: Optional[datetime.datetime] = None) -> Dict[str, object]:
+    """Random but self-consistent typed notice values (rounded like the text format), e.g. `format_notice(random_notice(rng))`."""
+    notice_date = (notice_date or datetime.datetime.now(datetime.timezone.utc)).replace(microsecond=0)
+    slew = notice_date + datetime.timedelta(seconds=int(rng.integers(30, 120)))
+    slew_sod = slew.hour * 3600 + slew.minute * 60 + slew.second
+    ra, sun_ra, moon_ra = (round(float(x), d) for x, d in zip(rng.uniform(0, 360, 3), [3, 2, 2]))
+    dec = round(float(np.degrees(np.arcsin(rng.uniform(-1, 1)))), 3)
+    sun_angle = round(float(rng.uniform(-12, 12)), 1)
+    return {
+        "TITLE": "GCN/SWIFT NOTICE",
+        "NOTICE_DATE": notice_date,
+        "NOTICE_TYPE": "SWIFT Pointing Direction",
+        "NEXT_POINT_RA": ra,
+        "NEXT_POINT_DEC": dec,
+        "NEXT_POINT_ROLL": round(float(rng.uniform(0, 360)), 3),
+        "SLEW_TIME": float(slew_sod),
+        "SLEW_TJD": (slew.date() - datetime.date(1968, 5, 24)).days,
+        "SLEW_DOY": slew.timetuple().tm_yday,
+        "SLEW_DATE": slew.date(),
+        "OBS_TIME": float(rng.choice([300, 600, 900, 1080, 1500, 1800])),
+        "TGT_NAME": f"TRANSIENT_{int(rng.integers(1, 100))}",
+        "TGT_NUM": int(rng.integers(10000, 4000000)),
+        "SEG_NUM": int(rng.integers(1, 300)),
+        "MERIT": float(rng.choice([40, 50, 60, 69, 70, 80, 100, 1000])),
+        "BAT_MODE": 0,
+        "XRT_MODE": int(rng.choice([0, 7])),
+        "UVOT_MODE": int(rng.integers(0, 0x7FFF)),
+        "SUN_RA": sun_ra,
+        "SUN_DEC": round(float(rng.uniform(-23.44, 23.44)), 2),
+        "SUN_DIST": round(float(rng.uniform(45, 180)), 2),
+        "SUN_ANGLE": sun_angle,
+        "MOON_RA": moon_ra,
+        "MOON_DEC": round(float(rng.uniform(-28.5, 28.5)), 2),
+        "MOON_DIST": round(float(rng.uniform(0, 180)), 2),
+        "MOON_ILLUM": float(rng.integers(0, 101)),
+        "GAL_LON": round(float(rng.uniform(0, 360)), 2),
+        "GAL_LAT": round(float(rng.uniform(-90, 90)), 2),
+        "ECL_LON": round(float(rng.uniform(0, 360)), 2),
+        "ECL_LAT": round(float(rng.uniform(-90, 90)), 2),
+        "COMMENTS": "SWIFT Slew Notice to a preplanned target. This Notice was ground-generated -- not flight-generated.",
+    }
+
+
+def tjd_to_date(tjd: int) -> datetime.date:
+    """Truncated Julian Day (JD - 2440000.5) to calendar date."""
+    return datetime.date(1968, 5, 24) + datetime.timedelta(days=tjd)
+
+
+def sample_notices() -> List[str]:
+    """The example notices of the repository (consumer notebook and pipeline SQL)."""
+    return [_SAMPLE_1, _SAMPLE_2]
+
+
+_SAMPLE_1 = """TITLE:           GCN/SWIFT NOTICE
+NOTICE_DATE:     Fri 03 May 24 04:16:31 UT
+NOTICE_TYPE:     SWIFT Pointing Direction
+NEXT_POINT_RA:   213.407d {+14h 13m 38s} (J2000)
+NEXT_POINT_DEC:  +70.472d {+70d 28' 20"} (J2000)
+NEXT_POINT_ROLL:   2.885d
+SLEW_TIME:       15420.00 SOD {04:17:00.00} UT
+SLEW_DATE:       20433 TJD;   124 DOY;   24/05/03
+OBS_TIME:        900.00 [sec]   (=15.0 [min])
+TGT_NAME:        RX J1413.6+7029
+TGT_NUM:         3111759,   Seg_Num: 10
+MERIT:           60.00
+INST_MODES:      BAT=0=0x0  XRT=7=0x7  UVOT=12525=0x30ED
+SUN_POSTN:        40.78d {+02h 43m 07s}  +15.81d {+15d 48' 31"}
+SUN_DIST:         93.68 [deg]   Sun_angle= -11.5 [hr] (East of Sun)
+MOON_POSTN:      338.61d {+22h 34m 27s}  -12.48d {-12d 28' 49"}
+MOON_DIST:       113.09 [deg]
+MOON_ILLUM:      31 [%]
+GAL_COORDS:      113.36, 45.10 [deg] galactic lon,lat of the pointing direction
+ECL_COORDS:      143.56, 69.70 [deg] ecliptic lon,lat of the pointing direction
+COMMENTS:        SWIFT Slew Notice to a preplanned target.
+COMMENTS:        Note that preplanned targets are overridden by any new BAT Automated Target.
+COMMENTS:        Note that preplanned targets are overridden by any TOO Target if the TOO has a higher Merit Value.
+COMMENTS:        The spacecraft longitude,latitude at Notice_time is 247.70,10.86 [deg].
+COMMENTS:        This Notice was ground-generated -- not flight-generated.
+"""
+
+_SAMPLE_2 = """TITLE:           GCN/SWIFT NOTICE
+NOTICE_DATE:     Thu 11 Apr 24 21:12:43 UT
+NOTICE_TYPE:     SWIFT Pointing Direction
+NEXT_POINT_RA:    48.356d {+03h 13m 25s} (J2000)
+NEXT_POINT_DEC:  -30.147d {-30d 08' 49"} (J2000)
+NEXT_POINT_ROLL: 310.400d
+SLEW_TIME:       76380.00 SOD {21:13:00.00} UT
+SLEW_DATE:       20411 TJD;   102 DOY;   24/04/11
+OBS_TIME:        1080.00 [sec]   (=18.0 [min])
+TGT_NAME:        TRANSIENT_10
+TGT_NUM:         97530,   Seg_Num: 4
+MERIT:           69.00
+INST_MODES:      BAT=0=0x0  XRT=7=0x7  UVOT=12485=0x30C5
+SUN_POSTN:        20.78d {+01h 23m 07s}   +8.74d {+08d 44 34"}
+SUN_DIST:         47.12 [deg]   Sun_angle= -1.8 [hr] (East of Sun)
+MOON_POSTN:       62.23d {+04h 08m 56s}  +25.03d {+25d 01 48"}
+MOON_DIST:        56.62 [deg]
+MOON_ILLUM:      13 [%]
+GAL_COORDS:      227.01,-58.82 [deg] galactic lon,lat of the pointing direction
+ECL_COORDS:       34.38,-45.88 [deg] ecliptic lon,lat of the pointing direction
+COMMENTS:        SWIFT Slew Notice to a preplanned target.
+COMMENTS:        Note that preplanned targets are overridden by any new BAT Automated Target.
+COMMENTS:        Note that preplanned targets are overridden by any TOO Target if the TOO has a higher Merit Value.
+COMMENTS:        The spacecraft longitude,latitude at Notice_time is 203.45,18.92 [deg].
+COMMENTS:        This Notice was ground-generated -- not flight-generated.
+"""
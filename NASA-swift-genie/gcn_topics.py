@@ -0,0 +1,81 @@
+"""
+Topic -> parser registry of the multi-topic GCN consumer.
+
+Every topic is matched against the registered patterns (fnmatch, the most recently registered first)
+and gets a `TopicParser`: the function turning a message into a row, the Arrow schema of the rows if
+they are typed, and the natural key the sink MERGEs on.
+
+- gcn.classic.text.SWIFT_POINTDIR: the typed gcn_parser.parse_notice
+- other gcn.classic.text.* topics (Fermi GBM, Swift BAT, ...): `parse_classic_text`, one string column per field
+- JSON topics (gcn.notices.*, igwn.gwalert for LVK): `parse_json`, top-level fields
+- anything else: `parse_raw`, the message only
+
+    register_parser("gcn.classic.text.FERMI_GBM_*", parse_fermi_gbm, schema=FERMI_SCHEMA, merge_keys=["TRIGGER_NUM"])
+    parser_for("gcn.classic.text.FERMI_GBM_ALERT").parse(message)
+
+Parsers take the decoded message (str) and are module-level functions, so they can run in worker processes.
+"""
+
+import json
+import re
+from fnmatch import fnmatch
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple
+
+import pyarrow as pa
+
+from gcn_parser import SCHEMA as SWIFT_POINTDIR_SCHEMA, parse_notice
+
+
+class TopicParser(NamedTuple):
+    parse: Callable[[str], dict]
+    schema: Optional[pa.Schema] = None
+    merge_keys: Optional[List[str]] = None
+
+
+def parse_classic_text(msg: str) -> Dict[str, object]:
+    """GCN classic text notice: one string per `KEY: value` line (split on the first colon), repeated keys joined."""
+    row: Dict[str, object] = {}
+    for line in msg.splitlines():
+        key, sep, value = line.partition(":")
+        # Field names become Delta column names: no spaces or punctuation
+        key, value = re.sub(r"\W+", "_", key.strip()), value.strip()
+        if not sep or not key:
+            continue
+        row[key] = f"{row[key]} {value}" if key in row else value
+    row["RAW"] = msg
+    return row
+
+
+def parse_json(msg: str) -> Dict[str, object]:
+    """JSON notice: top-level scalar fields as they are, nested ones as JSON strings."""
+    data = json.loads(msg)
+    if not isinstance(data, dict):
+        data = {"value": data}
+    row = {key: json.dumps(value) if isinstance(value, (dict, list)) else value for key, value in data.items()}
+    row["RAW"] = msg
+    return row
+
+
+def parse_raw(msg: str) -> Dict[str, object]:
+    return {"RAW": msg}
+
+
+_REGISTRY: List[Tuple[str, TopicParser]] = []
+
+
+def register_parser(pattern: str, parse: Callable[[str], dict], schema: Optional[pa.Schema] = None, merge_keys: Optional[List[str]] = None):
+    """Registers a parser for the topics matching `pattern`; it takes precedence over the previous registrations."""
+    _REGISTRY.insert(0, (pattern, TopicParser(parse, schema, merge_keys)))
+
+
+def parser_for(topic: str) -> TopicParser:
+    for pattern, parser in _REGISTRY:
+        if fnmatch(topic, pattern):
+            return parser
+    return TopicParser(parse_raw)
+
+
+register_parser("gcn.notices.*", parse_json)
+register_parser("igwn.gwalert", parse_json)
+register_parser("gcn.classic.text.*", parse_classic_text)
+register_parser("gcn.classic.text.SWIFT_POINTDIR", parse_notice, schema=SWIFT_POINTDIR_SCHEMA, merge_keys=["TGT_NUM", "SEG_NUM", "NOTICE_DATE"])
@@ -0,0 +1,149 @@
+"""
+Micro-batched Delta writer for the GCN Kafka consumer.
+
+Parsed notices are buffered and written with one Delta commit per batch, when `max_rows` notices
+are buffered or the oldest one has waited `max_delay_s` seconds. The Kafka offsets of a batch are
+only committed (through the `commit_offsets` callback) after the batch is written, so a crash
+re-delivers the unwritten notices instead of losing them.
+
+With a `schema` (e.g. the typed notices of gcn_parser), the batch is written with exactly that schema;
+without one, columns are inferred and new ones added with mergeSchema.
+
+With `merge_keys`, batches are MERGEd (insert when the key is not in the table yet) instead of appended,
+so a notice delivered twice is stored once. Notices with a null key field cannot be matched: they are
+appended as they come (a replay stores them again). With an `offsets_table`, the next offset of every
+(topic, partition) is saved in that Delta table after each batch: `load_offsets()` returns them on
+restart, to resume where the table stops even if the Kafka consumer group offsets are lost.
+A crash between the two commits replays one batch, which the MERGE ignores.
+
+    writer = BufferedDeltaWriter(spark, "demo_frank.nasa.swift_notices", commit_offsets=commit)
+    writer.add(record, message.topic(), message.partition(), message.offset())
+    if writer.due():
+        writer.flush()
+"""
+
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+import pandas as pd
+
+
+class BufferedDeltaWriter:
+    """Buffers records and appends them to a Delta table in batches."""
+
+    def __init__(
+        self,
+        spark,
+        table_name: str,
+        max_rows: int = 1000,
+        max_delay_s: float = 5.0,
+        commit_offsets: Optional[Callable[[List[Tuple[str, int, int]]], None]] = None,
+        schema=None,
+        merge_keys: Optional[List[str]] = None,
+        offsets_table: Optional[str] = None,
+    ):
+        self.spark = spark
+        self.table_name = table_name
+        self.max_rows = max_rows
+        self.max_delay_s = max_delay_s
+        self.commit_offsets = commit_offsets
+        self.schema = schema
+        self.merge_keys = merge_keys
+        self.offsets_table = offsets_table
+        self._records: List[dict] = []
+        # (topic, partition) -> next offset to consume, committed after the flush
+        self._offsets: Dict[Tuple[str, int], int] = {}
+        self._first_added_at: Optional[float] = None
+        # (topic, partition, next offset) committed by the last flush that wrote rows
+        self.committed_offsets: List[Tuple[str, int, int]] = []
+        self.stats = {"flushes": 0, "rows": 0, "flush_s": 0.0, "max_wait_s": 0.0}
+
+    def add(self, record: dict, topic: Optional[str] = None, partition: Optional[int] = None, offset: Optional[int] = None):
+        if not self._records:
+            self._first_added_at = time.monotonic()
+        self._records.append(record)
+        if topic is not None and offset is not None:
+            key = (topic, partition)
+            self._offsets[key] = max(self._offsets.get(key, 0), offset + 1)
+
+    @property
+    def pending(self) -> int:
+        return len(self._records)
+
+    def due(self) -> bool:
+        if not self._records:
+            return False
+        return len(self._records) >= self.max_rows or time.monotonic() - self._first_added_at >= self.max_delay_s
+
+    def _to_df(self, records: List[dict]):
+        if self.schema is not None:
+            names = self.schema.fieldNames()
+            return self.spark.createDataFrame([[r.get(n) for n in names] for r in records], self.schema)
+        # Notices do not all have the same fields: missing ones are null, new ones are added by mergeSchema
+        return self.spark.createDataFrame(pd.DataFrame(records).astype(object).where(lambda d: d.notna(), None))
+
+    def _append(self, records: List[dict]):
+        self._to_df(records).write.format("delta").mode("append").option("mergeSchema", "true").saveAsTable(self.table_name)
+
+    def _write(self, records: List[dict]):
+        if not self.merge_keys:
+            self._append(records)
+            return
+        keyed = [r for r in records if all(pd.notna(r.get(k)) for k in self.merge_keys)]
+        unkeyed = [r for r in records if not all(pd.notna(r.get(k)) for k in self.merge_keys)]
+        if not self.spark.catalog.tableExists(self.table_name):
+            self._append(list({tuple(r[k] for k in self.merge_keys): r for r in keyed}.values()) + unkeyed)
+            return
+        from delta.tables import DeltaTable
+
+        if keyed:
+            df = self._to_df(keyed).dropDuplicates(self.merge_keys)
+            condition = " AND ".join(f"t.`{k}` = s.`{k}`" for k in self.merge_keys)
+            DeltaTable.forName(self.spark, self.table_name).alias("t").merge(df.alias("s"), condition).whenNotMatchedInsertAll().execute()
+        if unkeyed:
+            self._append(unkeyed)
+
+    def _save_offsets(self, offsets: List[Tuple[str, int, int]]):
+        from pyspark.sql.functions import current_timestamp
+
+        df = self.spark.createDataFrame(offsets, "topic string, partition int, next_offset long").withColumn("updated_at", current_timestamp())
+        if not self.spark.catalog.tableExists(self.offsets_table):
+            df.write.format("delta").saveAsTable(self.offsets_table)
+            return
+        from delta.tables import DeltaTable
+
+        (DeltaTable.forName(self.spark, self.offsets_table).alias("t")
+            .merge(df.alias("s"), "t.topic = s.topic AND t.partition = s.partition")
+            .whenMatchedUpdateAll()
+            .whenNotMatchedInsertAll()
+            .execute())
+
+    def load_offsets(self) -> Dict[Tuple[str, int], int]:
+        """{(topic, partition): next offset} of the last written batch, empty without an offsets table."""
+        if not self.offsets_table or not self.spark.catalog.tableExists(self.offsets_table):
+            return {}
+        return {(r.topic, r.partition): r.next_offset for r in self.spark.read.table(self.offsets_table).collect()}
+
+    def flush(self) -> int:
+        """
+        Write the buffered records in one commit, then commit their offsets. Returns the number of rows written;
+        the committed offsets are in `committed_offsets`.
+        """
+        if not self._records:
+            return 0
+        start = time.monotonic()
+        self._write(self._records)
+        offsets = [(topic, partition, offset) for (topic, partition), offset in self._offsets.items()]
+        if self.offsets_table and offsets:
+            self._save_offsets(offsets)
+        if self.commit_offsets and offsets:
+            self.commit_offsets(offsets)
+
+        written = len(self._records)
+        self.committed_offsets = offsets
+        self.stats["flushes"] += 1
+        self.stats["rows"] += written
+        self.stats["flush_s"] += time.monotonic() - start
+        self.stats["max_wait_s"] = max(self.stats["max_wait_s"], time.monotonic() - self._first_added_at)
+        self._records, self._offsets, self._first_added_at = [], {}, None
+        return written
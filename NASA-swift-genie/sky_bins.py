@@ -0,0 +1,67 @@
+"""
+Sky binning of the Swift pointing directions in Spark, for plotting without collecting the notices.
+
+The sky is cut in an equal-area grid: `bin_deg` wide in right ascension, and bands of equal width in
+sin(declination), so every bin covers the same solid angle and counts can be compared across the map.
+Only the aggregated bins (at most 360 / bin_deg * 180 / bin_deg rows) or a capped sample per bin are
+collected on the driver, whatever the size of the notice table.
+
+    bins = bin_pointings(spark.read.table("demo_frank.nasa.swift_notices"), bin_deg=3).toPandas()
+"""
+
+from pyspark.sql import DataFrame, Window
+from pyspark.sql import functions as F
+
+RA, DEC = "NEXT_POINT_RA", "NEXT_POINT_DEC"
+
+
+def grid_size(bin_deg: float):
+    """Number of (RA, Dec) bins of the grid."""
+    return max(1, int(round(360 / bin_deg))), max(1, int(round(180 / bin_deg)))
+
+
+def with_sky_bin(df: DataFrame, bin_deg: float = 3.0, ra_col: str = RA, dec_col: str = DEC) -> DataFrame:
+    """Adds the `ra_bin` and `dec_bin` grid indices of every row."""
+    n_ra, n_dec = grid_size(bin_deg)
+    ra_bin = F.least(F.floor(F.pmod(F.col(ra_col), F.lit(360.0)) / 360.0 * n_ra), F.lit(n_ra - 1))
+    # Equal area: uniform in sin(dec). Dec = +90 falls in the last band
+    dec_bin = F.least(F.floor((F.sin(F.radians(F.col(dec_col))) + 1) / 2 * n_dec), F.lit(n_dec - 1))
+    return df.withColumn("ra_bin", ra_bin.cast("int")).withColumn("dec_bin", dec_bin.cast("int"))
+
+
+def with_bin_center(df: DataFrame, bin_deg: float = 3.0) -> DataFrame:
+    """Adds the `ra_center` and `dec_center` (degrees) of the `ra_bin` / `dec_bin` grid cell."""
+    n_ra, n_dec = grid_size(bin_deg)
+    return (df
+        .withColumn("ra_center", (F.col("ra_bin") + 0.5) * (360.0 / n_ra))
+        .withColumn("dec_center", F.degrees(F.asin((F.col("dec_bin") + 0.5) / n_dec * 2 - 1))))
+
+
+def bin_pointings(df: DataFrame, bin_deg: float = 3.0, ra_col: str = RA, dec_col: str = DEC) -> DataFrame:
+    """
+    One row per occupied bin: number of notices, total exposure (OBS_TIME, seconds), max merit and
+    the target with the highest merit.
+    """
+    return with_bin_center(
+        with_sky_bin(df, bin_deg, ra_col, dec_col)
+        .groupBy("ra_bin", "dec_bin")
+        .agg(
+            F.count("*").alias("notices"),
+            F.sum("OBS_TIME").alias("exposure_s"),
+            F.max("MERIT").alias("max_merit"),
+            F.max_by("TGT_NAME", "MERIT").alias("top_target"),
+        ),
+        bin_deg,
+    )
+
+
+def adaptive_sample(df: DataFrame, max_points: int = 2000, bin_deg: float = 3.0, ra_col: str = RA, dec_col: str = DEC) -> DataFrame:
+    """
+    At most about `max_points` notices, spread over the sky: the same number is kept in every occupied bin
+    (the highest merits first), so sparse regions keep all their points and dense ones are thinned.
+    """
+    binned = with_sky_bin(df, bin_deg, ra_col, dec_col)
+    occupied = binned.select("ra_bin", "dec_bin").distinct().count()
+    per_bin = max(1, max_points // max(occupied, 1))
+    rank = Window.partitionBy("ra_bin", "dec_bin").orderBy(F.col("MERIT").desc_nulls_last(), F.col("OBS_TIME").desc_nulls_last())
+    return binned.withColumn("_rank", F.row_number().over(rank)).where(F.col("_rank") <= per_bin).drop("_rank")
@@ -0,0 +1,219 @@
+"""
+HEALPix sky index and cone search for the Swift pointing directions.
+
+Every notice gets the HEALPix pixel (NESTED scheme) of its pointing direction at two orders: HPX_4
+(nside 16, pixels of ~3.7°) and HPX_10 (nside 1024, ~3.4'). In the nested scheme the pixel of a coarser
+order is a bit shift (`HPX_10 >> 2 * (10 - k)` is the pixel at order k), so the pixels inside a coarse
+pixel form one contiguous range of HPX_10. With the table clustered by HPX_10, a cone search becomes a
+few `HPX_10 BETWEEN lo AND hi` predicates, which Delta data skipping turns into a handful of files,
+followed by the exact angular distance on the remaining rows.
+
+    cone_search(spark.read.table("demo_frank.nasa.swift_notices"), ra=213.4, dec=70.5, radius_deg=2)
+
+Pure numpy: the pixel functions take scalars or arrays (angles in degrees).
+"""
+
+import math
+from typing import List, Sequence, Tuple
+
+import numpy as np
+
+ORDERS = (4, 10)
+INDEX_ORDER = max(ORDERS)
+
+_JRLL = np.array([2, 2, 2, 2, 3, 3, 3, 3, 4, 4, 4, 4])
+_JPLL = np.array([1, 3, 5, 7, 0, 2, 4, 6, 1, 3, 5, 7])
+
+
+def _spread_bits(v):
+    """Interleave zeros between the bits of v (ints or int64 arrays, up to 31 bits): abc -> 0a0b0c."""
+    v = (v | (v << 16)) & 0x0000FFFF0000FFFF
+    v = (v | (v << 8)) & 0x00FF00FF00FF00FF
+    v = (v | (v << 4)) & 0x0F0F0F0F0F0F0F0F
+    v = (v | (v << 2)) & 0x3333333333333333
+    return (v | (v << 1)) & 0x5555555555555555
+
+
+def _compress_bits(v):
+    v = v & 0x5555555555555555
+    v = (v | (v >> 1)) & 0x3333333333333333
+    v = (v | (v >> 2)) & 0x0F0F0F0F0F0F0F0F
+    v = (v | (v >> 4)) & 0x00FF00FF00FF00FF
+    v = (v | (v >> 8)) & 0x0000FFFF0000FFFF
+    return (v | (v >> 16)) & 0x00000000FFFFFFFF
+
+
+def _ang2pix_scalar(order: int, ra: float, dec: float) -> int:
+    # Same as ang2pix with floats, ~50x faster than numpy on one value (parse_notice calls it per notice)
+    nside = 1 << order
+    z = math.sin(math.radians(dec))
+    za = abs(z)
+    tt = (math.radians(ra) * (2 / math.pi)) % 4.0
+    if za <= 2 / 3:
+        temp1, temp2 = nside * (0.5 + tt), nside * z * 0.75
+        jp, jm = int(temp1 - temp2), int(temp1 + temp2)
+        ifp, ifm = jp // nside, jm // nside
+        face = ifp | 4 if ifp == ifm else ifp if ifp < ifm else ifm + 8
+        ix, iy = jm & (nside - 1), nside - (jp & (nside - 1)) - 1
+    else:
+        ntt = min(int(tt), 3)
+        tp = tt - ntt
+        tmp = nside * math.sqrt(3 * (1 - za))
+        jp, jm = min(int(tp * tmp), nside - 1), min(int((1 - tp) * tmp), nside - 1)
+        if z >= 0:
+            face, ix, iy = ntt, nside - jm - 1, nside - jp - 1
+        else:
+            face, ix, iy = ntt + 8, jp, jm
+    return face * nside * nside + _spread_bits(ix) + (_spread_bits(iy) << 1)
+
+
+def ang2pix(order: int, ra, dec):
+    """NESTED HEALPix pixel of (ra, dec) degrees at `order` (nside = 2**order)."""
+    if np.ndim(ra) == 0 and np.ndim(dec) == 0:
+        return _ang2pix_scalar(order, float(ra), float(dec))
+    nside = 1 << order
+    ra, dec = np.atleast_1d(np.asarray(ra, dtype=np.float64)), np.atleast_1d(np.asarray(dec, dtype=np.float64))
+    z = np.sin(np.radians(dec))
+    za = np.abs(z)
+    tt = np.mod(np.radians(ra) * (2 / np.pi), 4.0)
+
+    face = np.empty(len(z), dtype=np.int64)
+    ix = np.empty(len(z), dtype=np.int64)
+    iy = np.empty(len(z), dtype=np.int64)
+
+    # Equatorial region
+    eq = za <= 2 / 3
+    temp1 = nside * (0.5 + tt[eq])
+    temp2 = nside * z[eq] * 0.75
+    jp = (temp1 - temp2).astype(np.int64)
+    jm = (temp1 + temp2).astype(np.int64)
+    ifp, ifm = jp // nside, jm // nside
+    face[eq] = np.where(ifp == ifm, ifp | 4, np.where(ifp < ifm, ifp, ifm + 8))
+    ix[eq] = jm & (nside - 1)
+    iy[eq] = nside - (jp & (nside - 1)) - 1
+
+    # Polar caps
+    pol = ~eq
+    ntt = np.minimum(tt[pol].astype(np.int64), 3)
+    tp = tt[pol] - ntt
+    tmp = nside * np.sqrt(3 * (1 - za[pol]))
+    jp = np.minimum((tp * tmp).astype(np.int64), nside - 1)
+    jm = np.minimum(((1 - tp) * tmp).astype(np.int64), nside - 1)
+    north = z[pol] >= 0
+    face[pol] = np.where(north, ntt, ntt + 8)
+    ix[pol] = np.where(north, nside - jm - 1, jp)
+    iy[pol] = np.where(north, nside - jp - 1, jm)
+
+    return face * nside * nside + _spread_bits(ix) + (_spread_bits(iy) << 1)
+
+
+def pix2ang(order: int, pix) -> Tuple[np.ndarray, np.ndarray]:
+    """(ra, dec) degrees of the center of NESTED pixels at `order`."""
+    nside = 1 << order
+    pix = np.atleast_1d(np.asarray(pix, dtype=np.int64))
+    npface = nside * nside
+    face = pix // npface
+    ipf = pix % npface
+    ix, iy = _compress_bits(ipf), _compress_bits(ipf >> 1)
+
+    jr = _JRLL[face] * nside - ix - iy - 1
+    nr = np.where(jr < nside, jr, np.where(jr > 3 * nside, 4 * nside - jr, nside))
+    z = np.where(
+        jr < nside,
+        1 - nr * nr / (3.0 * npface),
+        np.where(jr > 3 * nside, nr * nr / (3.0 * npface) - 1, (2 * nside - jr) * 2.0 / (3 * nside)),
+    )
+    kshift = np.where((jr >= nside) & (jr <= 3 * nside), (jr - nside) & 1, 0)
+    jp = (_JPLL[face] * nr + ix - iy + 1 + kshift) // 2
+    jp = np.where(jp > 4 * nside, jp - 4 * nside, np.where(jp < 1, jp + 4 * nside, jp))
+    phi = (jp - (kshift + 1) * 0.5) * (np.pi / 2 / nr)
+    return np.degrees(phi) % 360.0, np.degrees(np.arcsin(np.clip(z, -1, 1)))
+
+
+def max_pixrad(order: int) -> float:
+    """Upper bound (radians) of the distance between a pixel center and any point of the pixel."""
+    nside = 1 << order
+    t1 = (1 - 1 / nside) ** 2
+    # Same construction as Healpix_Base::max_pixrad: corner of the largest pixel vs. its center
+    za, phia = 2 / 3, math.pi / (4 * nside)
+    zb, phib = 1 - t1 / 3, 0.0
+    va = (math.sqrt(1 - za * za) * math.cos(phia), math.sqrt(1 - za * za) * math.sin(phia), za)
+    vb = (math.sqrt(1 - zb * zb) * math.cos(phib), math.sqrt(1 - zb * zb) * math.sin(phib), zb)
+    dot = sum(a * b for a, b in zip(va, vb))
+    return math.acos(max(-1.0, min(1.0, dot)))
+
+
+def angular_distance_deg(ra1, dec1, ra2, dec2):
+    """Great-circle distance in degrees (haversine, stable for small angles)."""
+    ra1, dec1, ra2, dec2 = (np.radians(np.asarray(x, dtype=np.float64)) for x in (ra1, dec1, ra2, dec2))
+    h = np.sin((dec2 - dec1) / 2) ** 2 + np.cos(dec1) * np.cos(dec2) * np.sin((ra2 - ra1) / 2) ** 2
+    return np.degrees(2 * np.arcsin(np.sqrt(np.clip(h, 0, 1))))
+
+
+def search_order(radius_deg: float) -> int:
+    """Coarsest order whose pixels are smaller than the cone: a few dozen candidate pixels."""
+    order = 0
+    while order < INDEX_ORDER and math.degrees(max_pixrad(order)) > radius_deg / 2:
+        order += 1
+    return order
+
+
+def cone_pixels(ra: float, dec: float, radius_deg: float, order: int) -> np.ndarray:
+    """
+    NESTED pixels at `order` that may intersect the cone (a superset: no pixel of the cone is missed).
+    Descends from order 0 and keeps the children of the pixels whose center is closer than radius + pixel radius.
+    """
+    pixels = np.arange(12, dtype=np.int64)
+    for level in range(order + 1):
+        if level > 0:
+            pixels = (pixels[:, None] * 4 + np.arange(4)).ravel()
+        centers_ra, centers_dec = pix2ang(level, pixels)
+        keep = angular_distance_deg(ra, dec, centers_ra, centers_dec) <= radius_deg + math.degrees(max_pixrad(level))
+        pixels = pixels[keep]
+    return np.sort(pixels)
+
+
+def pixel_ranges(pixels: Sequence[int], order: int, to_order: int = INDEX_ORDER) -> List[Tuple[int, int]]:
+    """Inclusive ranges of `to_order` pixels covered by `pixels` at `order`, adjacent ranges merged."""
+    shift = 2 * (to_order - order)
+    ranges: List[Tuple[int, int]] = []
+    for p in sorted(int(p) for p in pixels):
+        lo, hi = p << shift, ((p + 1) << shift) - 1
+        if ranges and lo == ranges[-1][1] + 1:
+            ranges[-1] = (ranges[-1][0], hi)
+        else:
+            ranges.append((lo, hi))
+    return ranges
+
+
+def cone_ranges(ra: float, dec: float, radius_deg: float) -> List[Tuple[int, int]]:
+    """HPX_10 ranges of the candidate pixels of a cone."""
+    order = search_order(radius_deg)
+    return pixel_ranges(cone_pixels(ra, dec, radius_deg, order), order)
+
+
+def sky_index(ra, dec) -> dict:
+    """{HPX_<order>: pixel} for every order of `ORDERS`, e.g. to add to a parsed notice."""
+    if ra is None or dec is None:
+        return {f"HPX_{order}": None for order in ORDERS}
+    fine = ang2pix(INDEX_ORDER, ra, dec)
+    return {f"HPX_{order}": fine >> (2 * (INDEX_ORDER - order)) for order in ORDERS}
+
+
+def cone_search(df, ra: float, dec: float, radius_deg: float, ra_col: str = "NEXT_POINT_RA", dec_col: str = "NEXT_POINT_DEC"):
+    """
+    Rows of a Spark DataFrame with an HPX_10 column within `radius_deg` of (ra, dec), with their `distance_deg`.
+    The pixel ranges are literals, so Delta skips the files whose HPX_10 min/max do not overlap them.
+    """
+    from functools import reduce
+    from pyspark.sql import functions as F
+
+    candidates = reduce(
+        lambda a, b: a | b,
+        [F.col(f"HPX_{INDEX_ORDER}").between(lo, hi) for lo, hi in cone_ranges(ra, dec, radius_deg)],
+    )
+    ra1, dec1 = F.radians(F.lit(ra)), F.radians(F.lit(dec))
+    ra2, dec2 = F.radians(F.col(ra_col)), F.radians(F.col(dec_col))
+    h = F.pow(F.sin((dec2 - dec1) / 2), 2) + F.cos(dec1) * F.cos(dec2) * F.pow(F.sin((ra2 - ra1) / 2), 2)
+    distance = F.degrees(2 * F.asin(F.sqrt(F.least(F.lit(1.0), h))))
+    return df.where(candidates).withColumn("distance_deg", distance).where(F.col("distance_deg") <= radius_deg)
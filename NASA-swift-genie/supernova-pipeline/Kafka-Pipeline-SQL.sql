@@ -4,7 +4,7 @@ CREATE OR REPLACE STREAMING TABLE raw_space_events
   CONSTRAINT timestamp_not_null EXPECT (timestamp IS NOT NULL)
 )
 AS
-  SELECT offset, timestamp, value::string as msg
+  SELECT partition, offset, timestamp, value::string as msg
    FROM STREAM read_kafka(
     bootstrapServers => 'kafka.gcn.nasa.gov:9092',
     subscribe => 'gcn.classic.text.SWIFT_POINTDIR',
@@ -27,34 +27,55 @@ AS
 
 -- COMMAND ----------
 
-CREATE OR REPLACE MATERIALIZED VIEW split_events
-COMMENT "Split Swift event message into individual rows"
+CREATE OR REFRESH STREAMING TABLE split_events
+(
+  CONSTRAINT notice_parsed EXPECT (NOTICE_DATE IS NOT NULL AND TGT_NUM IS NOT NULL)
+)
+COMMENT "Swift event messages parsed into typed columns, one row per Kafka (partition, offset)"
 AS
-  WITH extracted_key_values AS (
-    SELECT
-      timestamp,
-      split_part(line, ':', 1) AS key,
-      TRIM(SUBSTRING(line, INSTR(line, ':') + 1)) AS value
-    FROM (
-      SELECT
-        timestamp,
-        explode(split(msg, '\\n')) AS line 
-      FROM (LIVE.raw_space_events)
-    )
-    WHERE line != ''
-  ),
-  pivot_table AS (
-    SELECT *
-    FROM (
-      SELECT key, value, timestamp
-      FROM extracted_key_values
-    )
-    PIVOT (
-      MAX(value) FOR key IN ('TITLE', 'NOTICE_DATE', 'NOTICE_TYPE', 'NEXT_POINT_RA', 'NEXT_POINT_DEC', 'NEXT_POINT_ROLL', 'SLEW_TIME', 'SLEW_DATE', 'OBS_TIME', 'TGT_NAME', 'TGT_NUM', 'MERIT', 'INST_MODES', 'SUN_POSTN', 'SUN_DIST', 'MOON_POSTN', 'MOON_DIST', 'MOON_ILLUM', 'GAL_COORDS', 'ECL_COORDS', 'COMMENTS')
-    )
-  )
-  SELECT timestamp, TITLE, CAST(NOTICE_DATE AS TIMESTAMP) AS NOTICE_DATE, NOTICE_TYPE, NEXT_POINT_RA, NEXT_POINT_DEC, NEXT_POINT_ROLL, SLEW_TIME, SLEW_DATE, OBS_TIME, TGT_NAME, TGT_NUM, CAST(MERIT AS DECIMAL) AS MERIT, INST_MODES, SUN_POSTN, SUN_DIST, MOON_POSTN, MOON_DIST, MOON_ILLUM, GAL_COORDS, ECL_COORDS, COMMENTS
-  FROM pivot_table
+  -- Streaming table: each update only parses the notices that arrived since the previous one,
+  -- instead of recomputing the view over the whole topic history.
+  -- One regexp_extract per field on the whole message: a single pass over the rows,
+  -- no explode into ~25 key/value rows and no pivot shuffle. Values are typed at parse time.
+  -- Fields are matched by line (?m) and split on the first colon only, so values with colons are kept whole.
+  SELECT
+    timestamp,
+    partition,
+    offset,
+    regexp_extract(msg, r'(?m)^TITLE:[ \t]*(.*?)[ \t]*$', 1) AS TITLE,
+    try_to_timestamp(regexp_extract(msg, r'(?m)^NOTICE_DATE:[ \t]*\w+ (\d+ \w+ \d+ \d+:\d+:\d+)', 1), 'd MMM yy HH:mm:ss') AS NOTICE_DATE,
+    regexp_extract(msg, r'(?m)^NOTICE_TYPE:[ \t]*(.*?)[ \t]*$', 1) AS NOTICE_TYPE,
+    try_cast(regexp_extract(msg, r'(?m)^NEXT_POINT_RA:[ \t]*([-+]?[\d.]+)d', 1) AS DOUBLE) AS NEXT_POINT_RA,
+    try_cast(regexp_extract(msg, r'(?m)^NEXT_POINT_DEC:[ \t]*([-+]?[\d.]+)d', 1) AS DOUBLE) AS NEXT_POINT_DEC,
+    try_cast(regexp_extract(msg, r'(?m)^NEXT_POINT_ROLL:[ \t]*([-+]?[\d.]+)d', 1) AS DOUBLE) AS NEXT_POINT_ROLL,
+    try_cast(regexp_extract(msg, r'(?m)^SLEW_TIME:[ \t]*([\d.]+) SOD', 1) AS DOUBLE) AS SLEW_TIME,
+    try_cast(regexp_extract(msg, r'(?m)^SLEW_DATE:[ \t]*(\d+) TJD', 1) AS INT) AS SLEW_TJD,
+    try_cast(regexp_extract(msg, r'(?m)^SLEW_DATE:.*?(\d+) DOY', 1) AS INT) AS SLEW_DOY,
+    try_to_timestamp(regexp_extract(msg, r'(?m)^SLEW_DATE:.*?(\d{2}/\d{2}/\d{2})', 1), 'yy/MM/dd')::date AS SLEW_DATE,
+    try_cast(regexp_extract(msg, r'(?m)^OBS_TIME:[ \t]*([\d.]+) \[sec\]', 1) AS DOUBLE) AS OBS_TIME,
+    regexp_extract(msg, r'(?m)^TGT_NAME:[ \t]*(.*?)[ \t]*$', 1) AS TGT_NAME,
+    try_cast(regexp_extract(msg, r'(?m)^TGT_NUM:[ \t]*(\d+)', 1) AS BIGINT) AS TGT_NUM,
+    try_cast(regexp_extract(msg, r'(?m)^TGT_NUM:.*?Seg_Num:[ \t]*(\d+)', 1) AS INT) AS SEG_NUM,
+    try_cast(regexp_extract(msg, r'(?m)^MERIT:[ \t]*([-+]?[\d.]+)', 1) AS DOUBLE) AS MERIT,
+    try_cast(regexp_extract(msg, r'(?m)^INST_MODES:.*?BAT=(\d+)', 1) AS INT) AS BAT_MODE,
+    try_cast(regexp_extract(msg, r'(?m)^INST_MODES:.*?XRT=(\d+)', 1) AS INT) AS XRT_MODE,
+    try_cast(regexp_extract(msg, r'(?m)^INST_MODES:.*?UVOT=(\d+)', 1) AS INT) AS UVOT_MODE,
+    try_cast(regexp_extract(msg, r'(?m)^SUN_POSTN:[ \t]*([-+]?[\d.]+)d', 1) AS DOUBLE) AS SUN_RA,
+    try_cast(regexp_extract(msg, r'(?m)^SUN_POSTN:.*?\}[ \t]*([-+]?[\d.]+)d', 1) AS DOUBLE) AS SUN_DEC,
+    try_cast(regexp_extract(msg, r'(?m)^SUN_DIST:[ \t]*([\d.]+)', 1) AS DOUBLE) AS SUN_DIST,
+    try_cast(regexp_extract(msg, r'(?m)^SUN_DIST:.*?Sun_angle=[ \t]*([-+]?[\d.]+)', 1) AS DOUBLE) AS SUN_ANGLE,
+    try_cast(regexp_extract(msg, r'(?m)^MOON_POSTN:[ \t]*([-+]?[\d.]+)d', 1) AS DOUBLE) AS MOON_RA,
+    try_cast(regexp_extract(msg, r'(?m)^MOON_POSTN:.*?\}[ \t]*([-+]?[\d.]+)d', 1) AS DOUBLE) AS MOON_DEC,
+    try_cast(regexp_extract(msg, r'(?m)^MOON_DIST:[ \t]*([\d.]+)', 1) AS DOUBLE) AS MOON_DIST,
+    try_cast(regexp_extract(msg, r'(?m)^MOON_ILLUM:[ \t]*([\d.]+)', 1) AS DOUBLE) AS MOON_ILLUM,
+    try_cast(regexp_extract(msg, r'(?m)^GAL_COORDS:[ \t]*([-+]?[\d.]+)', 1) AS DOUBLE) AS GAL_LON,
+    try_cast(regexp_extract(msg, r'(?m)^GAL_COORDS:[^,]*,[ \t]*([-+]?[\d.]+)', 1) AS DOUBLE) AS GAL_LAT,
+    try_cast(regexp_extract(msg, r'(?m)^ECL_COORDS:[ \t]*([-+]?[\d.]+)', 1) AS DOUBLE) AS ECL_LON,
+    try_cast(regexp_extract(msg, r'(?m)^ECL_COORDS:[^,]*,[ \t]*([-+]?[\d.]+)', 1) AS DOUBLE) AS ECL_LAT,
+    array_join(regexp_extract_all(msg, r'(?m)^COMMENTS:[ \t]*(.*?)[ \t]*$', 1), ' ') AS COMMENTS
+  -- No de-duplication needed: raw_space_events already holds each Kafka (partition, offset) exactly once,
+  -- and a plain projection emits every notice in the update that reads it (no watermark delay)
+  FROM STREAM(LIVE.raw_space_events)
 
 -- COMMAND ----------
 
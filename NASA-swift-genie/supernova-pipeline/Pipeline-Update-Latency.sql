@@ -0,0 +1,60 @@
+-- Databricks notebook source
+-- MAGIC %md
+-- MAGIC # split_events update latency
+-- MAGIC `split_events` is a streaming table: every pipeline update only parses the notices that arrived since the previous update, so the update time should follow the number of new notices and stay flat while the topic history grows. These queries read the pipeline event log to check it. Change the table name to the one of your pipeline.
+
+-- COMMAND ----------
+
+CREATE OR REPLACE TEMPORARY VIEW split_events_flow_progress AS
+  SELECT
+    origin.update_id,
+    timestamp,
+    details:flow_progress.status AS status,
+    details:flow_progress.metrics.num_output_rows::bigint AS num_output_rows
+  FROM event_log(TABLE(demo_frank.nasa.split_events))
+  WHERE event_type = 'flow_progress'
+    AND origin.flow_name LIKE '%split_events';
+
+-- COMMAND ----------
+
+-- DBTITLE 1,Duration and new rows per update
+SELECT
+  update_id,
+  min(timestamp) AS started,
+  timestampdiff(MILLISECOND, min(timestamp), max(timestamp)) / 1000 AS duration_s,
+  sum(num_output_rows) AS new_rows,
+  max_by(status, timestamp) AS final_status
+FROM split_events_flow_progress
+GROUP BY update_id
+ORDER BY started DESC;
+
+-- COMMAND ----------
+
+-- DBTITLE 1,Latency vs. table size
+-- With the previous materialized view the duration grew with the total row count; it should now depend on new_rows only
+WITH updates AS (
+  SELECT
+    update_id,
+    min(timestamp) AS started,
+    timestampdiff(MILLISECOND, min(timestamp), max(timestamp)) / 1000 AS duration_s,
+    coalesce(sum(num_output_rows), 0) AS new_rows
+  FROM split_events_flow_progress
+  GROUP BY update_id
+)
+SELECT
+  started,
+  duration_s,
+  new_rows,
+  sum(new_rows) OVER (ORDER BY started) AS total_rows
+FROM updates
+ORDER BY started;
+
+-- COMMAND ----------
+
+-- DBTITLE 1,Freshness: Kafka timestamp of the newest parsed notice
+SELECT
+  max(timestamp) AS newest_kafka_timestamp,
+  timestampdiff(SECOND, max(timestamp), current_timestamp()) AS seconds_behind,
+  count(*) AS rows,
+  count(*) - count(DISTINCT partition, offset) AS duplicate_offsets
+FROM demo_frank.nasa.split_events;
@@ -27,7 +27,8 @@
 
 # COMMAND ----------
 
-import urllib
+import urllib.request
+import urllib.error
 import os
 from databricks.sdk.service import catalog
 from databricks.sdk import WorkspaceClient
@@ -42,19 +43,94 @@ volume="data"
 dbutils.widgets.text("catalog_name", defaultValue=catalog_name, label="Catalog Name")
 dbutils.widgets.text("schema_name", defaultValue=schema_name, label="Schema Name")
 
-files = ['browsing_history', 'customers', 'email_logs', 'product_catalog', 'purchases']
 spark.sql(f"CREATE SCHEMA IF NOT EXISTS {catalog_name}.{schema_name}")
 spark.sql(f"CREATE VOLUME IF NOT EXISTS {catalog_name}.{schema_name}.{volume}")
 base_url = 'https://raw.githubusercontent.com/marionlamoureux/agent-workshop/June2025/agents-workshop/data/'
 
-for d in files:
-  file_name = d+'.csv'
-  url = base_url+file_name
-  urllib.request.urlretrieve(url, f'/Volumes/{catalog_name}/{schema_name}/{volume}/{file_name}')
-  df_csv = spark.read.csv(f'/Volumes/{catalog_name}/{schema_name}/{volume}/{file_name}',
-    header=True,
-    sep=",")
-  df_csv.write.option("mergeSchema", "true").mode("append").saveAsTable(f'{catalog_name}.{schema_name}.{d}')
+# Declared schema (every column of the file, in file order) and natural keys of each dataset: the CSV is read once
+# with this schema, never inferred. The header is checked against it, so a file whose columns changed fails the load
+# instead of being read into the wrong columns: add the new columns here.
+# Ids stay strings: the tool functions join and return them as STRING.
+# keys=None marks event tables without an id: identical rows are legitimate there, so they are always replaced, not merged.
+datasets = {
+  'browsing_history': {'keys': None, 'schema': 'customer_id STRING, item_id STRING, action STRING'},
+  'customers': {'keys': ['customer_id'], 'schema': 'customer_id STRING, name STRING'},
+  'email_logs': {'keys': None, 'schema': 'customer_id STRING, subject STRING, sent_date DATE, opened BOOLEAN, clicked BOOLEAN'},
+  'product_catalog': {'keys': ['item_id'], 'schema': 'item_id STRING, description STRING'},
+  'purchases': {'keys': None, 'schema': 'customer_id STRING, item_id STRING, purchase_date DATE'},
+}
+
+# COMMAND ----------
+
+# DBTITLE 1,Idempotent parallel loader
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+
+def get_table_properties(table_name):
+  if not spark.catalog.tableExists(table_name):
+    return {}
+  return {r.key: r.value for r in spark.sql(f"SHOW TBLPROPERTIES {table_name}").collect()}
+
+def download(url, path, etag=None):
+  """Download url to path, returns (sha256, etag), or (None, etag) if the server says it did not change"""
+  request = urllib.request.Request(url, headers={'If-None-Match': etag} if etag else {})
+  try:
+    response = urllib.request.urlopen(request)
+  except urllib.error.HTTPError as e:
+    if e.code == 304:
+      return None, etag
+    raise
+  sha256 = hashlib.sha256()
+  with response, open(path, 'wb') as f:
+    for block in iter(lambda: response.read(1 << 20), b''):
+      sha256.update(block)
+      f.write(block)
+  return sha256.hexdigest(), response.headers.get('ETag')
+
+def merge_into(df, table_name, keys):
+  """Upsert df into table_name on keys and delete the rows that are no longer in the file"""
+  df.dropDuplicates(keys).createOrReplaceTempView(f"src_{table_name.split('.')[-1]}")
+  on = ' AND '.join(f't.`{k}` <=> s.`{k}`' for k in keys)
+  changed = ' OR '.join(f'NOT (t.`{c}` <=> s.`{c}`)' for c in df.columns if c not in keys) or 'false'
+  spark.sql(f"""
+    MERGE INTO {table_name} t
+    USING src_{table_name.split('.')[-1]} s
+    ON {on}
+    WHEN MATCHED AND ({changed}) THEN UPDATE SET *
+    WHEN NOT MATCHED THEN INSERT *
+    WHEN NOT MATCHED BY SOURCE THEN DELETE
+  """)
+
+def load_dataset(name, spec):
+  table_name = f'{catalog_name}.{schema_name}.{name}'
+  file_name = name + '.csv'
+  path = f'/Volumes/{catalog_name}/{schema_name}/{volume}/{file_name}'
+  properties = get_table_properties(table_name)
+
+  # Skip unchanged files: conditional request on the ETag, then compare the content checksum
+  sha256, etag = download(base_url + file_name, path, properties.get('workshop.source_etag'))
+  if sha256 is None or sha256 == properties.get('workshop.source_sha256'):
+    return f'{name}: unchanged, skipped'
+
+  df = spark.read.schema(spec['schema']).option("enforceSchema", False).csv(path, header=True, sep=",")
+
+  existing = spark.table(table_name).schema if properties else None
+  # A table without the checksum property was created by the previous append-only loader: it may hold
+  # duplicated rows, which a MERGE would never remove, so it is rewritten once like a first load
+  legacy = existing is not None and 'workshop.source_sha256' not in properties
+  if existing is None or legacy or spec['keys'] is None or [(f.name, f.dataType) for f in existing] != [(f.name, f.dataType) for f in df.schema]:
+    df.write.mode("overwrite").option("overwriteSchema", "true").saveAsTable(table_name)
+    action = 'replaced'
+  else:
+    merge_into(df, table_name, spec['keys'])
+    action = 'merged'
+
+  spark.sql(f"ALTER TABLE {table_name} SET TBLPROPERTIES ('workshop.source_sha256' = '{sha256}', 'workshop.source_etag' = '{etag or ''}')")
+  return f'{name}: {action}'
+
+with ThreadPoolExecutor(max_workers=len(datasets)) as pool:
+  for result in pool.map(lambda item: load_dataset(*item), datasets.items()):
+    print(result)
 
 # COMMAND ----------
 
@@ -0,0 +1,181 @@
+# Databricks notebook source
+# MAGIC %md
+# MAGIC # Structure-aware incremental chunking of the product docs
+# MAGIC
+# MAGIC `data/product_docs.csv` holds one long markdown manual per product (`##` title, `###` sections). Indexed as is, a whole manual is a single retrieval unit.
+# MAGIC
+# MAGIC This notebook:
+# MAGIC 1. Splits every manual on its markdown section boundaries, packing consecutive sections into chunks that fit a token budget (oversized sections are split on paragraphs, then lines). The chunker is a vectorized pandas UDF.
+# MAGIC 2. Keys every chunk on a content hash, so an unchanged chunk keeps its id whatever its position in the manual.
+# MAGIC 3. `MERGE`s into `product_docs_chunked`: only new chunks are inserted and only chunks that disappeared are deleted. With the change data feed enabled, the Delta Sync vector index re-embeds only those rows, so re-indexing after a doc edit is proportional to the edit, not to the corpus.
+
+# COMMAND ----------
+
+import os
+import pandas as pd
+
+catalog_name = "marion_test"
+schema_name = "email"
+
+source_path = os.path.abspath("../data/product_docs.csv")
+chunks_table = f"{catalog_name}.{schema_name}.product_docs_chunked"
+
+# Token budget per chunk. Tokens are approximated as 4 characters, like the cost estimate of the discovery notebook.
+CHUNK_SIZE_TOKENS = 256
+
+# COMMAND ----------
+
+# DBTITLE 1,Markdown section chunker
+import re
+from typing import List, Tuple
+
+HEADING = re.compile(r"^(#{1,6})\s+(.*)$", re.MULTILINE)
+
+def approx_tokens(text: str) -> int:
+    return (len(text) + 3) // 4
+
+def split_sections(doc: str) -> List[Tuple[str, str]]:
+    """Split a markdown doc into (heading path, section text) on its headings"""
+    sections, path = [], []
+    matches = list(HEADING.finditer(doc))
+    if not matches or matches[0].start() > 0:
+        preamble = doc[:matches[0].start()] if matches else doc
+        if preamble.strip():
+            sections.append(("", preamble.strip()))
+    for i, m in enumerate(matches):
+        level, title = len(m.group(1)), m.group(2).strip()
+        path = [p for p in path if p[0] < level] + [(level, title)]
+        end = matches[i + 1].start() if i + 1 < len(matches) else len(doc)
+        body = doc[m.end():end].strip()
+        if body:
+            sections.append((" > ".join(t for _, t in path), body))
+    return sections
+
+def split_oversized(text: str, budget: int) -> List[str]:
+    """Split a section that does not fit the budget on paragraphs, then lines, then characters"""
+    for separator in ["\n\n", "\n"]:
+        parts = [p for p in text.split(separator) if p.strip()]
+        if len(parts) > 1:
+            pieces, current = [], ""
+            for part in parts:
+                candidate = f"{current}{separator}{part}" if current else part
+                if approx_tokens(candidate) <= budget:
+                    current = candidate
+                else:
+                    if current:
+                        pieces.append(current)
+                    current = part
+            if current:
+                pieces.append(current)
+            return [q for p in pieces for q in (split_oversized(p, budget) if approx_tokens(p) > budget else [p])]
+    return [text[i:i + budget * 4] for i in range(0, len(text), budget * 4)]
+
+def chunk_markdown(doc: str, budget: int = CHUNK_SIZE_TOKENS) -> List[Tuple[str, str]]:
+    """Pack consecutive sections into (section, chunk text) pairs within the token budget"""
+    chunks, current_section, current = [], None, ""
+    for section, body in split_sections(doc or ""):
+        block = f"### {section}\n{body}" if section else body
+        if approx_tokens(block) > budget:
+            if current:
+                chunks.append((current_section, current))
+                current_section, current = None, ""
+            heading = f"### {section}\n" if section else ""
+            pieces = split_oversized(body, budget - approx_tokens(heading))
+            chunks.extend((section, heading + piece) for piece in pieces)
+        elif current and approx_tokens(current + "\n\n" + block) > budget:
+            chunks.append((current_section, current))
+            current_section, current = section, block
+        else:
+            current_section = current_section if current else section
+            current = f"{current}\n\n{block}" if current else block
+    if current:
+        chunks.append((current_section, current))
+    return chunks
+
+# COMMAND ----------
+
+# DBTITLE 1,Vectorized chunking UDF
+from pyspark.sql.functions import pandas_udf, explode, col, sha2, concat_ws
+from pyspark.sql.types import ArrayType, StructType, StructField, StringType, IntegerType
+
+chunk_schema = ArrayType(StructType([
+    StructField("section", StringType()),
+    StructField("chunk_text", StringType()),
+    StructField("token_count", IntegerType()),
+]))
+
+@pandas_udf(chunk_schema)
+def chunk_docs(docs: pd.Series) -> pd.Series:
+    return docs.apply(
+        lambda doc: [
+            {"section": section, "chunk_text": text, "token_count": approx_tokens(text)}
+            for section, text in chunk_markdown(doc)
+        ]
+    )
+
+docs_df = spark.createDataFrame(pd.read_csv(source_path, dtype=str))
+
+chunks_df = (
+    docs_df
+    .select("product_id", "product_name", "product_category", "product_sub_category", explode(chunk_docs("product_doc")).alias("chunk"))
+    .select("product_id", "product_name", "product_category", "product_sub_category", "chunk.*")
+    # The product id is part of the hash so identical boilerplate sections of two products get distinct ids
+    .withColumn("chunk_id", sha2(concat_ws("\n", col("product_id"), col("chunk_text")), 256))
+    .dropDuplicates(["chunk_id"])
+)
+
+display(chunks_df)
+
+# COMMAND ----------
+
+# MAGIC %md
+# MAGIC ## Incremental upsert
+# MAGIC Matched chunks are left untouched (no change data feed entry, no re-embedding). The source is the whole corpus, so chunks that are no longer produced (edited or removed sections) are deleted.
+
+# COMMAND ----------
+
+if not spark.catalog.tableExists(chunks_table):
+    chunks_df.write.saveAsTable(chunks_table)
+    # Enable CDC for Vector Search Delta Sync
+    spark.sql(f"ALTER TABLE {chunks_table} SET TBLPROPERTIES (delta.enableChangeDataFeed = true)")
+else:
+    chunks_df.createOrReplaceTempView("new_product_doc_chunks")
+    spark.sql(f"""
+        MERGE INTO {chunks_table} t
+        USING new_product_doc_chunks s
+        ON t.chunk_id = s.chunk_id
+        WHEN NOT MATCHED THEN INSERT *
+        WHEN NOT MATCHED BY SOURCE THEN DELETE
+    """)
+
+# Rows inserted / deleted by the last commit: this is what the vector index will re-embed
+display(spark.sql(f"DESCRIBE HISTORY {chunks_table} LIMIT 1").select("version", "operation", "operationMetrics"))
+
+# COMMAND ----------
+
+# MAGIC %md
+# MAGIC ## Vector index over the chunks
+# MAGIC Create the Delta Sync index once; a triggered sync then only processes the rows changed by the `MERGE` above.
+
+# COMMAND ----------
+
+from databricks.vector_search.client import VectorSearchClient
+
+vector_endpoint_name = f'vs_endpoint_product_{schema_name}'
+chunks_index_name = f'{catalog_name}.{schema_name}.product_docs_chunked_index'
+
+client = VectorSearchClient(disable_notice=True)
+existing_indexes = [i["name"] for i in client.list_indexes(vector_endpoint_name).get("vector_indexes", [])]
+
+if chunks_index_name not in existing_indexes:
+    client.create_delta_sync_index(
+        endpoint_name=vector_endpoint_name,
+        source_table_name=chunks_table,
+        index_name=chunks_index_name,
+        pipeline_type="TRIGGERED",
+        primary_key="chunk_id",
+        embedding_source_column="chunk_text",
+        embedding_model_endpoint_name="databricks-gte-large-en"
+    )
+else:
+    client.get_index(vector_endpoint_name, chunks_index_name).sync()
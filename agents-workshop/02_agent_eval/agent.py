@@ -23,6 +23,8 @@
 # MAGIC - [config.yml]($./config.yml): contains the configurations.
 # MAGIC - [driver]($./driver): logs, evaluate, registers, and deploys the agent.
 # MAGIC
+# MAGIC The [replay.py]($./replay.py) module next to these notebooks provides record/replay stand-ins for the chat model and UC tools, used to performance-test the agent offline (see the `replay` section of config.yml).
+# MAGIC
 # MAGIC This notebook uses Mosaic AI Agent Framework ([AWS](https://docs.databricks.com/en/generative-ai/retrieval-augmented-generation.html) | [Azure](https://learn.microsoft.com/en-us/azure/databricks/generative-ai/retrieval-augmented-generation)) to create your agent. It defines a LangChain agent that has access to tools, which we define in this notebook as well.
 # MAGIC
 # MAGIC Use this notebook to iterate on and modify the agent. For example, you could add more tools or change the system prompt.
@@ -62,6 +64,14 @@ from mlflow.models import ModelConfig
 mlflow.langchain.autolog()
 config = ModelConfig(development_config="config.yml")
 
+
+def get_optional_config(key, default=None):
+    """ModelConfig.get raises a KeyError for keys missing from config.yml"""
+    try:
+        return config.get(key)
+    except KeyError:
+        return default
+
 # COMMAND ----------
 
 # MAGIC %md
@@ -77,17 +87,73 @@ config = ModelConfig(development_config="config.yml")
 from langchain_community.chat_models import ChatDatabricks
 from langchain_community.tools.databricks import UCFunctionToolkit
 from databricks.sdk import WorkspaceClient
+from langchain_community.embeddings import DatabricksEmbeddings
+from langchain_core.tools import create_retriever_tool
+from replay import ReplayStore, LatencyModel, record_stand_ins, replay_stand_ins
+from ann_index import IVFFlatIndex, LocalIndexRetriever
+
+# Modules shared by the demos live in shared/ at the root of the repo; a logged agent gets them from its code_paths
+import os, sys
+sys.path.append(os.path.abspath("../../shared"))
+from embedding_cache import CachedEmbeddings
+from bm25_index import BM25Index, BM25Retriever
+
+# Record/replay stand-ins for offline performance testing, see replay.py (off | record | replay)
+replay_config = get_optional_config("replay", {"mode": "off"})
+replay_mode = replay_config.get("mode", "off")
+
+if replay_mode == "replay":
+    # Serve recorded LLM responses and tool results: no endpoint, warehouse or network needed
+    llm, tools = replay_stand_ins(
+        ReplayStore(replay_config["store_path"]),
+        llm_latency=LatencyModel.from_config(replay_config.get("llm_latency")),
+        tool_latency=LatencyModel.from_config(replay_config.get("tool_latency")),
+    )
+else:
+    # Create the llm
+    llm = ChatDatabricks(endpoint=config.get("llm_endpoint"))
 
-# Create the llm
-llm = ChatDatabricks(endpoint=config.get("llm_endpoint"))
+    uc_functions = config.get("uc_functions")
 
-uc_functions = config.get("uc_functions")
+    tools = (
+        UCFunctionToolkit(warehouse_id=config.get("warehouse_id"))
+        .include(*uc_functions)
+        .get_tools()
+    )
 
-tools = (
-    UCFunctionToolkit(warehouse_id=config.get("warehouse_id"))
-    .include(*uc_functions)
-    .get_tools()
-)
+    # In-process product catalog index built by the local_product_index notebook, see ann_index.py
+    local_product_index = get_optional_config("local_product_index")
+    if local_product_index:
+        # Repeated queries are embedded once, see shared/embedding_cache.py
+        query_embeddings = CachedEmbeddings(
+            DatabricksEmbeddings(endpoint="databricks-gte-large-en"),
+            disk_path=get_optional_config("embedding_cache_path"),
+        )
+        tools.append(
+            create_retriever_tool(
+                LocalIndexRetriever(
+                    index=IVFFlatIndex.load(local_product_index),
+                    embeddings=query_embeddings,
+                    k=5,
+                ),
+                "product_local_search",
+                "Searches the product catalog and returns the descriptions of the products most relevant to the query.",
+            )
+        )
+
+    # Keyword index over the policies and product docs built by the local_keyword_index notebook, see bm25_index.py
+    bm25_index = get_optional_config("bm25_index")
+    if bm25_index:
+        tools.append(
+            create_retriever_tool(
+                BM25Retriever(index=BM25Index.load(bm25_index), k=5),
+                "docs_keyword_search",
+                "Keyword search over the company policies and the product manuals. Best for exact policy or product names.",
+            )
+        )
+
+    if replay_mode == "record":
+        llm, tools = record_stand_ins(llm, tools, ReplayStore(replay_config["store_path"]))
 
 # COMMAND ----------
 
@@ -209,9 +275,12 @@ def wrap_output(stream: Iterator[MessageLikeRepresentation]) -> Iterator[str]:
 # MAGIC * [LangGraph - Quick Start](https://langchain-ai.github.io/langgraph/tutorials/introduction/) for explanations of the concepts used in this LangGraph agent
 # MAGIC * [LangGraph - How-to Guides](https://langchain-ai.github.io/langgraph/how-tos/) to expand the functionality of your agent
 # MAGIC
+# MAGIC The agent loops between the "agent" and "tools" nodes until the model stops calling tools. `max_steps` and `time_budget_s` in [config.yml]($./config.yml) cap that loop: once a limit is hit, the graph routes to a "halt" node that answers the pending tool calls with a "not run" ToolMessage and ends the conversation instead of calling more tools.
+# MAGIC
 
 # COMMAND ----------
 
+import time
 from typing import (
     Annotated,
     Optional,
@@ -241,12 +310,17 @@ class AgentState(TypedDict):
     """The state of the agent."""
 
     messages: Annotated[Sequence[BaseMessage], add_messages]
+    # Number of model calls and start time of the conversation, used by the loop limits
+    steps: int
+    started_at: float
 
 
 def create_tool_calling_agent(
     model: LanguageModelLike,
     tools: Union[ToolExecutor, Sequence[BaseTool]],
     agent_prompt: Optional[str] = None,
+    max_steps: Optional[int] = None,
+    time_budget_s: Optional[float] = None,
 ) -> CompiledGraph:
     model = model.bind_tools(tools)
 
@@ -257,6 +331,11 @@ def create_tool_calling_agent(
         # If there is no function call, then we finish
         if not last_message.tool_calls:
             return "end"
+        # Short-circuit runaway loops instead of calling more tools
+        elif max_steps and state["steps"] >= max_steps:
+            return "halt"
+        elif time_budget_s and time.time() - state["started_at"] >= time_budget_s:
+            return "halt"
         else:
             return "continue"
 
@@ -274,13 +353,37 @@ def create_tool_calling_agent(
         state: AgentState,
         config: RunnableConfig,
     ):
+        started_at = state.get("started_at") or time.time()
         response = model_runnable.invoke(state, config)
-        return {"messages": [response]}
+        return {
+            "messages": [response],
+            "steps": state.get("steps", 0) + 1,
+            "started_at": started_at,
+        }
+
+    # Define the function that ends the conversation when a loop limit is hit.
+    # The pending tool calls are answered first: a tool call without its ToolMessage is rejected by the
+    # chat APIs when the conversation is continued or replayed
+    def halt(state: AgentState):
+        elapsed = time.time() - state["started_at"]
+        skipped = [
+            ToolMessage(content="Not run: the agent loop limit was reached.", tool_call_id=call["id"], name=call["name"])
+            for call in state["messages"][-1].tool_calls
+        ]
+        return {
+            "messages": skipped + [
+                AIMessage(
+                    content=f"I stopped after {state['steps']} steps ({elapsed:.1f}s) without a final answer. "
+                    "Please narrow down the question and try again."
+                )
+            ]
+        }
 
     workflow = StateGraph(AgentState)
 
     workflow.add_node("agent", RunnableLambda(call_model))
     workflow.add_node("tools", ToolNode(tools))
+    workflow.add_node("halt", RunnableLambda(halt))
 
     workflow.set_entry_point("agent")
     workflow.add_conditional_edges(
@@ -295,10 +398,13 @@ def create_tool_calling_agent(
             "continue": "tools",
             # END is a special node marking that the graph should finish.
             "end": END,
+            # If a loop limit is hit, we stop with an explanation.
+            "halt": "halt",
         },
     )
     # We now add a unconditional edge from tools to agent.
     workflow.add_edge("tools", "agent")
+    workflow.add_edge("halt", END)
 
     return workflow.compile()
 
@@ -307,17 +413,14 @@ def create_tool_calling_agent(
 from langchain_core.runnables import RunnableGenerator
 from mlflow.langchain.output_parsers import ChatCompletionsOutputParser
 
-# Create the agent with the system message if it exists
-try:
-    agent_prompt = config.get("agent_prompt")
-
-    agent_with_raw_output = create_tool_calling_agent(
-        llm, 
-        tools, 
-        agent_prompt=agent_prompt
-    )
-except KeyError:
-    agent_with_raw_output = create_tool_calling_agent(llm, tools)
+# Create the agent with the system message and loop limits if they exist
+agent_with_raw_output = create_tool_calling_agent(
+    llm,
+    tools,
+    agent_prompt=get_optional_config("agent_prompt"),
+    max_steps=get_optional_config("max_steps"),
+    time_budget_s=get_optional_config("time_budget_s"),
+)
 
 agent = agent_with_raw_output | RunnableGenerator(wrap_output) | ChatCompletionsOutputParser()
 
@@ -327,12 +430,20 @@ agent = agent_with_raw_output | RunnableGenerator(wrap_output) | ChatCompletions
 # MAGIC ## Test the agent
 # MAGIC
 # MAGIC Interact with the agent to test its output. Since this notebook called `mlflow.langchain.autolog()` you can view the trace for each step the agent takes.
+# MAGIC
+# MAGIC The [profiling.py]($./profiling.py) `AgentProfiler` callback records the latency of each node, the tokens in and out of each model call, the tool durations and the number of iterations.
 
 # COMMAND ----------
 
-for event in agent.stream({"messages": [{"role": "user", "content": "Please draft a marketing email for David Sanchez recommending a few products from the product catalog resembling the ones found in his browsing history?"}]}):
+from profiling import AgentProfiler
+
+profiler = AgentProfiler()
+
+for event in agent.stream({"messages": [{"role": "user", "content": "Please draft a marketing email for David Sanchez recommending a few products from the product catalog resembling the ones found in his browsing history?"}]}, config={"callbacks": [profiler]}):
     print(event, "---" * 20 + "\n")
 
+print(profiler.summary())
+
 # COMMAND ----------
 
 # Log agent 
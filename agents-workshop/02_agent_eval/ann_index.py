@@ -0,0 +1,256 @@
+"""
+In-process approximate nearest neighbour (IVF-flat) index over the product_catalog description embeddings.
+
+The catalog is small enough to be searched in the agent's own process, which avoids the warehouse hop
+and the remote index query of the `product_vector_search` UC function:
+
+- Vectors are L2-normalised and grouped by their nearest k-means centroid ("inverted lists"), so each
+  list is a contiguous slice of one float32 array. A query scores the centroids, then only the
+  `n_probe` closest lists (cosine similarity = dot product).
+- The index is saved as plain .npy files and reopened with `mmap_mode="r"`, so loading is instant and
+  the vectors are shared through the page cache instead of being copied per process.
+- Incremental changes (from the table's change data feed) go to a small in-memory delta segment plus
+  a set of deleted ids. The delta is always scanned exhaustively; `save()` folds it back into the lists.
+
+See the local_product_index notebook for the build, the CDF refresh and the comparison with the
+remote Vector Search index.
+"""
+
+import json
+import os
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+def _spherical_kmeans(vectors: np.ndarray, n_lists: int, n_iter: int = 10, seed: int = 0) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    centroids = vectors[rng.choice(len(vectors), size=n_lists, replace=False)].copy()
+    for _ in range(n_iter):
+        assignments = np.argmax(vectors @ centroids.T, axis=1)
+        for i in range(n_lists):
+            members = vectors[assignments == i]
+            if len(members):
+                centroids[i] = members.sum(axis=0)
+        centroids = _normalize(centroids)
+    return centroids
+
+
+class IVFFlatIndex:
+    """IVF-flat cosine index with an in-memory delta segment for incremental updates."""
+
+    def __init__(
+        self,
+        ids: Sequence[str],
+        vectors: np.ndarray,
+        offsets: np.ndarray,
+        centroids: np.ndarray,
+        documents: Dict[str, str],
+        version: Optional[int] = None,
+    ):
+        self.ids = list(ids)
+        self.vectors = vectors
+        self.offsets = offsets
+        self.centroids = centroids
+        self.documents = documents
+        # Last table version folded into the index, used to resume the change data feed
+        self.version = version
+        self._delta_ids: List[str] = []
+        self._delta_vectors = np.zeros((0, vectors.shape[1]), dtype=np.float32)
+        self._deleted = set()
+
+    @classmethod
+    def build(
+        cls,
+        ids: Sequence[str],
+        vectors: np.ndarray,
+        documents: Dict[str, str],
+        n_lists: Optional[int] = None,
+        version: Optional[int] = None,
+        seed: int = 0,
+    ) -> "IVFFlatIndex":
+        vectors = _normalize(vectors)
+        n_lists = n_lists or max(1, int(np.sqrt(len(vectors))))
+        n_lists = min(n_lists, len(vectors))
+        centroids = _spherical_kmeans(vectors, n_lists, seed=seed)
+        return cls._layout(list(ids), vectors, centroids, documents, version)
+
+    @classmethod
+    def _layout(cls, ids, vectors, centroids, documents, version) -> "IVFFlatIndex":
+        # Sort the rows by list so that every inverted list is a contiguous slice
+        assignments = np.argmax(vectors @ centroids.T, axis=1)
+        order = np.argsort(assignments, kind="stable")
+        offsets = np.zeros(len(centroids) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(assignments, minlength=len(centroids)), out=offsets[1:])
+        return cls([ids[i] for i in order], np.ascontiguousarray(vectors[order]), offsets, centroids, documents, version)
+
+    @property
+    def size(self) -> int:
+        live = len(self.ids) - sum(1 for i in self.ids if i in self._deleted)
+        return live + len(self._delta_ids)
+
+    def search(self, query_vector: Sequence[float], k: int = 5, n_probe: int = 8) -> List[Tuple[str, float]]:
+        """Return the `k` (id, cosine similarity) pairs closest to `query_vector`."""
+        query = _normalize(np.asarray(query_vector, dtype=np.float32))
+        n_probe = min(n_probe, len(self.centroids))
+        lists = np.argpartition(-(self.centroids @ query), n_probe - 1)[:n_probe]
+
+        candidates: List[Tuple[np.ndarray, List[str]]] = []
+        for l in lists:
+            start, end = self.offsets[l], self.offsets[l + 1]
+            if end > start:
+                candidates.append((self.vectors[start:end] @ query, self.ids[start:end]))
+        if self._delta_ids:
+            candidates.append((self._delta_vectors @ query, self._delta_ids))
+        if not candidates:
+            return []
+
+        scores = np.concatenate([c[0] for c in candidates])
+        ids = [i for c in candidates for i in c[1]]
+        # Ask for a few more than k so that deleted/superseded rows can be skipped
+        overfetch = min(len(scores), k + len(self._deleted))
+        top = np.argpartition(-scores, overfetch - 1)[:overfetch]
+        top = top[np.argsort(-scores[top])]
+
+        results, seen = [], set()
+        for i in top:
+            # A row updated through the delta keeps a stale copy in its list until the next save()
+            if ids[i] in seen or (ids[i] in self._deleted and i < len(scores) - len(self._delta_ids)):
+                continue
+            seen.add(ids[i])
+            results.append((ids[i], float(scores[i])))
+            if len(results) == k:
+                break
+        return results
+
+    def upsert(self, ids: Sequence[str], vectors: np.ndarray, documents: Sequence[str]):
+        vectors = _normalize(vectors)
+        keep = [n for n, i in enumerate(self._delta_ids) if i not in set(ids)]
+        self._delta_ids = [self._delta_ids[n] for n in keep] + list(ids)
+        self._delta_vectors = np.concatenate([self._delta_vectors[keep], vectors])
+        # Rows already in the lists are masked and re-served from the delta
+        self._deleted.update(ids)
+        self.documents.update(zip(ids, documents))
+
+    def delete(self, ids: Sequence[str]):
+        keep = [n for n, i in enumerate(self._delta_ids) if i not in set(ids)]
+        self._delta_ids = [self._delta_ids[n] for n in keep]
+        self._delta_vectors = self._delta_vectors[keep]
+        self._deleted.update(ids)
+        for i in ids:
+            self.documents.pop(i, None)
+
+    def compact(self, rebuild_ratio: float = 2.0) -> "IVFFlatIndex":
+        """Fold the delta segment back into the inverted lists, re-clustering if the index grew a lot."""
+        live = [n for n, i in enumerate(self.ids) if i not in self._deleted]
+        ids = [self.ids[n] for n in live] + self._delta_ids
+        vectors = np.concatenate([np.asarray(self.vectors)[live], self._delta_vectors])
+        if not len(vectors):
+            # Everything was deleted: nothing to re-cluster, keep the centroids with empty lists
+            return IVFFlatIndex._layout(ids, vectors, self.centroids, self.documents, self.version)
+        if len(vectors) > rebuild_ratio * len(self.ids) or len(vectors) < len(self.ids) / rebuild_ratio:
+            return IVFFlatIndex.build(ids, vectors, self.documents, version=self.version)
+        return IVFFlatIndex._layout(ids, vectors, self.centroids, self.documents, self.version)
+
+    def save(self, path: str) -> "IVFFlatIndex":
+        """Compact and write the index to `path`; returns the compacted index."""
+        index = self.compact()
+        os.makedirs(path, exist_ok=True)
+        np.save(os.path.join(path, "vectors.npy"), index.vectors)
+        np.save(os.path.join(path, "offsets.npy"), index.offsets)
+        np.save(os.path.join(path, "centroids.npy"), index.centroids)
+        with open(os.path.join(path, "meta.json"), "w") as f:
+            json.dump({"ids": index.ids, "documents": index.documents, "version": index.version}, f)
+        return index
+
+    @classmethod
+    def load(cls, path: str) -> "IVFFlatIndex":
+        with open(os.path.join(path, "meta.json")) as f:
+            meta = json.load(f)
+        return cls(
+            meta["ids"],
+            np.load(os.path.join(path, "vectors.npy"), mmap_mode="r"),
+            np.load(os.path.join(path, "offsets.npy")),
+            np.load(os.path.join(path, "centroids.npy")),
+            meta["documents"],
+            meta["version"],
+        )
+
+
+def refresh_from_change_feed(
+    spark,
+    index: IVFFlatIndex,
+    table_name: str,
+    embed_documents: Callable[[List[str]], List[List[float]]],
+    id_column: str = "item_id",
+    text_column: str = "description",
+) -> int:
+    """
+    Apply the changes committed to `table_name` since `index.version` using the Delta change data feed.
+    Only inserted/updated rows are embedded, in one batch. Returns the number of changed ids.
+    """
+    from pyspark.sql import Window
+    import pyspark.sql.functions as F
+
+    latest_version = spark.sql(f"DESCRIBE HISTORY {table_name} LIMIT 1").collect()[0]["version"]
+    if index.version is not None and latest_version <= index.version:
+        return 0
+
+    changes = (
+        spark.read.option("readChangeFeed", "true")
+        .option("startingVersion", (index.version or 0) + 1)
+        .table(table_name)
+        .filter(F.col("_change_type") != "update_preimage")
+        # Keep only the last change per id
+        .withColumn(
+            "_rank",
+            F.row_number().over(
+                Window.partitionBy(id_column).orderBy(F.col("_commit_version").desc())
+            ),
+        )
+        .filter("_rank = 1")
+        .select(F.col(id_column).cast("string").alias("id"), F.col(text_column).alias("text"), "_change_type")
+        .collect()
+    )
+
+    deleted = [r["id"] for r in changes if r["_change_type"] == "delete"]
+    upserted = [r for r in changes if r["_change_type"] != "delete"]
+    if deleted:
+        index.delete(deleted)
+    if upserted:
+        texts = [r["text"] or "" for r in upserted]
+        index.upsert([r["id"] for r in upserted], np.asarray(embed_documents(texts)), texts)
+    index.version = latest_version
+    return len(changes)
+
+
+class LocalIndexRetriever(BaseRetriever):
+    """LangChain retriever over an `IVFFlatIndex`; `embeddings` embeds the query (e.g. DatabricksEmbeddings)."""
+
+    index: Any
+    embeddings: Any
+    k: int = 5
+    n_probe: int = 8
+    # Metadata key of the document id, e.g. "id" to fuse with a BM25Retriever over the same documents
+    id_key: str = "item_id"
+
+    class Config:
+        arbitrary_types_allowed = True
+
+    def _get_relevant_documents(
+        self, query: str, *, run_manager: CallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        hits = self.index.search(self.embeddings.embed_query(query), k=self.k, n_probe=self.n_probe)
+        return [
+            Document(page_content=self.index.documents.get(item_id, ""), metadata={self.id_key: item_id, "score": score})
+            for item_id, score in hits
+        ]
@@ -0,0 +1,235 @@
+"""
+Compact in-memory BM25 inverted index over the policies and product docs.
+
+Questions such as "what is the return policy" or an exact product name ("BrownBox SwiftWatch X500")
+do not need an embedding call and a vector search round trip: a lexical index answers them in
+microseconds.
+
+- Postings are array-backed (CSR layout): for term t, `docs[offsets[t]:offsets[t + 1]]` are the
+  documents containing it and `weights[...]` their precomputed BM25 contribution, so a query is a
+  handful of slices and one `np.bincount`.
+- Exact titles (product names, policy names) contained in the query boost their documents to the top.
+- The index is persisted to a single file: a JSON header (vocabulary, document titles and texts)
+  followed by the raw arrays, which `load()` memory-maps.
+- `reciprocal_rank_fusion` / `FusedRetriever` combine it with vector results as a first-stage
+  lexical retriever.
+"""
+
+import json
+import math
+import re
+import struct
+from collections import Counter
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+
+_MAGIC = b"BM25IDX1"
+_TOKEN = re.compile(r"[a-z0-9]+")
+_ARRAYS = [("offsets", np.int64), ("docs", np.int32), ("weights", np.float32)]
+
+
+def tokenize(text: str) -> List[str]:
+    return _TOKEN.findall((text or "").lower())
+
+
+def _normalize_title(text: str) -> str:
+    return " ".join(tokenize(text))
+
+
+class BM25Index:
+    """BM25 (k1, b) index with precomputed per-posting weights."""
+
+    def __init__(self, vocabulary: Dict[str, int], offsets, docs, weights, ids, titles, texts):
+        self.vocabulary = vocabulary
+        self.offsets = offsets
+        self.docs = docs
+        self.weights = weights
+        self.ids = ids
+        self.titles = titles
+        self.texts = texts
+        self._by_title: Dict[str, List[int]] = {}
+        for n, title in enumerate(titles):
+            self._by_title.setdefault(_normalize_title(title), []).append(n)
+
+    @classmethod
+    def build(
+        cls,
+        ids: Sequence[str],
+        titles: Sequence[str],
+        texts: Sequence[str],
+        k1: float = 1.2,
+        b: float = 0.75,
+    ) -> "BM25Index":
+        # The title is indexed with the body so that product names match their sections
+        term_counts = [Counter(tokenize(f"{title} {text}")) for title, text in zip(titles, texts)]
+        lengths = np.array([sum(c.values()) for c in term_counts], dtype=np.float32)
+        avgdl = float(lengths.mean()) if len(lengths) else 0.0
+
+        postings: Dict[str, List[Tuple[int, int]]] = {}
+        for doc, counts in enumerate(term_counts):
+            for term, tf in counts.items():
+                postings.setdefault(term, []).append((doc, tf))
+
+        vocabulary = {term: n for n, term in enumerate(sorted(postings))}
+        offsets = np.zeros(len(vocabulary) + 1, dtype=np.int64)
+        docs, weights = [], []
+        n_docs = len(texts)
+        for term, term_id in vocabulary.items():
+            plist = postings[term]
+            idf = math.log(1 + (n_docs - len(plist) + 0.5) / (len(plist) + 0.5))
+            for doc, tf in plist:
+                norm = k1 * (1 - b + b * lengths[doc] / avgdl)
+                docs.append(doc)
+                weights.append(idf * tf * (k1 + 1) / (tf + norm))
+            offsets[term_id + 1] = len(docs)
+
+        return cls(
+            vocabulary,
+            offsets,
+            np.asarray(docs, dtype=np.int32),
+            np.asarray(weights, dtype=np.float32),
+            list(ids),
+            list(titles),
+            list(texts),
+        )
+
+    def search(self, query: str, k: int = 5) -> List[Tuple[int, float]]:
+        """
+        Return the `k` best (document position, score) pairs. Documents whose title (product or
+        policy name) appears as a phrase in the query rank first, in BM25 order.
+        """
+        normalized = f" {_normalize_title(query)} "
+        exact = [n for title, docs in self._by_title.items() if title and f" {title} " in normalized for n in docs]
+
+        term_ids = {self.vocabulary[t] for t in tokenize(query) if t in self.vocabulary}
+        if not term_ids:
+            return []
+        slices = [slice(self.offsets[t], self.offsets[t + 1]) for t in term_ids]
+        docs = np.concatenate([self.docs[s] for s in slices])
+        weights = np.concatenate([self.weights[s] for s in slices])
+        scores = np.bincount(docs, weights=weights, minlength=len(self.ids))
+
+        top_k = min(k, len(scores))
+        top = np.argpartition(-scores, top_k - 1)[:top_k]
+        exact_set = set(exact)
+        exact = sorted(exact, key=lambda n: -scores[n])
+        ranked = exact + sorted((int(n) for n in top if scores[n] > 0 and n not in exact_set), key=lambda n: -scores[n])
+        return [(n, float(scores[n])) for n in ranked[:k]]
+
+    def save(self, path: str):
+        header = {
+            "vocabulary": self.vocabulary,
+            "ids": self.ids,
+            "titles": self.titles,
+            "texts": self.texts,
+            "arrays": {},
+        }
+        arrays = {"offsets": self.offsets, "docs": self.docs, "weights": self.weights}
+        # Array offsets depend on the header length, which depends on the offsets: lay out after a fixed pad
+        header_bytes = json.dumps(header).encode("utf-8")
+        position = 16 + len(header_bytes) + 1024
+        for name, dtype in _ARRAYS:
+            position = (position + 63) // 64 * 64
+            header["arrays"][name] = {"offset": position, "length": int(len(arrays[name]))}
+            position += len(arrays[name]) * np.dtype(dtype).itemsize
+        header_bytes = json.dumps(header).encode("utf-8")
+
+        with open(path, "wb") as f:
+            f.write(_MAGIC)
+            f.write(struct.pack("<Q", len(header_bytes)))
+            f.write(header_bytes)
+            for name, dtype in _ARRAYS:
+                f.write(b"\0" * (header["arrays"][name]["offset"] - f.tell()))
+                f.write(np.ascontiguousarray(arrays[name], dtype=dtype).tobytes())
+
+    @classmethod
+    def load(cls, path: str) -> "BM25Index":
+        with open(path, "rb") as f:
+            if f.read(8) != _MAGIC:
+                raise ValueError(f"{path} is not a BM25 index file")
+            (header_length,) = struct.unpack("<Q", f.read(8))
+            header = json.loads(f.read(header_length))
+        arrays = {
+            name: np.memmap(path, dtype=dtype, mode="r", offset=header["arrays"][name]["offset"], shape=(header["arrays"][name]["length"],))
+            for name, dtype in _ARRAYS
+        }
+        return cls(
+            header["vocabulary"],
+            arrays["offsets"],
+            arrays["docs"],
+            arrays["weights"],
+            header["ids"],
+            header["titles"],
+            header["texts"],
+        )
+
+
+def build_from_csv(policies_path: str, product_docs_path: str, **kwargs) -> BM25Index:
+    """Index every policy, and every `###` section of every product manual."""
+    import pandas as pd
+
+    ids, titles, texts = [], [], []
+    for row in pd.read_csv(policies_path, dtype=str).fillna("").itertuples():
+        ids.append(f"policy:{row.policy}")
+        titles.append(row.policy)
+        texts.append(row.policy_details)
+    for row in pd.read_csv(product_docs_path, dtype=str).fillna("").itertuples():
+        for n, section in enumerate(re.split(r"\n(?=### )", row.product_doc)):
+            ids.append(f"product:{row.product_id}:{n}")
+            titles.append(row.product_name)
+            texts.append(section.strip())
+    return BM25Index.build(ids, titles, texts, **kwargs)
+
+
+class BM25Retriever(BaseRetriever):
+    """LangChain retriever over a `BM25Index`."""
+
+    index: Any
+    k: int = 5
+
+    class Config:
+        arbitrary_types_allowed = True
+
+    def _get_relevant_documents(
+        self, query: str, *, run_manager: CallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        return [
+            Document(
+                page_content=self.index.texts[n],
+                metadata={"id": self.index.ids[n], "title": self.index.titles[n], "score": score},
+            )
+            for n, score in self.index.search(query, k=self.k)
+        ]
+
+
+def reciprocal_rank_fusion(result_lists: Sequence[Sequence[Document]], k: int = 60, id_key: str = "id") -> List[Document]:
+    """Fuse ranked result lists: score(d) = sum(1 / (k + rank)). Documents are matched on metadata[id_key], else on content."""
+    scores: Dict[str, float] = {}
+    documents: Dict[str, Document] = {}
+    for results in result_lists:
+        for rank, doc in enumerate(results):
+            key = str(doc.metadata.get(id_key) or doc.page_content)
+            scores[key] = scores.get(key, 0.0) + 1.0 / (k + rank + 1)
+            documents.setdefault(key, doc)
+    return [documents[key] for key in sorted(scores, key=scores.get, reverse=True)]
+
+
+class FusedRetriever(BaseRetriever):
+    """Lexical first stage fused with other (vector) retrievers by reciprocal rank fusion."""
+
+    retrievers: List[Any]
+    k: int = 5
+    id_key: str = "id"
+
+    class Config:
+        arbitrary_types_allowed = True
+
+    def _get_relevant_documents(
+        self, query: str, *, run_manager: CallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        results = [r.invoke(query, config={"callbacks": run_manager.get_child()}) for r in self.retrievers]
+        return reciprocal_rank_fusion(results, id_key=self.id_key)[: self.k]
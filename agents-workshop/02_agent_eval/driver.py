@@ -72,6 +72,10 @@ schema_name = "email"
 import os
 import mlflow
 
+# Modules imported by agent.py, shipped with every logged version of the agent
+agent_code_paths = [os.path.join(os.getcwd(), module) for module in ["replay.py", "profiling.py", "ann_index.py", "bm25_index.py"]] + \
+    [os.path.abspath(os.path.join(os.getcwd(), "../../shared/embedding_cache.py"))]
+
 input_example = {
     "messages": [
         {
@@ -93,9 +97,11 @@ with mlflow.start_run():
             "langgraph-checkpoint==1.0.12",
             "langgraph==0.2.16",
             "pydantic",
+            "numpy",
             #"langchain_databricks", # used for the retriever tool
         ],
         model_config="config.yml",
+        code_paths=agent_code_paths,
         artifact_path='agent',
         input_example=input_example,
     )
@@ -144,6 +150,87 @@ display(eval_results.tables['eval_results'])
 
 # COMMAND ----------
 
+# MAGIC %md
+# MAGIC ## Profile the agent steps
+# MAGIC
+# MAGIC The [profiling.py]($./profiling.py) `AgentProfiler` callback records per-node latency, tokens in and out, tool durations and iteration counts for each conversation, and logs them as metrics (plus an `agent_profile.json` table) to the MLflow run. Conversations cut short by `max_steps` / `time_budget_s` from [config.yml]($./config.yml) show up as `halted_conversations`.
+
+# COMMAND ----------
+
+# DBTITLE 1,Profile the evaluation requests
+from profiling import AgentProfiler
+
+profiler = AgentProfiler()
+logged_agent = mlflow.langchain.load_model(logged_agent_info.model_uri)
+
+for request in eval_dataset["request"]:
+    logged_agent.invoke({"messages": [{"role": "user", "content": request}]}, config={"callbacks": [profiler]})
+
+with mlflow.start_run(run_id=logged_agent_info.run_id):
+    profiler.log_to_mlflow()
+
+display(pd.DataFrame(profiler.conversations()))
+
+# COMMAND ----------
+
+# MAGIC %md
+# MAGIC ## Offline performance test with record/replay stand-ins
+# MAGIC
+# MAGIC The [replay.py]($./replay.py) module records the chat model responses and UC tool results once, then replays them with a configurable latency distribution. This lets us measure the graph overhead, concurrency and throughput of the compiled agent without the serving endpoint or the SQL warehouse, and compare runs to catch performance regressions.
+# MAGIC
+# MAGIC 1. Load the agent in `record` mode and run the evaluation requests against the live endpoint and warehouse.
+# MAGIC 2. Load the agent in `replay` mode and benchmark it offline with the recorded responses.
+
+# COMMAND ----------
+
+# DBTITLE 1,Record LLM and tool responses once
+import yaml
+
+with open("config.yml") as f:
+    base_config = yaml.safe_load(f)
+
+replay_store_path = os.path.join(os.getcwd(), "replay_store.jsonl")
+
+def load_agent_with_replay(mode, **replay_overrides):
+    replay_config = {**base_config["replay"], "mode": mode, "store_path": replay_store_path, **replay_overrides}
+    with mlflow.start_run(run_name=f"agent-{mode}"):
+        info = mlflow.langchain.log_model(
+            lc_model=os.path.join(os.getcwd(), 'agent'),
+            model_config={**base_config, "replay": replay_config},
+            code_paths=agent_code_paths,
+            artifact_path='agent',
+        )
+    return mlflow.langchain.load_model(info.model_uri)
+
+benchmark_requests = [
+    {"messages": [{"role": "user", "content": request}]} for request in eval_dataset["request"]
+]
+
+recording_agent = load_agent_with_replay("record")
+for request in benchmark_requests:
+    recording_agent.invoke(request)
+
+# COMMAND ----------
+
+# DBTITLE 1,Benchmark the agent offline
+from replay import run_benchmark
+
+# "none" measures the pure graph overhead, "recorded" replays the latencies observed while recording
+for distribution in ["none", "recorded"]:
+    replay_agent = load_agent_with_replay(
+        "replay",
+        llm_latency={"distribution": distribution},
+        tool_latency={"distribution": distribution},
+    )
+    for concurrency in [1, 4, 16]:
+        stats = run_benchmark(replay_agent, benchmark_requests, concurrency=concurrency, iterations=10)
+        with mlflow.start_run(run_name=f"agent-benchmark-{distribution}-c{concurrency}"):
+            mlflow.log_params({"latency_distribution": distribution, "concurrency": concurrency})
+            mlflow.log_metrics(stats)
+        print(distribution, stats)
+
+# COMMAND ----------
+
 # MAGIC %md
 # MAGIC ## Lets go back to the [agent]($./agent) notebook and change our retriever to 1.
 
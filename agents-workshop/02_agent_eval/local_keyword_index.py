@@ -0,0 +1,122 @@
+# Databricks notebook source
+# MAGIC %md
+# MAGIC # Local BM25 keyword index over the policies and product docs
+# MAGIC
+# MAGIC Many questions name what they are about: "what is the return policy", "how do I reset my BrownBox SwiftWatch X500". A lexical index answers them in well under a millisecond, without an embedding call or a remote index query.
+# MAGIC
+# MAGIC This notebook:
+# MAGIC 1. Builds a BM25 index with [bm25_index.py]($./bm25_index.py) over `data/policies.csv` (one document per policy) and `data/product_docs.csv` (one document per `###` section of every manual)
+# MAGIC 2. Saves it to a volume as a single memory-mapped file
+# MAGIC 3. Measures query latency
+# MAGIC 4. Fuses it with the in-process product catalog index (see the [local_product_index]($./local_product_index) notebook) by reciprocal rank fusion
+# MAGIC
+# MAGIC Set `bm25_index` in [config.yml]($./config.yml) to the index path to give the [agent]($./agent) the `docs_keyword_search` tool.
+
+# COMMAND ----------
+
+# MAGIC %pip install -U -qqqq langchain==0.2.16 langchain-community==0.2.16 langchain_core numpy
+# MAGIC dbutils.library.restartPython()
+
+# COMMAND ----------
+
+import os
+
+catalog_name = "marion_test"
+schema_name = "email"
+volume = "data"
+
+policies_path = os.path.abspath("../data/policies.csv")
+product_docs_path = os.path.abspath("../data/product_docs.csv")
+index_path = f"/Volumes/{catalog_name}/{schema_name}/{volume}/docs_bm25.idx"
+
+# Vector index over the same documents as the keyword index, for the fusion below
+docs_ann_index_path = f"/Volumes/{catalog_name}/{schema_name}/{volume}/docs_ann"
+
+# COMMAND ----------
+
+# MAGIC %md
+# MAGIC ## Build and save the index
+
+# COMMAND ----------
+
+from bm25_index import BM25Index, build_from_csv
+
+build_from_csv(policies_path, product_docs_path).save(index_path)
+index = BM25Index.load(index_path)
+print(f"Indexed {len(index.ids)} documents, {len(index.vocabulary)} terms, {os.path.getsize(index_path) / 1e6:.1f} MB")
+
+# COMMAND ----------
+
+# MAGIC %md
+# MAGIC ## Query latency
+# MAGIC Documents whose title (a policy or a product name) appears in the question come first.
+
+# COMMAND ----------
+
+import time
+import pandas as pd
+
+questions = [
+    "what is the return policy",
+    "can I get a refund after 30 days",
+    "BrownBox SwiftWatch X500",
+    "how do I cancel my account",
+    "warranty on electronics",
+    "how to clean a leather sofa",
+]
+
+results = []
+for question in questions:
+    start = time.perf_counter()
+    for _ in range(100):
+        hits = index.search(question, k=3)
+    results.append({
+        "question": question,
+        "latency_ms": (time.perf_counter() - start) * 1000 / 100,
+        "top_hits": [f"{index.titles[n]} ({score:.1f})" for n, score in hits],
+    })
+
+display(pd.DataFrame(results))
+
+# COMMAND ----------
+
+# MAGIC %md
+# MAGIC ## Fusion with the vector index
+# MAGIC `FusedRetriever` queries both retrievers and merges their rankings with reciprocal rank fusion, so a document ranked well by either one makes the top k.
+# MAGIC
+# MAGIC Fusion only merges a document found by both retrievers when they index the same corpus under the same ids: the vector side is an IVF-flat index ([ann_index.py]($./ann_index.py)) over the documents of the keyword index, keyed on the same `id`.
+
+# COMMAND ----------
+
+from langchain_community.embeddings import DatabricksEmbeddings
+from langchain_core.tools import create_retriever_tool
+from ann_index import IVFFlatIndex, LocalIndexRetriever
+from bm25_index import BM25Retriever, FusedRetriever
+import sys
+sys.path.append(os.path.abspath("../../shared"))
+from embedding_cache import CachedEmbeddings
+
+embeddings = CachedEmbeddings(DatabricksEmbeddings(endpoint="databricks-gte-large-en"))
+
+# Embed the keyword index documents (policies and manual sections) once, with the keyword index ids
+IVFFlatIndex.build(index.ids, embeddings.embed_documents(index.texts), dict(zip(index.ids, index.texts))).save(docs_ann_index_path)
+
+keyword_retriever = BM25Retriever(index=index, k=5)
+vector_retriever = LocalIndexRetriever(index=IVFFlatIndex.load(docs_ann_index_path), embeddings=embeddings, k=5, id_key="id")
+fused_retriever = FusedRetriever(retrievers=[keyword_retriever, vector_retriever], k=5, id_key="id")
+
+question = "elegant leather handbag with a warranty"
+keyword_ids = [d.metadata["id"] for d in keyword_retriever.invoke(question)]
+vector_ids = [d.metadata["id"] for d in vector_retriever.invoke(question)]
+print(f"found by both retrievers: {set(keyword_ids) & set(vector_ids)}")
+for doc in fused_retriever.invoke(question):
+    print(doc.metadata, doc.page_content[:100].replace("\n", " "))
+
+# COMMAND ----------
+
+docs_keyword_search = create_retriever_tool(
+    keyword_retriever,
+    "docs_keyword_search",
+    "Keyword search over the company policies and the product manuals. Best for exact policy or product names.",
+)
+print(docs_keyword_search.invoke({"query": "what is the return policy"}))
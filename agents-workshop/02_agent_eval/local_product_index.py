@@ -0,0 +1,153 @@
+# Databricks notebook source
+# MAGIC %md
+# MAGIC # In-process product catalog index
+# MAGIC
+# MAGIC The `product_vector_search` UC function goes through the SQL `vector_search()` function, so every retrieval costs a warehouse hop plus a remote index query. The product catalog is small enough to be searched inside the agent's own process.
+# MAGIC
+# MAGIC This notebook:
+# MAGIC 1. Embeds the `description` column of `product_catalog` with `databricks-gte-large-en` and builds an IVF-flat index with [ann_index.py]($./ann_index.py)
+# MAGIC 2. Saves it to a volume as memory-mapped `.npy` files
+# MAGIC 3. Refreshes it incrementally from the table's change data feed (enabled in the [01_create_tools]($../01_create_tools/01_create_tools) notebook)
+# MAGIC 4. Compares recall and latency against the remote Vector Search index
+# MAGIC
+# MAGIC Set `local_product_index` in [config.yml]($./config.yml) to the index path to give the [agent]($./agent) the `product_local_search` tool.
+
+# COMMAND ----------
+
+# MAGIC %pip install -U -qqqq databricks-vectorsearch langchain==0.2.16 langchain-community==0.2.16 langchain_core numpy
+# MAGIC dbutils.library.restartPython()
+
+# COMMAND ----------
+
+catalog_name = "marion_test"
+schema_name = "email"
+volume = "data"
+
+table_name = f"{catalog_name}.{schema_name}.product_catalog"
+index_path = f"/Volumes/{catalog_name}/{schema_name}/{volume}/product_catalog_ann"
+
+# Remote index created in the 01_create_tools notebook, used for the comparison
+vector_endpoint_name = f'vs_endpoint_product_{schema_name}'
+remote_index_name = f'{catalog_name}.{schema_name}.product_catalog_index'
+
+# COMMAND ----------
+
+# MAGIC %md
+# MAGIC ## Build the index
+# MAGIC Descriptions are embedded in batches (one endpoint call per batch) and the table version is stored with the index, so later refreshes only read the change data feed from there.
+
+# COMMAND ----------
+
+import numpy as np
+from langchain_community.embeddings import DatabricksEmbeddings
+from ann_index import IVFFlatIndex, LocalIndexRetriever, refresh_from_change_feed
+import os, sys
+sys.path.append(os.path.abspath("../../shared"))
+from embedding_cache import CachedEmbeddings
+
+embeddings = CachedEmbeddings(DatabricksEmbeddings(endpoint="databricks-gte-large-en"))
+
+table_version = spark.sql(f"DESCRIBE HISTORY {table_name} LIMIT 1").collect()[0]["version"]
+rows = spark.sql(f"SELECT CAST(item_id AS STRING) AS item_id, description FROM {table_name} VERSION AS OF {table_version}").collect()
+
+item_ids = [r["item_id"] for r in rows]
+descriptions = [r["description"] or "" for r in rows]
+
+batch_size = 150
+vectors = np.concatenate([
+    np.asarray(embeddings.embed_documents(descriptions[i:i + batch_size]), dtype=np.float32)
+    for i in range(0, len(descriptions), batch_size)
+])
+
+index = IVFFlatIndex.build(item_ids, vectors, dict(zip(item_ids, descriptions)), version=table_version)
+index = index.save(index_path)
+print(f"Indexed {index.size} products ({len(index.centroids)} lists) at version {table_version} into {index_path}")
+
+# COMMAND ----------
+
+# MAGIC %md
+# MAGIC ## Incremental refresh from the change data feed
+# MAGIC Only rows inserted, updated or deleted since the stored version are re-embedded. Run this cell (or schedule it) after the catalog changes.
+
+# COMMAND ----------
+
+index = IVFFlatIndex.load(index_path)
+changed = refresh_from_change_feed(spark, index, table_name, embeddings.embed_documents)
+if changed:
+    index = index.save(index_path)
+print(f"{changed} changed products, index at version {index.version}")
+
+# COMMAND ----------
+
+# MAGIC %md
+# MAGIC ## Recall and latency against the remote index
+# MAGIC Recall@k is measured against the exact (brute force) neighbours, for both the local IVF-flat index and the remote Vector Search index. The remote index computes the query embedding itself (managed embeddings), so the remote latency includes it, which is what the agent pays through `product_vector_search` today (minus the warehouse hop).
+
+# COMMAND ----------
+
+import time
+import pandas as pd
+from databricks.vector_search.client import VectorSearchClient
+
+k = 5
+questions = [
+    "a warm winter coat",
+    "elegant leather handbag",
+    "running shoes for trail",
+    "silk scarf with floral pattern",
+    "classic wrist watch",
+    "summer dress",
+    "gift for a wine lover",
+    "minimalist jewelry",
+]
+
+vsc = VectorSearchClient(disable_notice=True)
+remote_index = vsc.get_index(endpoint_name=vector_endpoint_name, index_name=remote_index_name)
+
+all_vectors = np.asarray(index.vectors)
+results = []
+for question in questions:
+    query_vector = np.asarray(embeddings.embed_query(question), dtype=np.float32)
+    query_unit = query_vector / np.linalg.norm(query_vector)
+    exact = {index.ids[i] for i in np.argsort(-(all_vectors @ query_unit))[:k]}
+
+    start = time.perf_counter()
+    local_hits = {item_id for item_id, _ in index.search(query_vector, k=k)}
+    local_ms = (time.perf_counter() - start) * 1000
+
+    start = time.perf_counter()
+    remote = remote_index.similarity_search(query_text=question, columns=["item_id"], num_results=k)
+    remote_ms = (time.perf_counter() - start) * 1000
+    remote_hits = {str(row[0]) for row in remote["result"]["data_array"]}
+
+    results.append({
+        "question": question,
+        "local_recall": len(local_hits & exact) / k,
+        "remote_recall": len(remote_hits & exact) / k,
+        "local_ms": local_ms,
+        "remote_ms": remote_ms,
+    })
+
+comparison = pd.DataFrame(results)
+display(comparison)
+display(comparison[["local_recall", "remote_recall", "local_ms", "remote_ms"]].describe())
+
+# COMMAND ----------
+
+# MAGIC %md
+# MAGIC ## Use it as a LangChain retriever / agent tool
+
+# COMMAND ----------
+
+from langchain_core.tools import create_retriever_tool
+
+retriever = LocalIndexRetriever(index=index, embeddings=embeddings, k=k)
+product_local_search = create_retriever_tool(
+    retriever,
+    "product_local_search",
+    "Searches the product catalog and returns the descriptions of the products most relevant to the query.",
+)
+print(product_local_search.invoke({"query": "elegant leather handbag"}))
+
+# The same question was embedded for the comparison above, so this one is served from the cache
+print(embeddings.stats())
@@ -0,0 +1,213 @@
+"""
+Step-level profiling for the LangGraph tool-calling agent.
+
+`AgentProfiler` is a LangChain callback handler: pass it in the run config and it records, for every
+conversation (top-level invocation), the latency of each graph node ("agent", "tools", "halt"), the
+model calls with their input/output tokens, every tool call with its duration, and the number of
+agent iterations. `summary()` aggregates these into flat metrics that `log_to_mlflow()` logs next to
+the MLflow autolog traces.
+
+    profiler = AgentProfiler()
+    agent.invoke(request, config={"callbacks": [profiler]})
+    profiler.log_to_mlflow()
+"""
+
+import statistics
+import threading
+import time
+from typing import Any, Dict, List, Optional
+from uuid import UUID
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.outputs import LLMResult
+
+
+def _percentile(values: List[float], q: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+class AgentProfiler(BaseCallbackHandler):
+    """Collects per-node, per-model-call and per-tool timings of agent runs."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._root_of: Dict[UUID, UUID] = {}
+        self._started: Dict[UUID, float] = {}
+        self._names: Dict[UUID, str] = {}
+        self._conversations: Dict[UUID, Dict[str, Any]] = {}
+
+    def _register(self, run_id: UUID, parent_run_id: Optional[UUID]) -> Dict[str, Any]:
+        root = self._root_of.get(parent_run_id, parent_run_id) if parent_run_id else run_id
+        self._root_of[run_id] = root
+        if root not in self._conversations:
+            self._conversations[root] = {
+                "started_at": time.perf_counter(),
+                "latency_s": None,
+                "nodes": [],
+                "llm_calls": [],
+                "tools": [],
+            }
+        return self._conversations[root]
+
+    def _finish(self, run_id: UUID) -> Optional[float]:
+        started = self._started.pop(run_id, None)
+        return None if started is None else time.perf_counter() - started
+
+    # Graph nodes and the top-level run
+
+    def on_chain_start(self, serialized, inputs, *, run_id, parent_run_id=None, metadata=None, **kwargs):
+        with self._lock:
+            self._register(run_id, parent_run_id)
+            node = (metadata or {}).get("langgraph_node")
+            # Only the node runnable itself, not the runnables nested inside the node (which may share its name)
+            is_node = node and node != "__start__" and kwargs.get("name") == node and self._names.get(parent_run_id) != node
+            if parent_run_id is None or is_node:
+                self._names[run_id] = node or "__root__"
+                self._started[run_id] = time.perf_counter()
+
+    def on_chain_end(self, outputs, *, run_id, **kwargs):
+        self._end_chain(run_id, error=False)
+
+    def on_chain_error(self, error, *, run_id, **kwargs):
+        self._end_chain(run_id, error=True)
+
+    def _end_chain(self, run_id: UUID, error: bool):
+        with self._lock:
+            name = self._names.pop(run_id, None)
+            duration = self._finish(run_id)
+            if name is None:
+                return
+            conversation = self._conversations[self._root_of[run_id]]
+            if name == "__root__":
+                conversation["latency_s"] = duration
+                conversation["error"] = error
+            else:
+                conversation["nodes"].append({"node": name, "latency_s": duration})
+
+    # Model calls
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, parent_run_id=None, **kwargs):
+        with self._lock:
+            self._register(run_id, parent_run_id)
+            self._started[run_id] = time.perf_counter()
+
+    def on_llm_end(self, response: LLMResult, *, run_id, **kwargs):
+        input_tokens = output_tokens = 0
+        for generations in response.generations:
+            for generation in generations:
+                usage = getattr(getattr(generation, "message", None), "usage_metadata", None)
+                if usage:
+                    input_tokens += usage.get("input_tokens", 0)
+                    output_tokens += usage.get("output_tokens", 0)
+        if not (input_tokens or output_tokens):
+            # ChatDatabricks reports the OpenAI style usage in llm_output
+            usage = (response.llm_output or {}).get("token_usage") or (response.llm_output or {}).get("usage") or {}
+            input_tokens = usage.get("prompt_tokens", 0)
+            output_tokens = usage.get("completion_tokens", 0)
+        with self._lock:
+            conversation = self._conversations[self._root_of[run_id]]
+            conversation["llm_calls"].append(
+                {"latency_s": self._finish(run_id), "input_tokens": input_tokens, "output_tokens": output_tokens}
+            )
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        with self._lock:
+            self._finish(run_id)
+
+    # Tool calls
+
+    def on_tool_start(self, serialized, input_str, *, run_id, parent_run_id=None, **kwargs):
+        with self._lock:
+            self._register(run_id, parent_run_id)
+            self._names[run_id] = (serialized or {}).get("name") or kwargs.get("name") or "tool"
+            self._started[run_id] = time.perf_counter()
+
+    def on_tool_end(self, output, *, run_id, **kwargs):
+        self._end_tool(run_id, error=False)
+
+    def on_tool_error(self, error, *, run_id, **kwargs):
+        self._end_tool(run_id, error=True)
+
+    def _end_tool(self, run_id: UUID, error: bool):
+        with self._lock:
+            conversation = self._conversations[self._root_of[run_id]]
+            conversation["tools"].append(
+                {"tool": self._names.pop(run_id, "tool"), "latency_s": self._finish(run_id), "error": error}
+            )
+
+    # Reporting
+
+    def conversations(self) -> List[Dict[str, Any]]:
+        """One flat record per finished conversation."""
+        with self._lock:
+            finished = [c for c in self._conversations.values() if c["latency_s"] is not None]
+        return [
+            {
+                "latency_s": c["latency_s"],
+                "iterations": sum(1 for n in c["nodes"] if n["node"] == "agent"),
+                "halted": any(n["node"] == "halt" for n in c["nodes"]),
+                "error": c.get("error", False),
+                "llm_calls": len(c["llm_calls"]),
+                "llm_latency_s": sum(l["latency_s"] or 0.0 for l in c["llm_calls"]),
+                "input_tokens": sum(l["input_tokens"] for l in c["llm_calls"]),
+                "output_tokens": sum(l["output_tokens"] for l in c["llm_calls"]),
+                "tool_calls": len(c["tools"]),
+                "tool_latency_s": sum(t["latency_s"] or 0.0 for t in c["tools"]),
+            }
+            for c in finished
+        ]
+
+    def summary(self) -> Dict[str, float]:
+        """Aggregated metrics, flat so they can go straight to `mlflow.log_metrics`."""
+        conversations = self.conversations()
+        if not conversations:
+            return {}
+        latencies = [c["latency_s"] for c in conversations]
+        iterations = [c["iterations"] for c in conversations]
+        metrics = {
+            "conversations": len(conversations),
+            "conversation_latency_mean_s": statistics.fmean(latencies),
+            "conversation_latency_p95_s": _percentile(latencies, 0.95),
+            "conversation_latency_max_s": max(latencies),
+            "iterations_mean": statistics.fmean(iterations),
+            "iterations_max": max(iterations),
+            "halted_conversations": sum(c["halted"] for c in conversations),
+            "failed_conversations": sum(c["error"] for c in conversations),
+            "llm_calls": sum(c["llm_calls"] for c in conversations),
+            "input_tokens_total": sum(c["input_tokens"] for c in conversations),
+            "output_tokens_total": sum(c["output_tokens"] for c in conversations),
+            "input_tokens_mean": statistics.fmean(c["input_tokens"] for c in conversations),
+            "output_tokens_mean": statistics.fmean(c["output_tokens"] for c in conversations),
+        }
+
+        with self._lock:
+            nodes, tools = {}, {}
+            for c in self._conversations.values():
+                for n in c["nodes"]:
+                    nodes.setdefault(n["node"], []).append(n["latency_s"])
+                for t in c["tools"]:
+                    tools.setdefault(t["tool"], []).append(t)
+        for node, durations in nodes.items():
+            metrics[f"node_{node}_count"] = len(durations)
+            metrics[f"node_{node}_latency_mean_s"] = statistics.fmean(durations)
+            metrics[f"node_{node}_latency_p95_s"] = _percentile(durations, 0.95)
+            metrics[f"node_{node}_latency_total_s"] = sum(durations)
+        for tool, calls in tools.items():
+            # UC function names (catalog__schema__function) are valid metric names, keep them as is
+            durations = [t["latency_s"] for t in calls]
+            metrics[f"tool_{tool}_count"] = len(calls)
+            metrics[f"tool_{tool}_errors"] = sum(t["error"] for t in calls)
+            metrics[f"tool_{tool}_latency_mean_s"] = statistics.fmean(durations)
+            metrics[f"tool_{tool}_latency_p95_s"] = _percentile(durations, 0.95)
+        return metrics
+
+    def log_to_mlflow(self, step: Optional[int] = None):
+        """Log the summary metrics and the per-conversation table to the active MLflow run."""
+        import mlflow
+        import pandas as pd
+
+        mlflow.log_metrics(self.summary(), step=step)
+        conversations = self.conversations()
+        if conversations:
+            mlflow.log_table(pd.DataFrame(conversations), artifact_file="agent_profile.json")
@@ -0,0 +1,317 @@
+"""
+Record/replay stand-ins for the agent's chat model and UC function tools.
+
+In "record" mode the stand-ins call the real ChatDatabricks endpoint and UC functions and
+append every request/response pair (plus the observed latency) to a local JSON-lines store.
+In "replay" mode the recorded responses are served back from that store with a configurable
+latency distribution, so the compiled LangGraph agent can be load-tested on a laptop without
+a serving endpoint, a SQL warehouse or network access.
+
+Typical use (see the `replay` section of config.yml and the driver notebook):
+
+    store = ReplayStore("replay_store.jsonl")
+    llm, tools = record_stand_ins(ChatDatabricks(...), uc_tools, store)   # once, online
+    llm, tools = replay_stand_ins(store, LatencyModel("lognormal", median_s=0.8))  # offline
+"""
+
+import hashlib
+import json
+import os
+import random
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from langchain_core.callbacks import CallbackManagerForLLMRun
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import BaseMessage, message_to_dict, messages_from_dict
+from langchain_core.outputs import ChatGeneration, ChatResult
+from langchain_core.pydantic_v1 import create_model
+from langchain_core.tools import BaseTool, StructuredTool
+from langchain_core.utils.function_calling import convert_to_openai_tool
+
+
+class ReplayMissError(KeyError):
+    """Raised in replay mode when a request was never recorded."""
+
+
+def _digest(payload: Any) -> str:
+    return hashlib.sha256(
+        json.dumps(payload, sort_keys=True, default=str).encode("utf-8")
+    ).hexdigest()
+
+
+def _message_key(msg: BaseMessage) -> Dict[str, Any]:
+    # Message ids are generated per run (add_messages assigns uuids), so they must not be part of the key
+    key = {"type": msg.type, "content": msg.content}
+    tool_calls = getattr(msg, "tool_calls", None)
+    if tool_calls:
+        key["tool_calls"] = [{"name": c["name"], "args": c["args"]} for c in tool_calls]
+    if getattr(msg, "tool_call_id", None):
+        key["tool_call_id"] = msg.tool_call_id
+    return key
+
+
+class ReplayStore:
+    """
+    Append-only JSON-lines store of recorded LLM responses, tool results and tool specs.
+
+    Each line is a record {"kind": "llm" | "tool" | "tool_spec", "key": ..., "response": ..., "latency_s": ...}.
+    A key recorded several times is replayed round-robin, which keeps non-deterministic answers in the mix.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._records: Dict[Tuple[str, str], List[Dict[str, Any]]] = {}
+        self._cursors: Dict[Tuple[str, str], int] = {}
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                for line in f:
+                    if line.strip():
+                        self._index(json.loads(line))
+
+    def _index(self, record: Dict[str, Any]):
+        self._records.setdefault((record["kind"], record["key"]), []).append(record)
+
+    def record(self, kind: str, key: str, response: Any, latency_s: float = 0.0):
+        record = {"kind": kind, "key": key, "response": response, "latency_s": latency_s}
+        with self._lock:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(record, default=str) + "\n")
+            self._index(record)
+
+    def lookup(self, kind: str, key: str) -> Dict[str, Any]:
+        with self._lock:
+            records = self._records.get((kind, key))
+            if not records:
+                raise ReplayMissError(
+                    f"No recorded '{kind}' response for key {key[:12]}... in {self.path}. "
+                    "Re-run the agent in record mode with this request first."
+                )
+            cursor = self._cursors.get((kind, key), 0)
+            self._cursors[(kind, key)] = cursor + 1
+            return records[cursor % len(records)]
+
+    def tool_specs(self) -> List[Dict[str, Any]]:
+        return [records[-1]["response"] for (kind, _), records in self._records.items() if kind == "tool_spec"]
+
+    def recorded_latencies(self, kind: str) -> List[float]:
+        return [r["latency_s"] for (k, _), records in self._records.items() if k == kind for r in records]
+
+
+class LatencyModel:
+    """
+    Latency injected in replay mode.
+
+    distribution:
+      - "none":      no delay, measures pure graph overhead
+      - "recorded":  the latency observed while recording, multiplied by `scale`
+      - "fixed":     `value_s`
+      - "uniform":   between `low_s` and `high_s`
+      - "normal":    `mean_s` / `stddev_s`, clipped at 0
+      - "lognormal": `median_s` / `sigma`, a good fit for LLM endpoint latencies
+    """
+
+    def __init__(self, distribution: str = "recorded", scale: float = 1.0, seed: Optional[int] = None, **params):
+        if distribution not in ("none", "recorded", "fixed", "uniform", "normal", "lognormal"):
+            raise ValueError(f"Unknown latency distribution: {distribution}")
+        self.distribution = distribution
+        self.scale = scale
+        self.params = params
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, latency_config: Optional[Dict[str, Any]]) -> "LatencyModel":
+        return cls(**(latency_config or {}))
+
+    def sample(self, recorded_s: float = 0.0) -> float:
+        p = self.params
+        with self._lock:
+            if self.distribution == "none":
+                delay = 0.0
+            elif self.distribution == "recorded":
+                delay = recorded_s
+            elif self.distribution == "fixed":
+                delay = p.get("value_s", 0.0)
+            elif self.distribution == "uniform":
+                delay = self._rng.uniform(p.get("low_s", 0.0), p.get("high_s", 1.0))
+            elif self.distribution == "normal":
+                delay = self._rng.gauss(p.get("mean_s", 1.0), p.get("stddev_s", 0.0))
+            else:
+                delay = self._rng.lognormvariate(0.0, p.get("sigma", 0.5)) * p.get("median_s", 1.0)
+        return max(0.0, delay * self.scale)
+
+    def sleep(self, recorded_s: float = 0.0):
+        delay = self.sample(recorded_s)
+        if delay:
+            time.sleep(delay)
+
+
+class RecordReplayChatModel(BaseChatModel):
+    """
+    Chat model stand-in. Records the wrapped model's responses, or replays them from the store.
+
+    The request key covers the message history (without run-specific message ids) and the names of the
+    bound tools, so the same conversation replays the same tool calls and the graph takes the same path.
+    """
+
+    store: Any
+    mode: str = "replay"
+    model: Optional[Any] = None
+    latency: Any = None
+
+    class Config:
+        arbitrary_types_allowed = True
+
+    @property
+    def _llm_type(self) -> str:
+        return "record-replay-chat"
+
+    def bind_tools(self, tools: Sequence[Any], **kwargs: Any):
+        return self.bind(tools=[convert_to_openai_tool(t) for t in tools], **kwargs)
+
+    def _generate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        tools = kwargs.pop("tools", None) or []
+        key = _digest(
+            {
+                "messages": [_message_key(m) for m in messages],
+                "tools": sorted(t["function"]["name"] for t in tools),
+            }
+        )
+
+        if self.mode == "record":
+            model = self.model.bind_tools(tools) if tools else self.model
+            start = time.perf_counter()
+            response = model.invoke(messages, stop=stop, **kwargs)
+            self.store.record("llm", key, message_to_dict(response), time.perf_counter() - start)
+        else:
+            record = self.store.lookup("llm", key)
+            (self.latency or LatencyModel("none")).sleep(record["latency_s"])
+            response = messages_from_dict([record["response"]])[0]
+
+        return ChatResult(generations=[ChatGeneration(message=response)])
+
+
+def _tool_spec(tool: BaseTool) -> Dict[str, Any]:
+    function = convert_to_openai_tool(tool)["function"]
+    return {
+        "name": function["name"],
+        "description": function.get("description", ""),
+        "parameters": function.get("parameters", {}),
+    }
+
+
+_JSON_TYPES = {"string": str, "integer": int, "number": float, "boolean": bool, "array": list, "object": dict}
+
+
+def _args_schema(spec: Dict[str, Any]):
+    properties = spec["parameters"].get("properties", {})
+    required = set(spec["parameters"].get("required", []))
+    fields = {
+        name: (_JSON_TYPES.get(prop.get("type"), Any), ... if name in required else None)
+        for name, prop in properties.items()
+    }
+    # UC function names contain "__" separators which pydantic would treat as private
+    return create_model(f"{spec['name'].replace('__', '_')}_args", **fields)
+
+
+def record_stand_ins(llm: BaseChatModel, tools: Sequence[BaseTool], store: ReplayStore):
+    """Wrap the live chat model and tools so that every call is recorded to `store`."""
+
+    def recording_tool(tool: BaseTool) -> BaseTool:
+        spec = _tool_spec(tool)
+        store.record("tool_spec", spec["name"], spec)
+
+        def run(**kwargs):
+            args = {k: v for k, v in kwargs.items() if v is not None}
+            start = time.perf_counter()
+            result = tool.invoke(args)
+            store.record("tool", _digest({"name": tool.name, "args": args}), result, time.perf_counter() - start)
+            return result
+
+        return StructuredTool.from_function(
+            func=run, name=tool.name, description=tool.description, args_schema=tool.args_schema
+        )
+
+    chat_model = RecordReplayChatModel(store=store, mode="record", model=llm)
+    return chat_model, [recording_tool(t) for t in tools]
+
+
+def replay_stand_ins(
+    store: ReplayStore,
+    llm_latency: Optional[LatencyModel] = None,
+    tool_latency: Optional[LatencyModel] = None,
+):
+    """Build a chat model and tools that only read from `store`: no endpoint, warehouse or network needed."""
+
+    def replaying_tool(spec: Dict[str, Any]) -> BaseTool:
+        def run(**kwargs):
+            # Optional arguments the model left out are passed as None, drop them as the recorder does
+            args = {k: v for k, v in kwargs.items() if v is not None}
+            record = store.lookup("tool", _digest({"name": spec["name"], "args": args}))
+            (tool_latency or LatencyModel("none")).sleep(record["latency_s"])
+            return record["response"]
+
+        return StructuredTool.from_function(
+            func=run, name=spec["name"], description=spec["description"], args_schema=_args_schema(spec)
+        )
+
+    chat_model = RecordReplayChatModel(store=store, mode="replay", latency=llm_latency)
+    return chat_model, [replaying_tool(spec) for spec in store.tool_specs()]
+
+
+def run_benchmark(
+    agent: Any,
+    requests: Sequence[Dict[str, Any]],
+    concurrency: int = 8,
+    iterations: int = 1,
+) -> Dict[str, float]:
+    """
+    Invoke `agent` on every request `iterations` times with `concurrency` worker threads and
+    return latency percentiles (seconds), throughput (requests/s) and the error count.
+    """
+    work = [request for _ in range(iterations) for request in requests]
+    latencies: List[float] = []
+    errors = 0
+
+    def invoke(request):
+        start = time.perf_counter()
+        agent.invoke(request)
+        return time.perf_counter() - start
+
+    wall_start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        futures = [pool.submit(invoke, request) for request in work]
+        for future in futures:
+            try:
+                latencies.append(future.result())
+            except Exception as e:
+                errors += 1
+                print(f"benchmark request failed: {e}")
+    wall_s = time.perf_counter() - wall_start
+
+    if not latencies:
+        return {"requests": len(work), "errors": errors, "wall_s": wall_s}
+    latencies.sort()
+    pick = lambda q: latencies[min(len(latencies) - 1, int(q * len(latencies)))]
+    return {
+        "requests": len(work),
+        "errors": errors,
+        "concurrency": concurrency,
+        "wall_s": wall_s,
+        "throughput_rps": len(latencies) / wall_s,
+        "latency_mean_s": statistics.fmean(latencies),
+        "latency_p50_s": pick(0.50),
+        "latency_p95_s": pick(0.95),
+        "latency_p99_s": pick(0.99),
+    }
@@ -2,33 +2,24 @@
 # MAGIC %md
 # MAGIC # Text analysis GenAI use cases discovery
 # MAGIC
-# MAGIC This notebooks uses [DiscoverX](https://github.com/databrickslabs/discoverx) to analyze text with [AI Functions](https://docs.databricks.com/aws/en/large-language-models/ai-functions) over a set of tables in Unity Catalog.
+# MAGIC This notebooks profiles the string columns of a set of tables in Unity Catalog to find the free text ones, and proposes ways to analyze that text with [AI Functions](https://docs.databricks.com/aws/en/large-language-models/ai-functions).
 # MAGIC
 # MAGIC The notebook will:
-# MAGIC 1. Use DiscoverX to find free text columns across multiple scanned tables
-# MAGIC 3. Provide a set of possible use cases for that text with cost estimation and example query
+# MAGIC 1. Find free text columns across multiple scanned tables. Every table is profiled in a single scan by [column_profiler.py]($./column_profiler.py) (length and space statistics, approximate distinct counts and a reservoir sample of every string column). Tables are profiled in parallel, row counts come from the Delta metadata, and profiles are stored with the table version and their mergeable sketches so that re-runs only read tables that changed, and only their appended rows when the change data feed allows it
+# MAGIC 3. Provide a set of possible use cases for that text with cost estimation and example query. Generated use cases are cached in a Delta table keyed on the model, the prompt and the column's sample values, so unchanged columns never call the model again
 # MAGIC
 # MAGIC
 
 # COMMAND ----------
 
-# MAGIC %md
-# MAGIC ## Install dependencies
-
-# COMMAND ----------
-
-# MAGIC %pip install dbl-discoverx
-# MAGIC
-# MAGIC dbutils.library.restartPython()
-
-# COMMAND ----------
-
 # MAGIC %md
 # MAGIC ## Setup widgets
 
 # COMMAND ----------
 
 dbutils.widgets.text("from_tables", "marion_test.email.*", "from tables")
+dbutils.widgets.text("profiles_table", "marion_test.email.text_discovery_profiles", "profiles table")
+dbutils.widgets.text("use_cases_cache_table", "marion_test.email.text_discovery_use_cases", "use cases cache table")
 
 # COMMAND ----------
 
@@ -53,46 +44,195 @@ from pyspark.sql.functions import (
     concat_ws,
 )
 from pyspark.sql.types import ArrayType, StringType, StructType, FloatType, StructField
-from typing import Iterator
 
 # COMMAND ----------
 
 from_tables = dbutils.widgets.get("from_tables")
+profiles_table = dbutils.widgets.get("profiles_table")
+use_cases_cache_table = dbutils.widgets.get("use_cases_cache_table")
+
+# Number of sample values kept per column (reservoir sample over the whole table)
+sample_size = 5
 
-# Set the sample rows size
-sample_size = 3
+# Number of tables profiled concurrently
+max_workers = 8
 
 
 # COMMAND ----------
 
 # MAGIC %md
-# MAGIC ## Initialize discoverx
+# MAGIC ## Profile all string columns
+# MAGIC Every table is profiled on its own, in a bounded thread pool: its version, size and row count are read from the Delta metadata (`DESCRIBE HISTORY`, `DESCRIBE DETAIL`, table statistics) and all its string columns are profiled in one scan. Profiles are stored in `profiles_table` with the table version and the serialized sketches:
+# MAGIC - a table whose version did not change is skipped
+# MAGIC - a table that only received inserts since (read from its change data feed, when enabled) only has its new rows profiled, merged into the stored sketches
+# MAGIC - any other table is profiled again
 
 # COMMAND ----------
 
-from discoverx import DX
+# DBTITLE 1,Tables in scope
+from pyspark.sql.functions import col, expr
+
+catalog_pattern, schema_pattern, table_pattern = [p.replace("*", "%") for p in from_tables.split(".")]
 
-dx = DX()
+tables = spark.sql(f"""
+    SELECT table_catalog, table_schema, table_name, data_source_format
+    FROM system.information_schema.tables
+    WHERE table_catalog LIKE '{catalog_pattern}'
+      AND table_schema LIKE '{schema_pattern}'
+      AND table_name LIKE '{table_pattern}'
+      AND table_schema != 'information_schema'
+      AND concat_ws('.', table_catalog, table_schema, table_name) NOT IN ('{profiles_table}', '{use_cases_cache_table}')
+""").collect()
+
+print(f"{len(tables)} tables match {from_tables}")
 
 # COMMAND ----------
 
-# MAGIC %md
-# MAGIC ## Extract samples from all string values
+# DBTITLE 1,Per-table profiles
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from pyspark.sql.types import LongType, TimestampType, DoubleType
+from column_profiler import dumps, loads, merge_profiles, profile_string_columns
+
+profile_schema = StructType([
+    StructField("table_catalog", StringType()),
+    StructField("table_schema", StringType()),
+    StructField("table_name", StringType()),
+    StructField("table_version", LongType()),
+    StructField("row_count", LongType()),
+    StructField("size_in_bytes", LongType()),
+    StructField("profiled_at", TimestampType()),
+    StructField("columns", ArrayType(StructType([
+        StructField("column_name", StringType()),
+        StructField("null_count", LongType()),
+        StructField("approx_distinct_count", LongType()),
+        StructField("avg_str_length", DoubleType()),
+        StructField("stddev_str_length", DoubleType()),
+        StructField("max_str_length", DoubleType()),
+        StructField("avg_space_count", DoubleType()),
+        StructField("stddev_space_count", DoubleType()),
+        StructField("sample_values", ArrayType(StringType())),
+    ]))),
+    # column_profiler sketches, merged with the appended rows on the next run
+    StructField("sketch_state", StringType()),
+])
+
+# Profiles stored by an older version of this notebook have no sketches: start over
+if spark.catalog.tableExists(profiles_table) and "sketch_state" not in spark.table(profiles_table).columns:
+    spark.sql(f"DROP TABLE {profiles_table}")
+
+if spark.catalog.tableExists(profiles_table):
+    stored_profiles = {
+        (r.table_catalog, r.table_schema, r.table_name): (r.table_version, r.sketch_state)
+        for r in spark.table(profiles_table).select("table_catalog", "table_schema", "table_name", "table_version", "sketch_state").collect()
+    }
+else:
+    stored_profiles = {}
+
+def table_metadata(table):
+    """Version, size, row count and change data feed flag of a table, without scanning its data files"""
+    full_name = f"`{table.table_catalog}`.`{table.table_schema}`.`{table.table_name}`"
+    version, size_in_bytes, change_feed = None, None, False
+    if table.data_source_format == "DELTA":
+        version = spark.sql(f"DESCRIBE HISTORY {full_name} LIMIT 1").collect()[0]["version"]
+        detail = spark.sql(f"DESCRIBE DETAIL {full_name}").collect()[0]
+        size_in_bytes = detail["sizeInBytes"]
+        change_feed = (detail["properties"] or {}).get("delta.enableChangeDataFeed") == "true"
+    # On Delta, COUNT(*) is answered exactly from the per-file record counts of the transaction log, not from the data
+    # (the ANALYZE TABLE statistics are not used: they are stale after any later write)
+    row_count = spark.sql(f"SELECT COUNT(*) FROM {full_name}").collect()[0][0]
+    return version, size_in_bytes, row_count, change_feed
+
+def appended_rows(full_name, since_version):
+    """Rows inserted since `since_version`, or None if anything else happened (or the change feed is not available)"""
+    try:
+        changes = (
+            spark.read.option("readChangeFeed", "true")
+            .option("startingVersion", since_version + 1)
+            .table(full_name)
+        )
+        if changes.filter("_change_type != 'insert'").limit(1).count():
+            return None
+        return changes.drop("_change_type", "_commit_version", "_commit_timestamp")
+    except Exception:
+        # e.g. the change feed was enabled after since_version
+        return None
+
+def profile_table(table):
+    """Returns (new profile, how it was computed), or None if the stored one is still current"""
+    key = (table.table_catalog, table.table_schema, table.table_name)
+    full_name = ".".join(f"`{k}`" for k in key)
+    version, size_in_bytes, row_count, change_feed = table_metadata(table)
+    stored_version, stored_state = stored_profiles.get(key, (None, None))
+    if version is not None and stored_version == version:
+        return None
+
+    appended = appended_rows(full_name, stored_version) if change_feed and stored_version is not None else None
+    if appended is not None:
+        sketches = merge_profiles([loads(stored_state), profile_string_columns(appended, sample_size=sample_size)])
+        mode = "incremental"
+    else:
+        sketches = profile_string_columns(spark.table(full_name), sample_size=sample_size)
+        mode = "full"
+
+    columns = [
+        (
+            column_name,
+            sketch.nulls,
+            sketch.distinct_estimate,
+            sketch.avg_length,
+            sketch.stddev_length,
+            sketch.length.maximum,
+            sketch.avg_space_count,
+            sketch.stddev_space_count,
+            sketch.sample_values,
+        )
+        for column_name, sketch in sketches.items()
+    ]
+    return (*key, version, row_count, size_in_bytes, datetime.now(timezone.utc), columns, dumps(sketches)), mode
+
+with ThreadPoolExecutor(max_workers=max_workers) as pool:
+    results = [r for r in pool.map(profile_table, tables) if r is not None]
+
+new_profiles = [profile for profile, _ in results]
+modes = [mode for _, mode in results]
+print(
+    f"Profiled {modes.count('full')} tables in full, {modes.count('incremental')} from their appended rows, "
+    f"{len(tables) - len(results)} unchanged since the last run"
+)
 
 # COMMAND ----------
 
-from pyspark.sql.functions import col, expr
+# DBTITLE 1,Persist the profiles
+if new_profiles:
+    new_profiles_df = spark.createDataFrame(new_profiles, profile_schema)
+    if not spark.catalog.tableExists(profiles_table):
+        new_profiles_df.write.saveAsTable(profiles_table)
+    else:
+        new_profiles_df.createOrReplaceTempView("new_text_discovery_profiles")
+        spark.sql(f"""
+            MERGE INTO {profiles_table} t
+            USING new_text_discovery_profiles s
+            ON t.table_catalog = s.table_catalog AND t.table_schema = s.table_schema AND t.table_name = s.table_name
+            WHEN MATCHED THEN UPDATE SET *
+            WHEN NOT MATCHED THEN INSERT *
+        """)
+
+# Only the tables in scope, a previous run may have profiled other tables
+profiles_df = spark.table(profiles_table).join(
+    spark.createDataFrame([(t.table_catalog, t.table_schema, t.table_name) for t in tables], "table_catalog string, table_schema string, table_name string"),
+    ["table_catalog", "table_schema", "table_name"],
+)
 
-unpivoted_df = (
-    dx.from_tables(from_tables)
-    .unpivot_string_columns(sample_size=sample_size)
-    .apply()
-    
+column_profiles = (
+    profiles_df
+    .select("table_catalog", "table_schema", "table_name", explode("columns").alias("column"))
+    .select("table_catalog", "table_schema", "table_name", "column.*")
 )
 
 # COMMAND ----------
 
-display(unpivoted_df)
+display(column_profiles)
 
 # COMMAND ----------
 
@@ -101,21 +241,8 @@ display(unpivoted_df)
 
 # COMMAND ----------
 
-from pyspark.sql.functions import length, col, expr, stddev
-
-free_text_columns = (unpivoted_df
-
-            .withColumn("str_length", length(col("string_value")))
-            .withColumn("space_count", expr("LENGTH(string_value) - LENGTH(REPLACE(string_value, ' ', ''))"))
-            .withColumn("string_value", expr("IF(LENGTH(string_value) > 1000, SUBSTRING(string_value, 1, 1000), string_value)"))
-            .groupBy("table_catalog", "table_schema", "table_name", "column_name")
-            .agg(
-                avg("str_length").alias("avg_str_length"),
-                stddev("str_length").alias("stddev_str_length"),
-                avg("space_count").alias("avg_space_count"),
-                stddev("space_count").alias("stddev_space_count"),
-                collect_set("string_value").alias("sample_values"),
-            )
+# The statistics cover every row of the table, the sample values are truncated to 1000 characters
+free_text_columns = (column_profiles
             .filter( # Find free text columns empirically
                 (col("avg_str_length") > 40) & 
                 (col("avg_space_count") > 5) &
@@ -137,8 +264,10 @@ free_text_columns.display()
 
 # COMMAND ----------
 
+use_case_model = "databricks-meta-llama-3-3-70b-instruct"
+
 expression = """ai_query(
-                  "databricks-meta-llama-3-3-70b-instruct",
+                  "{model}",
                   concat('Provide 2-3 useful, interesting and creative genAI use cases for batch processing a column named ', column_name, ' for a table named ', table_catalog, '.', table_schema, '.', table_name, '. Provide the use cases as a JSON array of objects with the following properties: title, description, type, example_prompt. The example_prompt should be a prompt that can be used process the use case, the row content will be appeneded to the example_prompt. Sample data: ', string(sample_values)),
                   responseFormat => '{
                     "type": "json_schema",
@@ -168,9 +297,11 @@ expression = """ai_query(
                   }'
                 )"""
 
+expression = expression.replace("{model}", use_case_model)
+
 # COMMAND ----------
 
-from pyspark.sql.functions import from_json, explode, col
+from pyspark.sql.functions import from_json, explode, posexplode, col
 from pyspark.sql.types import StructType, StructField, StringType, ArrayType, FloatType
 
 schema = StructType([
@@ -184,29 +315,89 @@ schema = StructType([
     ])), True)
 ])
 
-use_cases = (free_text_columns
-             .withColumn("use_case", expr(expression))
-             .withColumn("use_case", from_json(col("use_case"), schema))
-             .withColumn("use_case", explode(col("use_case.use_cases")))             
+# COMMAND ----------
+
+# MAGIC %md
+# MAGIC ### Use case cache
+# MAGIC The model answer only depends on the model, the prompt (the `ai_query` expression) and the column: its name, its table and the sample values sent with the prompt. The parsed `use_cases` are stored under that key, and the model is only called for the columns without a cache entry.
+
+# COMMAND ----------
+
+import hashlib
+from pyspark.sql.functions import sha2, to_json, array_sort, current_timestamp
+
+prompt_hash = hashlib.sha256(expression.encode("utf-8")).hexdigest()
+
+fingerprinted_columns = (free_text_columns
+    .withColumn("model", lit(use_case_model))
+    .withColumn("prompt_hash", lit(prompt_hash))
+    # Sorted so that the fingerprint does not depend on the sample order
+    .withColumn("column_fingerprint", sha2(concat_ws("\n", "table_catalog", "table_schema", "table_name", "column_name", to_json(array_sort("sample_values"))), 256))
+)
+cache_key = ["model", "prompt_hash", "column_fingerprint"]
+
+if spark.catalog.tableExists(use_cases_cache_table):
+    # NULL entries (failed calls cached by earlier runs) count as misses and are queried again
+    cached = spark.table(use_cases_cache_table).where(col("use_cases").isNotNull())
+    missing_columns = fingerprinted_columns.join(cached, cache_key, "left_anti")
+else:
+    missing_columns = fingerprinted_columns
+
+# Counting the misses does not evaluate the AI query
+llm_calls = missing_columns.count()
+total_columns = fingerprinted_columns.count()
+
+new_use_cases = (missing_columns
+    .withColumn("use_cases", from_json(expr(expression), schema).use_cases)
+    .withColumn("created_at", current_timestamp())
+    .select(*cache_key, "table_catalog", "table_schema", "table_name", "column_name", "use_cases", "created_at")
+    # A failed or unparsable answer is not cached, the next run retries it
+    .where(col("use_cases").isNotNull())
+)
+
+# Writing to the cache runs the AI query once, the rest of the notebook reads the stored results
+if not spark.catalog.tableExists(use_cases_cache_table):
+    new_use_cases.write.saveAsTable(use_cases_cache_table)
+else:
+    new_use_cases.createOrReplaceTempView("new_text_discovery_use_cases")
+    spark.sql(f"""
+        MERGE INTO {use_cases_cache_table} t
+        USING new_text_discovery_use_cases s
+        ON t.model = s.model AND t.prompt_hash = s.prompt_hash AND t.column_fingerprint = s.column_fingerprint
+        WHEN MATCHED AND t.use_cases IS NULL THEN UPDATE SET *
+        WHEN NOT MATCHED THEN INSERT *
+    """)
+
+cached_columns = fingerprinted_columns.join(spark.table(use_cases_cache_table).where(col("use_cases").isNotNull()), cache_key, "left_semi").count()
+print(f"{total_columns} free text columns: {llm_calls} LLM calls, {total_columns - llm_calls} served from the cache, "
+      f"{total_columns - cached_columns} failed (retried on the next run)")
+
+# COMMAND ----------
+
+use_cases = (fingerprinted_columns
+             .join(spark.table(use_cases_cache_table).where(col("use_cases").isNotNull()).select(*cache_key, "use_cases"), cache_key)
+             # use_case_index (position in the cached array) identifies a use case of a column, titles may repeat
+             .select("*", posexplode(col("use_cases")).alias("use_case_index", "use_case"))
+             .drop("use_cases")
 )
-use_cases = spark.createDataFrame(use_cases.toPandas()) # Caching the result in pandas to avoid re-running the AI query
 display(use_cases)
 
 # COMMAND ----------
 
 # MAGIC %md
 # MAGIC ## Count the number of rows per table
+# MAGIC Read from the profiles, which took them from the Delta metadata
 
 # COMMAND ----------
 
-row_count = dx.from_tables(from_tables).with_sql("SELECT COUNT(*) AS row_count FROM {full_table_name}").apply()
-row_count = spark.createDataFrame(row_count.toPandas())
+row_count = profiles_df.select("table_catalog", "table_schema", "table_name", "row_count", "table_version", "size_in_bytes")
 display(row_count)
 
 # COMMAND ----------
 
 # MAGIC %md
-# MAGIC ## Estimate cost and provide SQL examples
+# MAGIC ## Estimate cost and runtime, and provide SQL examples
+# MAGIC Token counts come from the model's tokenizer ([ai_query_planner.py]($./ai_query_planner.py)): a sample of rows of every column is tokenized on the executors by a pandas UDF, and every example prompt on the driver. The runtime projection assumes the endpoint throughput and concurrency below; adjust them to your endpoint (pay-per-token or provisioned throughput).
 
 # COMMAND ----------
 
@@ -214,12 +405,88 @@ display(row_count)
 cost_per_M_input_tokens = 0.5
 cost_per_M_output_tokens = 1.5
 
-result = (use_cases
-            .withColumn("estimated_token_count_per_row", expr("ROUND((LENGTH(use_case.example_prompt) + avg_str_length)/ 4)"))
-            .join(row_count, ["table_catalog", "table_schema", "table_name"])
-            .withColumn("estimated_total_table_token_count", expr("estimated_token_count_per_row * row_count"))
-            .withColumn("estimated_total_table_input_processing_cost", col("estimated_total_table_token_count") * cost_per_M_input_tokens / 1000000)
-            .withColumn("estimated_total_table_output_processing_cost", col("row_count") * col("use_case.expected_average_output_tokens") * cost_per_M_output_tokens / 1000000)
+# Same tokenizer as databricks-meta-llama-3-3-70b-instruct. The repository is gated on Hugging Face (set HF_TOKEN), any copy of the Llama 3 tokenizer gives the same counts
+tokenizer_name = "meta-llama/Llama-3.3-70B-Instruct"
+# Rows tokenized per column
+plan_sample_rows = 1000
+
+# Endpoint throughput: prefill and decoding speed of one request, parallel requests, and optional cap on the total token rate
+input_tokens_per_s = 2000
+output_tokens_per_s = 50
+concurrency = 32
+endpoint_max_tokens_per_s = None
+
+# COMMAND ----------
+
+# DBTITLE 1,Tokenize sampled rows
+from functools import reduce
+from pyspark.sql import DataFrame
+from ai_query_planner import count_tokens, count_tokens_udf, plan_job
+
+column_keys = ["table_catalog", "table_schema", "table_name", "column_name"]
+planned_columns = use_cases.select(*column_keys).distinct().collect()
+
+row_samples = [
+    spark.sql(f"""
+        SELECT CAST(`{c.column_name}` AS STRING) AS text
+        FROM `{c.table_catalog}`.`{c.table_schema}`.`{c.table_name}` TABLESAMPLE ({plan_sample_rows} ROWS)
+    """).select(*[lit(c[k]).alias(k) for k in column_keys], "text")
+    for c in planned_columns
+]
+
+if row_samples:
+    row_tokens = (reduce(DataFrame.unionByName, row_samples)
+        .withColumn("row_tokens", count_tokens_udf(tokenizer_name)("text"))
+        .groupBy(*column_keys)
+        .agg(avg("row_tokens").alias("avg_row_tokens"))
+    )
+else:
+    row_tokens = spark.createDataFrame([], "table_catalog string, table_schema string, table_name string, column_name string, avg_row_tokens double")
+
+display(row_tokens)
+
+# COMMAND ----------
+
+# DBTITLE 1,Plan every use case
+# Left join: a column without sampled tokens (empty table) is planned with the fallback row size
+use_cases_pd = (use_cases
+    .join(row_tokens, column_keys, "left")
+    .join(row_count.select("table_catalog", "table_schema", "table_name", "row_count"), ["table_catalog", "table_schema", "table_name"])
+    .select(*column_keys, "use_case_index", "use_case", "avg_row_tokens", "row_count")
+    .toPandas()
+)
+
+# A handful of prompts: tokenized on the driver in one call
+prompts = use_cases_pd["use_case"].apply(lambda u: u["example_prompt"])
+use_cases_pd["prompt_tokens"] = count_tokens(prompts, tokenizer_name) if len(prompts) else []
+
+plans = [
+    plan_job(
+        rows=int(r.row_count),
+        input_tokens_per_row=r.avg_row_tokens,
+        output_tokens_per_row=r.use_case["expected_average_output_tokens"],
+        prompt_tokens=r.prompt_tokens,
+        cost_per_M_input_tokens=cost_per_M_input_tokens,
+        cost_per_M_output_tokens=cost_per_M_output_tokens,
+        input_tokens_per_s=input_tokens_per_s,
+        output_tokens_per_s=output_tokens_per_s,
+        concurrency=concurrency,
+        endpoint_max_tokens_per_s=endpoint_max_tokens_per_s,
+    )
+    for r in use_cases_pd.itertuples()
+]
+plan_pd = pd.concat([use_cases_pd, pd.DataFrame(plans, index=use_cases_pd.index)], axis=1)
+plan_pd["estimated_total_table_processing_cost"] = plan_pd["input_cost"] + plan_pd["output_cost"]
+plan_pd["estimated_wall_clock_hours"] = plan_pd["wall_clock_s"] / 3600
+
+# COMMAND ----------
+
+# The use_case struct goes back through Spark, joined on the column and the use case position
+plan_df = spark.createDataFrame(plan_pd.drop(columns=["use_case"])).join(
+    use_cases.select(*column_keys, "use_case_index", "use_case"), [*column_keys, "use_case_index"]
+)
+
+result = (plan_df
             .withColumn("example_query", expr("""
               "SELECT ai_query('databricks-meta-llama-3-3-70b-instruct', concat('" ||
               use_case.example_prompt ||
@@ -229,8 +496,17 @@ result = (use_cases
               ") AS ai_output, * FROM " ||
               table_catalog || "." || table_schema || "." || table_name || " LIMIT 100;"
             """))
-            .withColumn("estimated_total_table_processing_cost", col("estimated_total_table_input_processing_cost") + col("estimated_total_table_output_processing_cost"))
-            .select("table_catalog", "table_schema", "table_name", "column_name", "use_case", "estimated_total_table_processing_cost", "example_query")
+            # Full run: one partition per concurrent request keeps every endpoint slot busy
+            .withColumn("batch_query", expr("""
+              replace(replace(example_query, ' LIMIT 100;', ';'), 'SELECT ai_query(', 'SELECT /*+ REPARTITION(' || recommended_partitions || ') */ ai_query(')
+            """))
+            .select(
+                "table_catalog", "table_schema", "table_name", "column_name", "use_case",
+                "prompt_tokens", "avg_row_tokens", "row_tokens_estimated", "total_input_tokens", "total_output_tokens",
+                "estimated_total_table_processing_cost", "estimated_wall_clock_hours",
+                "recommended_partitions", "recommended_batch_rows", "recommended_batches",
+                "example_query", "batch_query",
+            )
 )
 
 display(result)
@@ -0,0 +1,169 @@
+"""
+Embedding cache in front of a LangChain `Embeddings` model such as `DatabricksEmbeddings`.
+
+Identical query texts (and documents) are only sent to the embedding endpoint once:
+
+- Entries are keyed by a SHA-256 of the model namespace (the endpoint name by default), the call type
+  (query or document) and the text, so switching between databricks-gte-large-en and
+  databricks-bge-large-en never mixes vectors, nor do models that embed queries and documents differently.
+- An in-memory LRU tier answers repeated queries within the process; an optional on-disk tier
+  (SQLite, float32 blobs) keeps vectors across restarts. Prefer a local disk path over a volume.
+- All misses of an `embed_documents` call are de-duplicated and sent in a single upstream call.
+- `stats()` reports the hit ratio and the endpoint latency saved by hits.
+
+    embeddings = CachedEmbeddings(DatabricksEmbeddings(endpoint="databricks-gte-large-en"), disk_path="/local_disk0/emb.db")
+"""
+
+import hashlib
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+
+class CachedEmbeddings(Embeddings):
+    """LRU (and optional SQLite) cached wrapper around another `Embeddings` model."""
+
+    def __init__(
+        self,
+        embeddings: Embeddings,
+        namespace: Optional[str] = None,
+        max_entries: int = 10000,
+        disk_path: Optional[str] = None,
+    ):
+        self.embeddings = embeddings
+        self.namespace = namespace or getattr(embeddings, "endpoint", None) or type(embeddings).__name__
+        self.max_entries = max_entries
+        self.disk_path = disk_path
+        self._lock = threading.Lock()
+        self._memory: "OrderedDict[str, List[float]]" = OrderedDict()
+        self._disk = self._open_disk(disk_path)
+        self._stats = {
+            "memory_hits": 0,
+            "disk_hits": 0,
+            "misses": 0,
+            "upstream_calls": 0,
+            "upstream_texts": 0,
+            "upstream_s": 0.0,
+            "query_hits": 0,
+            "document_hits": 0,
+        }
+
+    @staticmethod
+    def _open_disk(disk_path: Optional[str]) -> Optional[sqlite3.Connection]:
+        if not disk_path:
+            return None
+        disk = sqlite3.connect(disk_path, check_same_thread=False)
+        disk.execute("CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB)")
+        disk.commit()
+        return disk
+
+    # Locks and SQLite connections do not pickle (e.g. in a chain logged with MLflow): rebuilt on load,
+    # with an empty memory tier and the disk tier reopened when its path exists there
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state["_lock"], state["_disk"]
+        state["_memory"] = OrderedDict()
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+        try:
+            self._disk = self._open_disk(self.disk_path)
+        except sqlite3.OperationalError:
+            self._disk = None
+
+    def _key(self, text: str, is_query: bool) -> str:
+        kind = "query" if is_query else "document"
+        return hashlib.sha256(f"{self.namespace}\0{kind}\0{text}".encode("utf-8")).hexdigest()
+
+    def _remember(self, key: str, vector: List[float]):
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def _lookup(self, keys: List[str]) -> Dict[str, List[float]]:
+        found = {}
+        with self._lock:
+            for key in keys:
+                if key in self._memory:
+                    self._memory.move_to_end(key)
+                    found[key] = self._memory[key]
+                    self._stats["memory_hits"] += 1
+            missing = [k for k in keys if k not in found]
+            if self._disk is not None and missing:
+                placeholders = ",".join("?" * len(missing))
+                rows = self._disk.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", missing
+                ).fetchall()
+                for key, blob in rows:
+                    vector = np.frombuffer(blob, dtype=np.float32).tolist()
+                    found[key] = vector
+                    self._remember(key, vector)
+                    self._stats["disk_hits"] += 1
+        return found
+
+    def _store(self, vectors: Dict[str, List[float]]):
+        with self._lock:
+            for key, vector in vectors.items():
+                self._remember(key, vector)
+            if self._disk is not None:
+                self._disk.executemany(
+                    "INSERT OR REPLACE INTO embeddings (key, vector) VALUES (?, ?)",
+                    [(k, np.asarray(v, dtype=np.float32).tobytes()) for k, v in vectors.items()],
+                )
+                self._disk.commit()
+
+    def _embed(self, texts: List[str], is_query: bool) -> List[List[float]]:
+        keys = [self._key(t, is_query) for t in texts]
+        unique_keys = list(dict.fromkeys(keys))
+        found = self._lookup(unique_keys)
+
+        # Every distinct miss goes to the endpoint in one call
+        misses = {k: t for k, t in zip(keys, texts) if k not in found}
+        if misses:
+            start = time.perf_counter()
+            if is_query and len(misses) == 1:
+                vectors = [self.embeddings.embed_query(next(iter(misses.values())))]
+            else:
+                vectors = self.embeddings.embed_documents(list(misses.values()))
+            elapsed = time.perf_counter() - start
+            computed = dict(zip(misses.keys(), vectors))
+            self._store(computed)
+            found.update(computed)
+
+        with self._lock:
+            hits = len(unique_keys) - len(misses)
+            self._stats["query_hits" if is_query else "document_hits"] += hits
+            self._stats["misses"] += len(misses)
+            if misses:
+                self._stats["upstream_calls"] += 1
+                self._stats["upstream_texts"] += len(misses)
+                self._stats["upstream_s"] += elapsed
+        return [found[k] for k in keys]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._embed([text], is_query=True)[0]
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self._embed(list(texts), is_query=False)
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit ratio and the upstream latency saved by cache hits (estimated from the observed misses)."""
+        with self._lock:
+            s = dict(self._stats)
+        hits = s["memory_hits"] + s["disk_hits"]
+        lookups = hits + s["misses"]
+        # A query hit saves a whole endpoint call, a document hit its share of a batched call
+        per_call = s["upstream_s"] / s["upstream_calls"] if s["upstream_calls"] else 0.0
+        per_text = s["upstream_s"] / s["upstream_texts"] if s["upstream_texts"] else 0.0
+        s["hit_ratio"] = hits / lookups if lookups else 0.0
+        s["saved_latency_s"] = s["query_hits"] * per_call + s["document_hits"] * per_text
+        s["entries_in_memory"] = len(self._memory)
+        return s
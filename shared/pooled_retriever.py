@@ -0,0 +1,222 @@
+"""
+Long-lived Vector Search retriever for the RAG chains.
+
+`VectorSearchClient(...).get_index(...)` per question costs a client, an index lookup and a new HTTP
+connection (TLS handshake included) before the query itself. `PooledVectorSearch` does the setup once:
+
+- the index is described once (primary key, whether it embeds the query itself or expects a vector);
+- queries go to the index REST API through one `requests.Session`, so connections are kept alive and
+  pooled across questions and threads (retried on 429/503);
+- `query_many` embeds (as queries, like `query`) and searches the questions concurrently;
+  `aquery` / `aquery_many` are the asyncio versions;
+- `get_vector_search` caches the instances, so a `get_retriever()` called in every chain reuses them;
+- a retriever `filter_fn` turns every question into index filters (falling back to the unfiltered
+  search when they match nothing).
+
+    store = get_vector_search("nasa_circulars", "demo_frank.circulars.circular_index", host, token)
+    retriever = store.as_retriever(k=8)
+    retriever.invoke(question); retriever.batch(questions); await retriever.ainvoke(question)
+"""
+
+import asyncio
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from typing import Any, Callable, Dict, List, Optional, Sequence, Union
+
+import requests
+from langchain_core.callbacks import AsyncCallbackManagerForRetrieverRun, CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.retrievers import BaseRetriever
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+
+class PooledVectorSearch:
+    """One index: described once, queried through a pooled HTTP session."""
+
+    def __init__(
+        self,
+        endpoint_name: str,
+        index_name: str,
+        host: Optional[str] = None,
+        token: Optional[str] = None,
+        text_column: str = "chunked_text",
+        columns: Optional[Sequence[str]] = None,
+        embedding: Optional[Embeddings] = None,
+        pool_size: int = 16,
+        timeout_s: float = 30.0,
+    ):
+        self.endpoint_name = endpoint_name
+        self.index_name = index_name
+        self.host = (host or os.environ["DATABRICKS_HOST"]).rstrip("/")
+        self.token = token or os.environ["DATABRICKS_TOKEN"]
+        self.text_column = text_column
+        self.embedding = embedding
+        self.pool_size = pool_size
+        self.timeout_s = timeout_s
+        self._lock = threading.Lock()
+        self._stats = {"queries": 0, "query_s": 0.0, "setup_s": 0.0}
+
+        start = time.perf_counter()
+        self._session = self._new_session()
+        spec = self.describe()
+        self.primary_key = spec["primary_key"]
+        index_spec = spec.get("delta_sync_index_spec") or spec.get("direct_access_index_spec") or {}
+        # Without embedding source columns, the index only takes query vectors
+        self.needs_vector = not index_spec.get("embedding_source_columns")
+        if self.needs_vector and embedding is None:
+            raise ValueError(f"{index_name} has self-managed embeddings: pass the `embedding` model used for the chunks")
+        self.columns = list(dict.fromkeys([self.primary_key, text_column, *(columns or [])]))
+        self._stats["setup_s"] = time.perf_counter() - start
+
+    def _new_session(self) -> requests.Session:
+        session = requests.Session()
+        session.headers.update({"Authorization": f"Bearer {self.token}", "Content-Type": "application/json"})
+        retry = Retry(total=3, backoff_factor=0.5, status_forcelist=(429, 503), allowed_methods=None)
+        session.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size, max_retries=retry))
+        session.mount("http://", HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size, max_retries=retry))
+        return session
+
+    # Sessions and locks do not pickle, and the token must not end up in a logged model:
+    # rebuilt when a logged chain is loaded, with the DATABRICKS_TOKEN of the serving environment
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state["_session"], state["_lock"], state["token"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.token = os.environ.get("DATABRICKS_TOKEN", "")
+        self._lock = threading.Lock()
+        self._session = self._new_session()
+
+    def _request(self, method: str, path: str, body: Optional[dict] = None) -> dict:
+        response = self._session.request(method, f"{self.host}/api/2.0/vector-search/indexes/{self.index_name}{path}",
+                                         data=json.dumps(body) if body is not None else None, timeout=self.timeout_s)
+        response.raise_for_status()
+        return response.json()
+
+    def describe(self) -> dict:
+        return self._request("GET", "")
+
+    def _search(self, query: str, vector: Optional[List[float]], k: int, filters: Optional[dict]) -> List[Document]:
+        body: Dict[str, Any] = {"num_results": k, "columns": self.columns}
+        if vector is not None:
+            body["query_vector"] = vector
+        else:
+            body["query_text"] = query
+        if filters:
+            body["filters_json"] = json.dumps(filters)
+
+        start = time.perf_counter()
+        result = self._request("POST", "/query", body)
+        elapsed = time.perf_counter() - start
+        with self._lock:
+            self._stats["queries"] += 1
+            self._stats["query_s"] += elapsed
+
+        # Every row is the requested columns followed by the score
+        names = [c["name"] for c in result["manifest"]["columns"]]
+        documents = []
+        for row in result.get("result", {}).get("data_array") or []:
+            values = dict(zip(names, row))
+            text = values.pop(self.text_column)
+            documents.append(Document(page_content=text, metadata=values))
+        return documents
+
+    def query(self, query: str, k: int = 8, filters: Optional[dict] = None) -> List[Document]:
+        vector = self.embedding.embed_query(query) if self.needs_vector else None
+        return self._search(query, vector, k, filters)
+
+    def query_many(self, queries: Sequence[str], k: int = 8, filters: Union[None, dict, Sequence[Optional[dict]]] = None,
+                   max_concurrency: Optional[int] = None) -> List[List[Document]]:
+        """
+        The questions embedded and searched concurrently over the pooled connections; every question is
+        embedded with `embed_query`, so `batch([q])` returns the same documents as `invoke(q)`.
+        `filters` is one dict for all the questions, or one per question.
+        """
+        queries = list(queries)
+        per_query = list(filters) if isinstance(filters, (list, tuple)) else [filters] * len(queries)
+        with ThreadPoolExecutor(max_workers=max_concurrency or self.pool_size) as pool:
+            return list(pool.map(lambda qf: self.query(qf[0], k, qf[1]), zip(queries, per_query)))
+
+    async def aquery(self, query: str, k: int = 8, filters: Optional[dict] = None) -> List[Document]:
+        return await asyncio.to_thread(self.query, query, k, filters)
+
+    async def aquery_many(self, queries: Sequence[str], k: int = 8,
+                          filters: Union[None, dict, Sequence[Optional[dict]]] = None) -> List[List[Document]]:
+        return await asyncio.to_thread(self.query_many, queries, k, filters)
+
+    def as_retriever(self, k: int = 8, filters: Optional[dict] = None,
+                     filter_fn: Optional[Callable[[str], dict]] = None) -> "PooledRetriever":
+        return PooledRetriever(store=self, k=k, filters=filters, filter_fn=filter_fn)
+
+    def stats(self) -> Dict[str, Any]:
+        """Number of queries, their mean latency and the one-time setup cost."""
+        with self._lock:
+            s = dict(self._stats)
+        s["mean_query_s"] = s["query_s"] / s["queries"] if s["queries"] else 0.0
+        return s
+
+
+class PooledRetriever(BaseRetriever):
+    """
+    LangChain retriever on a shared `PooledVectorSearch`; `batch` searches the questions together.
+    `filter_fn(question)` adds question-specific filters to `filters`; a question whose filters match
+    nothing is searched again without them.
+    """
+
+    store: Any
+    k: int = 8
+    filters: Optional[dict] = None
+    filter_fn: Optional[Callable[[str], dict]] = None
+
+    def filters_for(self, query: str) -> Optional[dict]:
+        if self.filter_fn is None:
+            return self.filters
+        return {**(self.filters or {}), **self.filter_fn(query)} or None
+
+    def _search(self, query: str) -> List[Document]:
+        filters = self.filters_for(query)
+        documents = self.store.query(query, k=self.k, filters=filters)
+        if not documents and filters != self.filters:
+            documents = self.store.query(query, k=self.k, filters=self.filters)
+        return documents
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun) -> List[Document]:
+        return self._search(query)
+
+    async def _aget_relevant_documents(self, query: str, *, run_manager: AsyncCallbackManagerForRetrieverRun) -> List[Document]:
+        return await asyncio.to_thread(self._search, query)
+
+    def batch(self, inputs: List[str], config=None, *, return_exceptions: bool = False, **kwargs) -> List[List[Document]]:
+        if return_exceptions or not inputs:
+            return super().batch(inputs, config, return_exceptions=return_exceptions, **kwargs)
+        max_concurrency = (config or {}).get("max_concurrency") if isinstance(config, dict) else None
+        filters = [self.filters_for(query) for query in inputs]
+        results = self.store.query_many(inputs, k=self.k, filters=filters, max_concurrency=max_concurrency)
+        # Questions whose own filters matched nothing, without them
+        retry = [i for i, docs in enumerate(results) if not docs and filters[i] != self.filters]
+        if retry:
+            retried = self.store.query_many([inputs[i] for i in retry], k=self.k, filters=self.filters, max_concurrency=max_concurrency)
+            for i, docs in zip(retry, retried):
+                results[i] = docs
+        return results
+
+    async def abatch(self, inputs: List[str], config=None, *, return_exceptions: bool = False, **kwargs) -> List[List[Document]]:
+        if return_exceptions or not inputs:
+            return await super().abatch(inputs, config, return_exceptions=return_exceptions, **kwargs)
+        return await asyncio.to_thread(self.batch, inputs, config)
+
+
+@lru_cache(maxsize=8)
+def get_vector_search(endpoint_name: str, index_name: str, host: Optional[str] = None, token: Optional[str] = None,
+                      text_column: str = "chunked_text", columns: Optional[tuple] = None,
+                      embedding: Optional[Embeddings] = None) -> PooledVectorSearch:
+    """Shared `PooledVectorSearch` per index (and credentials): the setup runs once per process."""
+    return PooledVectorSearch(endpoint_name, index_name, host, token, text_column, columns, embedding)